@@ -52,6 +52,7 @@ from .exploration_techniques import ExplorationTechnique
 from . import type_backend
 from . import sim_type as types
 from .state_hierarchy import StateHierarchy
+from .state_snapshot import StateSnapshot
 
 from .sim_state import SimState
 from .engines import SimEngineVEX, SimEngine
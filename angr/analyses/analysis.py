@@ -1,12 +1,16 @@
 import sys
+import time
 import contextlib
+import multiprocessing
 from collections import defaultdict
+import networkx
 import progressbar
 import logging
 
 from ..misc.plugins import PluginVendor, VendorPreset
 from ..misc.ux import deprecated
 from ..errors import AngrAnalysisError
+from ..utils.parallel import run_condensed_in_pool
 
 l = logging.getLogger(name=__name__)
 
@@ -66,6 +70,82 @@ class AnalysesHub(PluginVendor):
     def _init_plugin(self, plugin_cls):
         return AnalysisFactory(self.project, plugin_cls)
 
+    def run_on_functions(self, analysis, functions=None, processes=None, callgraph_order=False, kb=None,
+                         fail_fast=False, collect=None, **kwargs):
+        """
+        Run a per-function analysis, e.g. VariableRecoveryFast, CallingConvention or CodeTagging, on many functions.
+        The function is passed to the analysis as its first argument.
+
+        With multiple processes, functions are analyzed in forked worker processes, each working on its own copy of
+        the project and the knowledge base as they were when this method was called. Function attributes (calling
+        convention, prototype, tags, stack layout information, ...) and the variables the analysis recorded in
+        `kb.variables` for the function are merged back into `kb` as soon as each function is done. Other changes the
+        analysis makes to the knowledge base are lost.
+
+        :param analysis:            The name the analysis is registered under, or the analysis class.
+        :param functions:           Functions or function addresses to analyze. Defaults to all functions in `kb`.
+        :param int processes:       Number of worker processes. Requires the fork start method.
+        :param bool callgraph_order: Analyze functions only after all functions they call are done, and give each job
+                                    the function attributes of its callees.
+        :param kb:                  The knowledge base to work on. Defaults to the knowledge base of the project.
+        :param bool fail_fast:      Raise exceptions instead of recording them, as with _resilience().
+        :param collect:             A callable that takes a finished analysis and returns the result to keep for the
+                                    function. It must return something picklable if processes are used.
+        :param kwargs:              Any other keyword arguments are passed to the analysis.
+        :return:                    Results, timings and errors of each function.
+        :rtype:                     FunctionAnalysesResult
+        """
+
+        if kb is None:
+            kb = self.project.kb
+        if isinstance(analysis, str):
+            factory = self.get_plugin(analysis)
+        else:
+            factory = AnalysisFactory(self.project, analysis)
+        if functions is None:
+            functions = list(kb.functions.values())
+        func_addrs = [ f if isinstance(f, int) else f.addr for f in functions ]
+
+        # jobs are strongly connected components of the dependency graph, and depend on the components they call into
+        deps = networkx.DiGraph()
+        deps.add_nodes_from(func_addrs)
+        if callgraph_order:
+            deps.add_edges_from(kb.functions.callgraph.subgraph(func_addrs).edges())
+
+        result = FunctionAnalysesResult()
+
+        if processes is not None and processes > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+            l.warning('Running analyses on functions in parallel requires the fork start method. Running serially.')
+            processes = None
+
+        if processes is None or processes <= 1:
+            components = networkx.condensation(deps)
+            members = networkx.get_node_attributes(components, 'members')
+            for c in reversed(list(networkx.topological_sort(components))):
+                for func_addr in sorted(members[c]):
+                    result._add(*_analyze_function(factory, kb, func_addr, collect, fail_fast, kwargs))
+            return result
+
+        def _job(addrs):
+            callee_attrs = { }
+            for addr in addrs:
+                for callee in deps.successors(addr):
+                    if callee not in addrs:
+                        callee_attrs[callee] = _function_attributes(kb.functions.get_by_addr(callee))
+            return sorted(addrs), callee_attrs
+
+        def _merge(addrs, func_results):  # pylint:disable=unused-argument
+            for func_addr, res, elapsed, errors, attrs, var_manager in func_results:
+                _set_function_attributes(kb.functions.get_by_addr(func_addr), attrs)
+                if var_manager is not None:
+                    var_manager.manager = kb.variables
+                    kb.variables.function_managers[func_addr] = var_manager
+                result._add(func_addr, res, elapsed, errors)
+
+        run_condensed_in_pool(deps, processes, _analyze_functions_in_worker, _job, _merge,
+                              context=(factory, kb, collect, fail_fast, kwargs))
+        return result
+
     def __getstate__(self):
         s = super(AnalysesHub, self).__getstate__()
         return (s, self.project)
@@ -75,6 +155,112 @@ class AnalysesHub(PluginVendor):
         super(AnalysesHub, self).__setstate__(s)
 
 
+class FunctionAnalysesResult(object):
+    """
+    The outcome of :meth:`AnalysesHub.run_on_functions()`.
+
+    :ivar dict results: Function address -> the value returned by the collect callback, or None.
+    :ivar dict timings: Function address -> time the analysis took, in seconds.
+    :ivar dict errors:  Function address -> list of AnalysisLogEntry objects, for all exceptions the analysis caught
+                        with resilience, or that were raised by the analysis and caught by the runner.
+    """
+    def __init__(self):
+        self.results = { }
+        self.timings = { }
+        self.errors = { }
+
+    def _add(self, func_addr, result, elapsed, errors):
+        self.results[func_addr] = result
+        self.timings[func_addr] = elapsed
+        if errors:
+            self.errors[func_addr] = errors
+
+    @property
+    def failed(self):
+        """
+        Addresses of all functions with errors.
+        """
+        return sorted(self.errors)
+
+    def __repr__(self):
+        return '<FunctionAnalysesResult: %d functions, %d with errors>' % (len(self.results), len(self.errors))
+
+
+# function attributes that per-function analyses set, and that are merged back from worker processes
+_FUNCTION_ATTRIBUTES = ('calling_convention', 'prototype', 'tags', 'sp_delta', 'bp_on_stack', 'retaddr_on_stack',
+                        'prepared_registers', 'prepared_stack_variables', 'registers_read_afterwards', 'info')
+
+
+def _function_attributes(func):
+    if func is None:
+        return None
+    return dict((attr, getattr(func, attr)) for attr in _FUNCTION_ATTRIBUTES)
+
+
+def _set_function_attributes(func, attrs):
+    if func is None or attrs is None:
+        return
+    for attr, value in attrs.items():
+        setattr(func, attr, value)
+
+
+def _analyze_function(factory, kb, func_addr, collect, fail_fast, kwargs):
+    """
+    Run an analysis on a single function, recording errors with _resilience() semantics.
+
+    :return: The function address, the collected result, the time it took and a list of errors.
+    """
+    errors = [ ]
+    res = None
+    start = time.time()
+    try:
+        analysis = factory(kb.functions.get_by_addr(func_addr), kb=kb, fail_fast=fail_fast, **kwargs)
+        errors.extend(analysis.errors)
+        for named in analysis.named_errors.values():
+            errors.extend(named)
+        if collect is not None:
+            res = collect(analysis)
+    except Exception:  # pylint:disable=broad-except
+        if fail_fast:
+            raise
+        error = AnalysisLogEntry("exception occurred", exc_info=True)
+        l.error("Caught and logged %s with resilience: %s", error.exc_type.__name__, error.exc_value)
+        errors.append(error)
+    return func_addr, res, time.time() - start, errors
+
+
+def _analyze_functions_in_worker(context, job):
+    """
+    Analyze the functions of one job in a worker process of run_on_functions().
+
+    :param tuple context:   The analysis factory, the knowledge base and the options.
+    :param tuple job:       The addresses of the functions to analyze in order, and the attributes of the functions
+                            they call.
+    :return:                A list of (function address, result, time, errors, function attributes, variable manager)
+                            tuples.
+    """
+    func_addrs, callee_attrs = job
+    factory, kb, collect, fail_fast, kwargs = context
+
+    for addr, attrs in callee_attrs.items():
+        _set_function_attributes(kb.functions.get_by_addr(addr), attrs)
+
+    out = [ ]
+    for func_addr in func_addrs:
+        _, res, elapsed, errors = _analyze_function(factory, kb, func_addr, collect, fail_fast, kwargs)
+        var_manager = None
+        if 'variables' in kb:
+            var_manager = kb.variables.function_managers.get(func_addr, None)
+        out.append((func_addr, res, elapsed, errors,
+                    _function_attributes(kb.functions.get_by_addr(func_addr)), var_manager))
+
+    # do not send the whole knowledge base back. the main process attaches the variable managers to its own one
+    for r in out:
+        if r[-1] is not None:
+            r[-1].manager = None
+    return out
+
+
 class AnalysisFactory(object):
     def __init__(self, project, analysis_cls):
         self._project = project
@@ -1,8 +1,14 @@
+import heapq
 import logging
+import multiprocessing
+
+import networkx
 
 from ..calling_conventions import SimRegArg, SimStackArg, SimCC
 from ..sim_variable import SimStackVariable, SimRegisterVariable
+from ..utils.parallel import run_condensed_in_pool
 from . import Analysis, register_analysis
+from .forward_analysis import CallGraphVisitor
 
 l = logging.getLogger(name=__name__)
 
@@ -156,23 +162,123 @@ class CallingConventionAnalysis(Analysis):
             return True
 
     @staticmethod
-    def recover_calling_conventions(project, kb=None):
+    def recover_calling_conventions(project, kb=None, processes=None):
         """
-
-        :return:
+        Recover the calling convention of every function in the knowledge base that does not have one yet.
+
+        Functions are visited with a worklist ordered by the call graph, callees before callers. Whenever the calling
+        convention of a function is determined, its callers that still lack one are queued again, so each function is
+        only re-analyzed when one of its callees changed.
+
+        :param project:         The project.
+        :param kb:              The knowledge base to work on. Defaults to the knowledge base of the project.
+        :param int processes:   Number of worker processes. If larger than 1, independent strongly connected components
+                                of the call graph are analyzed in parallel, once all the components they call into are
+                                done. Requires the fork start method.
+        :return:                None
         """
         if kb is None:
             kb = project.kb
 
-        new_cc_found = True
-        while new_cc_found:
-            new_cc_found = False
-            for func in kb.functions.values():
-                if func.calling_convention is None:
-                    # determine the calling convention of each function
-                    cc_analysis = project.analyses.CallingConvention(func)
-                    if cc_analysis.cc is not None:
-                        func.calling_convention = cc_analysis.cc
-                        new_cc_found = True
+        if processes is not None and processes > 1:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                CallingConventionAnalysis._recover_calling_conventions_parallel(project, kb, processes)
+                return
+            l.warning('Parallel calling convention recovery requires the fork start method. Running serially.')
+
+        CallingConventionAnalysis._recover_calling_conventions_worklist(project, kb, kb.functions.callgraph)
+
+    @staticmethod
+    def _recover_calling_conventions_worklist(project, kb, callgraph):
+        """
+        Run the worklist over all functions in `callgraph` that do not have a calling convention yet.
+
+        :param project:                     The project.
+        :param kb:                          The knowledge base to work on.
+        :param networkx.DiGraph callgraph:  The call graph, or the part of it to work on.
+        :return:                            A dict mapping function addresses to newly recovered calling conventions,
+                                            which are also set on the functions.
+        :rtype:                             dict
+        """
+
+        visitor = CallGraphVisitor(callgraph)
+        # callees first
+        order = { addr: i for i, addr in enumerate(reversed(visitor.sort_nodes())) }
+
+        def _needs_cc(addr):
+            func = kb.functions.get_by_addr(addr)
+            return func is not None and func.calling_convention is None
+
+        worklist = [ (idx, addr) for addr, idx in order.items() if _needs_cc(addr) ]
+        heapq.heapify(worklist)
+        queued = set(addr for _, addr in worklist)
+
+        ccs = { }
+        while worklist:
+            _, func_addr = heapq.heappop(worklist)
+            queued.discard(func_addr)
+
+            func = kb.functions.get_by_addr(func_addr)
+            cc_analysis = project.analyses.CallingConvention(func, kb=kb)
+            if cc_analysis.cc is None:
+                continue
+
+            func.calling_convention = cc_analysis.cc
+            ccs[func_addr] = cc_analysis.cc
+
+            for caller_addr in visitor.predecessors(func_addr):
+                if caller_addr not in queued and caller_addr in order and _needs_cc(caller_addr):
+                    heapq.heappush(worklist, (order[caller_addr], caller_addr))
+                    queued.add(caller_addr)
+
+        return ccs
+
+    @staticmethod
+    def _recover_calling_conventions_parallel(project, kb, processes):
+        """
+        Distribute the strongly connected components of the call graph over a pool of forked worker processes. A
+        component is submitted as soon as all components it calls into are done, together with the calling conventions
+        of the functions it calls.
+        """
+
+        callgraph = networkx.DiGraph(kb.functions.callgraph)
+
+        def _job(addrs):
+            known_ccs = { }
+            for addr in addrs:
+                for callee in callgraph.successors(addr):
+                    if callee in addrs:
+                        continue
+                    func = kb.functions.get_by_addr(callee)
+                    if func is not None and func.calling_convention is not None:
+                        known_ccs[callee] = func.calling_convention
+            return addrs, known_ccs
+
+        def _merge(addrs, ccs):  # pylint:disable=unused-argument
+            for func_addr, cc in ccs.items():
+                kb.functions[func_addr].calling_convention = cc
+
+        run_condensed_in_pool(callgraph, processes, _recover_component_calling_conventions, _job, _merge,
+                              context=(project, kb))
+
+
+def _recover_component_calling_conventions(context, job):
+    """
+    Recover calling conventions of one strongly connected component of the call graph in a worker process.
+
+    :param tuple context:   The project and the knowledge base.
+    :param tuple job:       The addresses of the functions of the component, and the known calling conventions of the
+                            functions it calls.
+    :return:                A dict mapping function addresses to newly recovered calling conventions.
+    """
+    func_addrs, known_ccs = job
+    project, kb = context
+
+    for func_addr, cc in known_ccs.items():
+        kb.functions[func_addr].calling_convention = cc
+
+    subgraph = networkx.DiGraph(kb.functions.callgraph.subgraph(func_addrs))
+    return CallingConventionAnalysis._recover_calling_conventions_worklist(project, kb, subgraph)
+
 
 register_analysis(CallingConventionAnalysis, "CallingConvention")
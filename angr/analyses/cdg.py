@@ -2,7 +2,7 @@ import logging
 
 import networkx
 
-from ..utils.graph import compute_dominance_frontier, PostDominators, TemporaryNode
+from ..utils.graph import compute_dominance_frontier, Dominators, TemporaryNode
 from . import Analysis
 
 _l = logging.getLogger(name=__name__)
@@ -145,16 +145,57 @@ class CDG(Analysis):
 
     def _pd_construct(self):
 
-        pdoms = PostDominators(self._acyclic_cfg, self._entry, successors_func=self._pd_graph_successors)
+        reversed_cfg, start_node = self._pd_prepare_graph(self._acyclic_cfg)
 
-        self._post_dom = pdoms.post_dom
+        # dominators of the reversed CFG are the post-dominators of the CFG
+        self._post_dom = Dominators(reversed_cfg, start_node).dom_tree
 
         self._pd_post_process(self._acyclic_cfg)
 
-        # Create the normalized_cfg without the annoying ContainerNodes
-        self._normalized_cfg = networkx.DiGraph()
-        for src, dst in pdoms.prepared_graph.edges():
-            self._normalized_cfg.add_edge(src.obj, dst.obj)
+        self._normalized_cfg = reversed_cfg
+
+    def _pd_prepare_graph(self, cfg):
+        """
+        Build the reversed CFG that post-dominators are computed on. A virtual start node jumps to all exits, and the
+        entry jumps to a virtual end node. Nodes that cannot reach any exit (e.g. the ones in an infinite loop) are
+        made reachable from the virtual start node as well.
+
+        :param cfg: The CFG.
+        :return:    The reversed graph and the virtual start node.
+        :rtype:     tuple
+        """
+
+        graph = networkx.DiGraph()
+        start_node = TemporaryNode("start_node")
+
+        graph.add_edge(self._entry, TemporaryNode("end_node"))
+
+        traversed = [ ]
+        traversed_set = set()
+        queue = [ self._entry ]
+        while queue:
+            node = queue.pop()
+            if node in traversed_set:
+                continue
+            traversed.append(node)
+            traversed_set.add(node)
+
+            successors = list(self._pd_graph_successors(cfg, node))
+            if not successors:
+                graph.add_edge(start_node, node)
+            for s in successors:
+                graph.add_edge(s, node)  # reversed
+                if s not in traversed_set:
+                    queue.append(s)
+
+        reachable = { start_node } | networkx.descendants(graph, start_node)
+        for node in traversed:
+            if node not in reachable:
+                _l.debug("%s cannot reach any exit.", node)
+                graph.add_edge(start_node, node)
+                reachable |= { node } | networkx.descendants(graph, node)
+
+        return graph, start_node
 
     @staticmethod
     def _pd_graph_successors(graph, node):
@@ -1,18 +1,23 @@
 import itertools
 import logging
-import math
 import re
 import string
 from collections import defaultdict
 
 from sortedcontainers import SortedDict
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import claripy
 import cle
 import pyvex
 from cle.address_translator import AT
 
 from .memory_data import MemoryData
+from .memory_scanner import MemoryScanner, calc_entropy
 from .cfg_arch_options import CFGArchOptions
 from .cfg_base import CFGBase
 from .cfg_node import CFGNode
@@ -74,12 +79,18 @@ class SegmentList:
     """
     SegmentList describes a series of segmented memory blocks. You may query whether an address belongs to any of the
     blocks or not, and obtain the exact block(segment) that the address belongs to.
+
+    Segments never overlap. They are kept in a sorted dict keyed by their start addresses, together with an index of
+    segments for each sort and the spans of contiguous occupied memory, so that occupying a block and all queries take
+    O(log n) time.
     """
 
-    __slots__ = ['_list', '_bytes_occupied']
+    __slots__ = ['_segments', '_segments_by_sort', '_spans', '_bytes_occupied']
 
     def __init__(self):
-        self._list = []
+        self._segments = SortedDict()  # start address to Segment
+        self._segments_by_sort = { }  # sort to a SortedDict of start address to Segment
+        self._spans = SortedDict()  # start address to end address of each range of contiguous occupied memory
         self._bytes_occupied = 0
 
     #
@@ -87,12 +98,20 @@ class SegmentList:
     #
 
     def __len__(self):
-        return len(self._list)
+        return len(self._segments)
 
     #
     # Private methods
     #
 
+    @property
+    def _list(self):
+        """
+        All segments, sorted by their start addresses.
+        """
+
+        return self._segments.values()
+
     def _search(self, addr):
         """
         Checks which segment that the address `addr` should belong to, and, returns the offset of that segment.
@@ -102,179 +121,68 @@ class SegmentList:
         :return: The offset of the segment.
         """
 
-        start = 0
-        end = len(self._list)
-
-        while start != end:
-            mid = (start + end) // 2
-
-            segment = self._list[mid]
-            if addr < segment.start:
-                end = mid
-            elif addr >= segment.end:
-                start = mid + 1
-            else:
-                # Overlapped :(
-                start = mid
-                break
-
-        return start
+        idx = self._segments.bisect_right(addr) - 1
+        if idx >= 0 and addr < self._segments.peekitem(idx)[1].end:
+            return idx
+        return idx + 1
 
-    def _insert_and_merge(self, address, size, sort, idx):
+    def _segment_at(self, addr):
         """
-        Determines whether the block specified by (address, size) should be merged with adjacent blocks.
+        Get the segment that an address belongs to.
 
-        :param int address: Starting address of the block to be merged.
-        :param int size: Size of the block to be merged.
-        :param str sort: Type of the block.
-        :param int idx: ID of the address.
-        :return: None
+        :param int addr:    The address.
+        :return:            The segment, or None if the address is not occupied.
+        :rtype:             Segment or None
         """
 
-        # sanity check
-        if idx > 0 and address + size <= self._list[idx - 1].start:
-            # There is a bug, since _list[idx] must be the closest one that is less than the current segment
-            l.warning("BUG FOUND: new segment should always be greater than _list[idx].")
-            # Anyways, let's fix it.
-            self._insert_and_merge(address, size, sort, idx - 1)
-            return
-
-        # Insert the block first
-        # The new block might be overlapping with other blocks. _insert_and_merge_core will fix the overlapping.
-        if idx == len(self._list):
-            self._list.append(Segment(address, address + size, sort))
-        else:
-            self._list.insert(idx, Segment(address, address + size, sort))
-        # Apparently _bytes_occupied will be wrong if the new block overlaps with any existing block. We will fix it
-        # later
-        self._bytes_occupied += size
-
-        # Search forward to merge blocks if necessary
-        pos = idx
-        while pos < len(self._list):
-            merged, pos, bytes_change = self._insert_and_merge_core(pos, "forward")
-
-            if not merged:
-                break
-
-            self._bytes_occupied += bytes_change
-
-        # Search backward to merge blocks if necessary
-        if pos >= len(self._list):
-            pos = len(self._list) - 1
-
-        while pos > 0:
-            merged, pos, bytes_change = self._insert_and_merge_core(pos, "backward")
+        idx = self._segments.bisect_right(addr) - 1
+        if idx >= 0:
+            segment = self._segments.peekitem(idx)[1]
+            if addr < segment.end:
+                return segment
+        return None
 
-            if not merged:
-                break
+    def _add_segment(self, segment):
+        self._segments[segment.start] = segment
+        if segment.sort not in self._segments_by_sort:
+            self._segments_by_sort[segment.sort] = SortedDict()
+        self._segments_by_sort[segment.sort][segment.start] = segment
 
-            self._bytes_occupied += bytes_change
+    def _remove_segment(self, segment):
+        del self._segments[segment.start]
+        del self._segments_by_sort[segment.sort][segment.start]
 
-    def _insert_and_merge_core(self, pos, direction):
+    def _occupy_span(self, start, end):
         """
-        The core part of method _insert_and_merge.
-
-        :param int pos:         The starting position.
-        :param str direction:   If we are traversing forwards or backwards in the list. It determines where the "sort"
-                                of the overlapping memory block comes from. If everything works as expected, "sort" of
-                                the overlapping block is always equal to the segment occupied most recently.
-        :return: A tuple of (merged (bool), new position to begin searching (int), change in total bytes (int)
-        :rtype: tuple
+        Mark a range of memory as occupied in the spans, and update the number of occupied bytes.
         """
 
-        bytes_changed = 0
-
-        if direction == "forward":
-            if pos == len(self._list) - 1:
-                return False, pos, 0
-            previous_segment = self._list[pos]
-            previous_segment_pos = pos
-            segment = self._list[pos + 1]
-            segment_pos = pos + 1
-        else:  # if direction == "backward":
-            if pos == 0:
-                return False, pos, 0
-            segment = self._list[pos]
-            segment_pos = pos
-            previous_segment = self._list[pos - 1]
-            previous_segment_pos = pos - 1
-
-        merged = False
-        new_pos = pos
-
-        if segment.start <= previous_segment.end:
-            # we should always have new_start+new_size >= segment.start
-
-            if segment.sort == previous_segment.sort:
-                # They are of the same sort - we should merge them!
-                new_end = max(previous_segment.end, segment.start + segment.size)
-                new_start = min(previous_segment.start, segment.start)
-                new_size = new_end - new_start
-                self._list[segment_pos] = Segment(new_start, new_end, segment.sort)
-                self._list.pop(previous_segment_pos)
-                bytes_changed = -(segment.size + previous_segment.size - new_size)
-
-                merged = True
-                new_pos = previous_segment_pos
-
-            else:
-                # Different sorts. It's a bit trickier.
-                if segment.start == previous_segment.end:
-                    # They are adjacent. Just don't merge.
-                    pass
-                else:
-                    # They are overlapping. We will create one, two, or three different blocks based on how they are
-                    # overlapping
-                    new_segments = [ ]
-                    if segment.start < previous_segment.start:
-                        new_segments.append(Segment(segment.start, previous_segment.start, segment.sort))
-
-                        sort = previous_segment.sort if direction == "forward" else segment.sort
-                        new_segments.append(Segment(previous_segment.start, previous_segment.end, sort))
-
-                        if segment.end < previous_segment.end:
-                            new_segments.append(Segment(segment.end, previous_segment.end, previous_segment.sort))
-                        elif segment.end > previous_segment.end:
-                            new_segments.append(Segment(previous_segment.end, segment.end, segment.sort))
-                    else:  # segment.start >= previous_segment.start
-                        if segment.start > previous_segment.start:
-                            new_segments.append(Segment(previous_segment.start, segment.start, previous_segment.sort))
-                        sort = previous_segment.sort if direction == "forward" else segment.sort
-                        if segment.end > previous_segment.end:
-                            new_segments.append(Segment(segment.start, previous_segment.end, sort))
-                            new_segments.append(Segment(previous_segment.end, segment.end, segment.sort))
-                        elif segment.end < previous_segment.end:
-                            new_segments.append(Segment(segment.start, segment.end, sort))
-                            new_segments.append(Segment(segment.end, previous_segment.end, previous_segment.sort))
-                        else:
-                            new_segments.append(Segment(segment.start, segment.end, sort))
-
-                    # merge segments in new_segments array if they are of the same sort
-                    i = 0
-                    while len(new_segments) > 1 and i < len(new_segments) - 1:
-                        s0 = new_segments[i]
-                        s1 = new_segments[i + 1]
-                        if s0.sort == s1.sort:
-                            new_segments = new_segments[ : i] + [ Segment(s0.start, s1.end, s0.sort) ] + new_segments[i + 2 : ]
-                        else:
-                            i += 1
-
-                    # Put new segments into self._list
-                    old_size = sum([ seg.size for seg in self._list[previous_segment_pos : segment_pos + 1] ])
-                    new_size = sum([ seg.size for seg in new_segments ])
-                    bytes_changed = new_size - old_size
+        spans = self._spans
 
-                    self._list = self._list[ : previous_segment_pos] + new_segments + self._list[ segment_pos + 1 : ]
-
-                    merged = True
-
-                    if direction == "forward":
-                        new_pos = previous_segment_pos + len(new_segments)
-                    else:
-                        new_pos = previous_segment_pos
+        idx = spans.bisect_right(start) - 1
+        if idx >= 0:
+            span_start, span_end = spans.peekitem(idx)
+            if span_end >= start:
+                # overlapping with or adjacent to the previous span
+                if span_end >= end:
+                    return
+                start = span_start
+                del spans[span_start]
+                self._bytes_occupied -= span_end - span_start
+                idx -= 1
+
+        # absorb all following spans that overlap or are adjacent
+        idx += 1
+        while idx < len(spans):
+            span_start, span_end = spans.peekitem(idx)
+            if span_start > end:
+                break
+            end = max(end, span_end)
+            del spans[span_start]
+            self._bytes_occupied -= span_end - span_start
 
-        return merged, new_pos, bytes_changed
+        spans[start] = end
+        self._bytes_occupied += end - start
 
     def _dbg_output(self):
         """
@@ -319,16 +227,12 @@ class SegmentList:
         :return: The next free position
         """
 
-        idx = self._search(address)
-        if idx < len(self._list) and self._list[idx].start <= address < self._list[idx].end:
-            # Occupied
-            i = idx
-            while i + 1 < len(self._list) and self._list[i].end == self._list[i + 1].start:
-                i += 1
-            if i == len(self._list):
-                return self._list[-1].end
-
-            return self._list[i].end
+        idx = self._spans.bisect_right(address) - 1
+        if idx >= 0:
+            span_end = self._spans.peekitem(idx)[1]
+            if address < span_end:
+                # Occupied
+                return span_end
 
         return address
 
@@ -346,32 +250,24 @@ class SegmentList:
         :rtype:             int or None
         """
 
-        list_length = len(self._list)
-
-        idx = self._search(address)
-        if idx < list_length:
-            # Occupied
-            block = self._list[idx]
-
-            if max_distance is not None and address + max_distance < block.start:
-                return None
+        segment = self._segment_at(address)
+        if segment is not None and segment.sort not in sorts:
+            # the address is inside the current block
+            return address
 
-            if block.start <= address < block.end:
-                # the address is inside the current block
-                if block.sort not in sorts:
-                    return address
-                # tick the idx forward by 1
-                idx += 1
-
-            i = idx
-            while i < list_length:
-                if max_distance is not None and address + max_distance < self._list[i].start:
-                    return None
-                if self._list[i].sort not in sorts:
-                    return self._list[i].start
-                i += 1
+        pos = None
+        for sort, segments in self._segments_by_sort.items():
+            if sort in sorts:
+                continue
+            idx = segments.bisect_right(address)
+            if idx < len(segments):
+                start = segments.peekitem(idx)[0]
+                if pos is None or start < pos:
+                    pos = start
 
-        return None
+        if pos is None or (max_distance is not None and address + max_distance < pos):
+            return None
+        return pos
 
     def is_occupied(self, address):
         """
@@ -381,15 +277,7 @@ class SegmentList:
         :return: True if this address belongs to a segment, False otherwise
         """
 
-        idx = self._search(address)
-        if len(self._list) <= idx:
-            return False
-        if self._list[idx].start <= address < self._list[idx].end:
-            return True
-        if idx > 0 and address < self._list[idx - 1].end:
-            # TODO: It seems that this branch is never reached. Should it be removed?
-            return True
-        return False
+        return self._segment_at(address) is not None
 
     def occupied_by_sort(self, address):
         """
@@ -400,19 +288,15 @@ class SegmentList:
         :rtype: str
         """
 
-        idx = self._search(address)
-        if len(self._list) <= idx:
-            return None
-        if self._list[idx].start <= address < self._list[idx].end:
-            return self._list[idx].sort
-        if idx > 0 and address < self._list[idx - 1].end:
-            # TODO: It seems that this branch is never reached. Should it be removed?
-            return self._list[idx - 1].sort
-        return None
+        segment = self._segment_at(address)
+        return segment.sort if segment is not None else None
 
     def occupy(self, address, size, sort):
         """
-        Include a block, specified by (address, size), in this segment list.
+        Include a block, specified by (address, size), in this segment list. Where the block overlaps with existing
+        blocks of other sorts, it takes over the first one of them (the one it starts in, or the first one after its
+        start), and all further blocks keep their bytes. Blocks of the same sort that overlap or are adjacent are
+        merged.
 
         :param int address:     The starting address of the block.
         :param int size:        Size of the block.
@@ -425,17 +309,63 @@ class SegmentList:
             return
 
         # l.debug("Occpuying 0x%08x-0x%08x", address, address + size)
-        if not self._list:
-            self._list.append(Segment(address, address + size, sort))
-            self._bytes_occupied += size
-            return
-        # Find adjacent element in our list
-        idx = self._search(address)
-        # print idx
-
-        self._insert_and_merge(address, size, sort, idx)
+        start, end = address, address + size
+        segments = self._segments
+
+        # find all segments that overlap with or are adjacent to the new block
+        idx = segments.bisect_left(address) - 1
+        if idx < 0 or segments.peekitem(idx)[1].end < address:
+            idx += 1
+        affected = [ ]
+        while idx < len(segments):
+            segment = segments.peekitem(idx)[1]
+            if segment.start > end:
+                break
+            affected.append(segment)
+            idx += 1
+
+        ranges = [ ]  # ranges that end up with the sort of the new block
+        kept = [ ]  # blocks of other sorts that keep the bytes they share with the new block
+        taken_over = False
+        for segment in affected:
+            if segment.sort == sort:
+                # merge them
+                self._remove_segment(segment)
+                ranges.append((segment.start, segment.end))
+            elif segment.end <= start or segment.start >= end:
+                # adjacent blocks of a different sort are kept
+                continue
+            elif not taken_over:
+                # keep the parts that are not overlapping
+                taken_over = True
+                self._remove_segment(segment)
+                if segment.start < start:
+                    self._add_segment(Segment(segment.start, start, segment.sort))
+                if segment.end > end:
+                    self._add_segment(Segment(end, segment.end, segment.sort))
+            else:
+                kept.append(segment)
+
+        # the new block fills the gaps between the blocks that are kept
+        pos = start
+        for segment in kept:
+            if pos < segment.start:
+                ranges.append((pos, segment.start))
+            pos = segment.end
+        if pos < end:
+            ranges.append((pos, end))
+
+        ranges.sort()
+        merged = [ ]
+        for range_start, range_end in ranges:
+            if merged and range_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], range_end)
+            else:
+                merged.append([ range_start, range_end ])
+        for range_start, range_end in merged:
+            self._add_segment(Segment(range_start, range_end, sort))
 
-        # self._debug_check()
+        self._occupy_span(start, end)
 
     def copy(self):
         """
@@ -446,9 +376,14 @@ class SegmentList:
         """
         n = SegmentList()
 
-        n._list = [ a.copy() for a in self._list ]
+        # segments are never modified once they are created, so they can be shared
+        n._segments = self._segments.copy()
+        n._segments_by_sort = { sort: segments.copy() for sort, segments in self._segments_by_sort.items() }
+        n._spans = self._spans.copy()
         n._bytes_occupied = self._bytes_occupied
 
+        return n
+
     #
     # Properties
     #
@@ -471,7 +406,7 @@ class SegmentList:
         :return: True if it's not empty, False otherwise
         """
 
-        return len(self._list) > 0
+        return len(self._segments) > 0
 
 
 class FunctionReturn:
@@ -1002,6 +937,8 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
         #
         # Variables used during analysis
         #
+
+        self._memory_scanner = None
         self._pending_jobs = None
         self._traced_addresses = None
         self._function_returns = None
@@ -1028,16 +965,11 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
 
         if not data:
             return 0
-        entropy = 0
         if size is None:
             size = len(data)
 
         data = bytes(pyvex.ffi.buffer(data, size))
-        for x in range(0, 256):
-            p_x = float(data.count(x)) / size
-            if p_x > 0:
-                entropy += - p_x * math.log(p_x, 2)
-        return entropy
+        return calc_entropy(data)
 
     #
     # Properties
@@ -1190,7 +1122,45 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
                 return None
         return val
 
+    def _region_end(self, address):
+        """
+        Get the end of the memory region that an address is in. Regions that are adjacent to each other are treated as a
+        single region.
+
+        :param int address: The address.
+        :return:            The end address of the region, or None if the address is not inside any region.
+        :rtype:             int or None
+        """
+
+        try:
+            start_addr = next(self._regions.irange(maximum=address, reverse=True))
+        except StopIteration:
+            return None
+        end_addr = self._regions[start_addr]
+        if address >= end_addr:
+            return None
+
+        for start_addr in self._regions.irange(minimum=start_addr, inclusive=(False, True)):
+            if start_addr > end_addr:
+                break
+            end_addr = max(end_addr, self._regions[start_addr])
+        return end_addr
+
     def _scan_for_printable_strings(self, start_addr):
+
+        if self._memory_scanner is not None:
+            region_end = self._region_end(start_addr)
+            if region_end is None:
+                return 0
+            end_addr, stopped = self._memory_scanner.run_end(start_addr, MemoryScanner.PRINTABLE, region_end)
+            length = end_addr - start_addr
+            if length == 0:
+                return 0
+            if stopped and (self._memory_scanner.byte(end_addr) != 0 or length < 4):
+                return 0
+            l.debug("Got a string of %d chars at %#x", length, start_addr)
+            return length + 1
+
         addr = start_addr
         sz = []
         is_sz = True
@@ -1220,20 +1190,28 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
         return 0
 
     def _scan_for_repeating_bytes(self, start_addr, repeating_byte):
-        assert len(repeating_byte) == 1
-        addr = start_addr
 
-        repeating_length = 0
+        if self._memory_scanner is not None:
+            region_end = self._region_end(start_addr)
+            if region_end is None:
+                return 0
+            end_addr, _ = self._memory_scanner.run_end(start_addr, repeating_byte, region_end)
+            repeating_length = end_addr - start_addr
 
-        while self._inside_regions(addr):
-            val = self._load_a_byte_as_int(addr)
-            if val is None:
-                break
-            if val == repeating_byte:
-                repeating_length += 1
-            else:
-                break
-            addr += 1
+        else:
+            addr = start_addr
+
+            repeating_length = 0
+
+            while self._inside_regions(addr):
+                val = self._load_a_byte_as_int(addr)
+                if val is None:
+                    break
+                if val == repeating_byte:
+                    repeating_length += 1
+                else:
+                    break
+                addr += 1
 
         if repeating_length > self.project.arch.bytes:  # this is pretty random
             return repeating_length
@@ -1259,14 +1237,14 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
                 start_addr += string_length
 
             if self.project.arch.name in ('X86', 'AMD64'):
-                cc_length = self._scan_for_repeating_bytes(start_addr, '\xcc')
+                cc_length = self._scan_for_repeating_bytes(start_addr, 0xcc)
                 if cc_length:
                     self._seg_list.occupy(start_addr, cc_length, "alignment")
                     start_addr += cc_length
             else:
                 cc_length = 0
 
-            zeros_length = self._scan_for_repeating_bytes(start_addr, '\x00')
+            zeros_length = self._scan_for_repeating_bytes(start_addr, 0x00)
             if zeros_length:
                 self._seg_list.occupy(start_addr, zeros_length, "alignment")
                 start_addr += zeros_length
@@ -1356,6 +1334,10 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
         self._nodes = {}
         self._nodes_by_addr = defaultdict(list)
 
+        # gaps are scanned on the whole loader memory at once, unless the memory comes from a base state
+        if numpy is not None and self._base_state is None:
+            self._memory_scanner = MemoryScanner(self.project.loader.memory, self.PRINTABLES)
+
         if self._use_function_prologues:
             self._function_prologue_addrs = sorted(self._func_addrs_from_prologues())
             # make a copy of those prologue addresses, so that we can pop from the list
@@ -1496,6 +1478,9 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
 
     def _post_analysis(self):
 
+        # release the cached runs
+        self._memory_scanner = None
+
         self._make_completed_functions()
 
         if self._normalize:
@@ -1542,7 +1527,7 @@ class CFGFast(ForwardAnalysis, CFGBase):    # pylint: disable=abstract-method
                 f.transition_graph.remove_edge(*edge)
 
             # Clear the cache
-            f._local_transition_graph = None
+            f._invalidate_graphs()
 
         # Scan all functions, and make sure .returning for all functions are either True or False
         for f in self.functions.values():
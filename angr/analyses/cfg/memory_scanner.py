@@ -0,0 +1,144 @@
+
+import bisect
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class MemoryScanner(object):
+    """
+    Find runs of bytes of a certain kind (printable characters, or a repeating byte) in the memory of a loader.
+
+    Each backer of the loader memory is viewed as a numpy array without copying it. The first time a kind of run is
+    asked for in a backer, the boundaries of all runs of that kind in the backer are computed with a few vectorized
+    operations and cached, so that each query afterwards is a binary search.
+
+    Requires numpy.
+    """
+
+    PRINTABLE = 'printable'
+
+    def __init__(self, memory, printables):
+        """
+        :param cle.Clemory memory:  The memory to scan.
+        :param bytes printables:    All bytes that are considered printable.
+        """
+
+        if numpy is None:
+            raise ImportError("MemoryScanner requires numpy")
+
+        self._printable_table = numpy.zeros(256, dtype=bool)
+        self._printable_table[list(printables)] = True
+
+        self._starts = [ ]
+        self._chunks = [ ]
+        for start, backer in memory.backers():
+            self._starts.append(start)
+            self._chunks.append(numpy.frombuffer(backer, dtype=numpy.uint8))
+
+        # maps (chunk index, kind) to the start and end offsets of all runs
+        self._runs = { }
+
+    def _chunk_index(self, addr):
+        idx = bisect.bisect_right(self._starts, addr) - 1
+        if idx < 0 or addr - self._starts[idx] >= len(self._chunks[idx]):
+            return None
+        return idx
+
+    def _runs_of(self, idx, kind):
+        key = (idx, kind)
+        runs = self._runs.get(key, None)
+        if runs is None:
+            data = self._chunks[idx]
+            if kind == self.PRINTABLE:
+                mask = self._printable_table[data]
+            else:
+                mask = data == kind
+            # a run starts where the mask goes from False to True, and ends where it goes from True to False
+            edges = numpy.diff(numpy.concatenate(([False], mask, [False])).view(numpy.int8))
+            runs = numpy.flatnonzero(edges == 1), numpy.flatnonzero(edges == -1)
+            self._runs[key] = runs
+        return runs
+
+    def byte(self, addr):
+        """
+        Get the byte at an address.
+
+        :param int addr:    The address.
+        :return:            The byte, or None if the address is not mapped.
+        :rtype:             int or None
+        """
+
+        idx = self._chunk_index(addr)
+        if idx is None:
+            return None
+        return int(self._chunks[idx][addr - self._starts[idx]])
+
+    def run_end(self, addr, kind, limit):
+        """
+        Find the end of the run of bytes of a certain kind that starts at an address.
+
+        :param int addr:    The address where the run starts.
+        :param kind:        MemoryScanner.PRINTABLE for printable characters, or an int for a repeating byte.
+        :param int limit:   The run does not go beyond this address.
+        :return:            A tuple of the end address of the run (exclusive), and a bool that is True if the run ended
+                            because of a byte that is not of the kind, and False if the run reached the limit or the
+                            end of mapped memory.
+        :rtype:             tuple
+        """
+
+        end = addr
+        while end < limit:
+            idx = self._chunk_index(end)
+            if idx is None:
+                return end, False
+            chunk_start = self._starts[idx]
+            offset = end - chunk_start
+
+            starts, ends = self._runs_of(idx, kind)
+            i = numpy.searchsorted(starts, offset, side='right') - 1
+            if i < 0 or offset >= ends[i]:
+                # the byte at end is not of this kind
+                return end, True
+
+            end = chunk_start + int(ends[i])
+            if end < chunk_start + len(self._chunks[idx]):
+                # the run ends inside this chunk
+                return min(end, limit), end < limit
+            # the run reaches the end of this chunk, and may go on in the next one
+
+        return limit, False
+
+
+def calc_entropy(data):
+    """
+    Calculate the Shannon entropy of some data in a single pass.
+
+    :param data:    The data, as bytes or a numpy array of uint8.
+    :return:        The entropy.
+    :rtype:         float
+    """
+
+    size = len(data)
+    if not size:
+        return 0
+
+    if numpy is not None:
+        if not isinstance(data, numpy.ndarray):
+            data = numpy.frombuffer(data, dtype=numpy.uint8)
+        counts = numpy.bincount(data, minlength=256)
+        p = counts[counts > 0] / float(size)
+        return float(-(p * numpy.log2(p)).sum())
+
+    counts = [ 0 ] * 256
+    for b in data:
+        counts[b] += 1
+    entropy = 0
+    for c in counts:
+        if c:
+            p_x = float(c) / size
+            entropy += - p_x * math.log(p_x, 2)
+    return entropy
@@ -1,10 +1,11 @@
 
+from collections import defaultdict
 import logging
 
 import networkx
 
 from .. import Analysis, register_analysis
-from ...utils.graph import dfs_back_edges
+from ...utils.graph import dfs_back_edges, Dominators
 
 l = logging.getLogger(name=__name__)
 
@@ -184,7 +185,7 @@ class RegionIdentifier(Analysis):
 
     def _analyze(self):
 
-        # make a copy of the graph
+        # make a copy of the graph. this is the only copy: regions are collapsed in place from now on
         graph = networkx.DiGraph(self._graph)
 
         # preprocess: make it a super graph
@@ -201,6 +202,12 @@ class RegionIdentifier(Analysis):
 
         self.region = next(iter(graph.nodes()))
 
+        # the root element of the region hierarchy should always be a GraphRegion
+        if not isinstance(self.region, GraphRegion):
+            subgraph = networkx.DiGraph()
+            subgraph.add_node(self.region)
+            self.region = GraphRegion(self.region, subgraph)
+
     def _update_start_node(self, graph):
         self._start_node = next(n for n in graph.nodes() if graph.in_degree(n) == 0)
 
@@ -228,45 +235,59 @@ class RegionIdentifier(Analysis):
 
     def _make_supergraph(self, graph):
 
-        while True:
-            for src, dst, data in graph.edges(data=True):
-                if data['type'] == 'fake_return':
-                    if len(list(graph.successors(src))) == 1 and len(list(graph.predecessors(dst))) == 1:
-                        self._merge_nodes(graph, src, dst, force_multinode=True)
-                        break
-                if data['type'] == 'call':
-                    graph.remove_node(dst)
-                    break
-            else:
-                break
+        call_targets = [ dst for _, dst, data in graph.edges(data=True) if data['type'] == 'call' ]
+        graph.remove_nodes_from(call_targets)
+
+        # merge nodes along fake_return edges until there is nothing left to merge. merging only changes the degrees
+        # of the merged nodes, so it is enough to look at the edges of each new node again
+        worklist = [ (src, dst) for src, dst, data in graph.edges(data=True) if data['type'] == 'fake_return' ]
+        while worklist:
+            src, dst = worklist.pop()
+            if not graph.has_edge(src, dst):
+                continue
+            if graph.out_degree(src) == 1 and graph.in_degree(dst) == 1:
+                new_node = self._merge_nodes(graph, src, dst, force_multinode=True)
+                worklist.extend((s, d) for s, d, data in graph.in_edges(new_node, data=True)
+                                if data['type'] == 'fake_return')
+                worklist.extend((s, d) for s, d, data in graph.out_edges(new_node, data=True)
+                                if data['type'] == 'fake_return')
 
     def _find_loop_headers(self, graph):
         return set([t for _,t in dfs_back_edges(graph, self._start_node)])
 
-    def _find_initial_loop_nodes(self, graph, head):
-        # TODO optimize
-        latching_nodes = set([s for s,t in dfs_back_edges(graph, self._start_node) if t == head])
-        loop_subgraph = self.slice_graph(graph, head, latching_nodes, include_frontier=True)
-        nodes = set(loop_subgraph.nodes())
+    def _find_initial_loop_nodes(self, graph, head, doms):
+
+        latching_nodes = set(n for n in graph.predecessors(head) if doms.dominates(head, n))
+        natural = bool(latching_nodes)
+        if not natural:
+            # the loop is irreducible, so the head does not dominate its latching nodes
+            latching_nodes = set(s for s, t in dfs_back_edges(graph, self._start_node) if t == head)
+        if not latching_nodes:
+            return set()
+
+        # walk backwards from the latching nodes to the head
+        nodes = { head }
+        stack = [ n for n in latching_nodes if n is not head ]
+        nodes.update(stack)
+        while stack:
+            node = stack.pop()
+            for pred in graph.predecessors(node):
+                if pred not in nodes:
+                    nodes.add(pred)
+                    stack.append(pred)
+
+        if not natural:
+            # only keep nodes that are also reachable from the head
+            reachable = set(networkx.dfs_preorder_nodes(graph, head))
+            nodes &= reachable
+
         return nodes
-    @staticmethod
-    def _dominates(idom, dominator_node, node):
-        n = node
-        while n:
-            if n == dominator_node:
-                return True
-            if n in idom and n != idom[n]:
-                n = idom[n]
-            else:
-                n = None
-        return False
 
-    def _refine_loop(self, graph, head, initial_loop_nodes, initial_exit_nodes):
+    @staticmethod
+    def _refine_loop(graph, head, initial_loop_nodes, initial_exit_nodes, doms):
         refined_loop_nodes = initial_loop_nodes.copy()
         refined_exit_nodes = initial_exit_nodes.copy()
 
-        idom = networkx.immediate_dominators(graph, self._start_node)
-
         n_new = refined_exit_nodes
         while len(refined_exit_nodes) > 1 and len(n_new) != 0:
             n_new = set()
@@ -275,7 +296,7 @@ class RegionIdentifier(Analysis):
                     refined_loop_nodes.add(n)
                     refined_exit_nodes.remove(n)
                     for u in (set(graph.successors(n)) - refined_loop_nodes):
-                        if self._dominates(idom, head, n):
+                        if doms.dominates(head, n):
                             n_new.add(u)
             refined_exit_nodes |= n_new
         return refined_loop_nodes, refined_exit_nodes
@@ -315,85 +336,128 @@ class RegionIdentifier(Analysis):
 
     def _make_regions(self, graph):
 
+        # each pass usually collapses the whole graph. another pass is only needed after an irreducible loop was
+        # collapsed, or when a pass left some nodes behind
+        while len(graph) > 1 and self._make_regions_pass(graph):
+            pass
+
+    def _make_regions_pass(self, graph):
+        """
+        Visit all nodes in post-order once, and collapse each region that is found into a single node. The dominator
+        tree and the dominance frontiers are updated after each collapse instead of being recomputed.
+
+        :param networkx.DiGraph graph: The graph to work on.
+        :return: True if any region was collapsed, False otherwise.
+        :rtype: bool
+        """
+
         r = False
 
-        while True:
-            df = None
-
-            self._update_start_node(graph)
-
-            for node in networkx.dfs_postorder_nodes(graph, source=self._start_node):
-                succs = graph.successors(node)
-                if not succs:
-                    # the root element of the region hierarchy should always be a GraphRegion,
-                    # so we transform it into one, if necessary
-                    if not graph.predecessors(node) and not isinstance(node, GraphRegion):
-                        subgraph = networkx.DiGraph()
-                        subgraph.add_node(node)
-                        self._abstract_acyclic_region(graph, GraphRegion(node, subgraph), [])
-                    break
+        # this cannot come from kb.dominators: the graph is the supergraph of the function rather than its graph, and
+        # the dominator tree is contracted in place below as regions are collapsed
+        doms = Dominators(graph, self._start_node)
+        df = doms.dominance_frontiers(graph)
+        # maps each node to the nodes whose dominance frontiers include it
+        df_users = defaultdict(set)
+        for node, frontier in df.items():
+            for n in frontier:
+                df_users[n].add(node)
 
+        post_order = list(networkx.dfs_postorder_nodes(graph, self._start_node))
+        post_order_index = { n: i for i, n in enumerate(post_order) }
+
+        i = 0
+        while i < len(post_order):
+            node = post_order[i]
+
+            if node in self._loop_headers:
                 # cyclic region
-                # TODO optimize
-                if node in self._loop_headers:
-                    l.debug("Found cyclic region at %#08x", node.addr)
-                    initial_loop_nodes = self._find_initial_loop_nodes(graph, node)
-                    l.debug("Initial loop nodes %s", self._dbg_block_list(initial_loop_nodes))
-
-                    normal_entries = set([n for n in graph.predecessors(node) if n not in initial_loop_nodes])
-                    abnormal_entries = set()
-                    for n in initial_loop_nodes:
-                        if n == node:
-                            continue
-                        preds = set(graph.predecessors(n))
-                        abnormal_entries |= (preds - initial_loop_nodes)
-                    l.debug("Normal entries %s", self._dbg_block_list(normal_entries))
-                    l.debug("Abnormal entries %s", self._dbg_block_list(abnormal_entries))
-
-                    initial_exit_nodes = set()
-                    for n in initial_loop_nodes:
-                        succs = set(graph.successors(n))
-                        initial_exit_nodes |= (succs - initial_loop_nodes)
-
-                    l.debug("Initial exit nodes %s", self._dbg_block_list(initial_exit_nodes))
-
-                    refined_loop_nodes, refined_exit_nodes = self._refine_loop(graph, node, initial_loop_nodes, initial_exit_nodes)
-                    l.debug("Refined loop nodes %s", self._dbg_block_list(refined_loop_nodes))
-                    l.debug("Refined exit nodes %s", self._dbg_block_list(refined_exit_nodes))
-
-                    if len(refined_exit_nodes) > 1:
-                        self._update_start_node(graph)
-                        node_post_order = list(networkx.dfs_postorder_nodes(graph, self._start_node))
-                        sorted_exit_nodes = sorted(list(refined_exit_nodes), key=node_post_order.index)
-                        normal_exit_node = sorted_exit_nodes[0]
-                        abnormal_exit_nodes = set(sorted_exit_nodes[1:])
-                    else:
-                        normal_exit_node = next(iter(refined_exit_nodes)) if len(refined_exit_nodes) > 0 else None
-                        abnormal_exit_nodes = set()
+                l.debug("Found cyclic region at %#08x", node.addr)
+                region, region_nodes, single_entry = self._make_cyclic_region(graph, node, doms, post_order_index)
 
-                    self._abstract_cyclic_region(graph, refined_loop_nodes, node, normal_entries, abnormal_entries, normal_exit_node, abnormal_exit_nodes)
-                    break
-                # acyclic region
-                else:
-                    if df is None:
-                        self._update_start_node(graph)
-                        df = networkx.algorithms.dominance_frontiers(graph, self._start_node)
-                    frontier = df[node]
-                    if len(frontier) <= 1:
-                        region = self._compute_region(graph, node, frontier)
-                        if region is None:
-                            continue
-                        else:
-                            self._abstract_acyclic_region(graph, region, frontier)
-                            break
-                    else:
-                        continue
-                        #raise NotImplementedError()
             else:
-                break
+                # acyclic region
+                frontier = df[node]
+                region = self._compute_region(graph, node, frontier) if len(frontier) <= 1 else None
+                if region is None:
+                    i += 1
+                    continue
+                region_nodes = set(region.graph.nodes())
+                self._abstract_acyclic_region(graph, region, frontier)
+                single_entry = True
+
+            r = True
+
+            if not single_entry:
+                # the region has more than one entry, so the dominator tree cannot be updated in place
+                self._start_node = next(n for n in graph.nodes() if graph.in_degree(n) == 0)
+                return r
+
+            # the new region takes the place of its head
+            doms.contract(region_nodes, node, region)
+            self._start_node = doms.entry_node
+
+            frontier = set(n for n in df[node] if n not in region_nodes)
+            for n in region_nodes:
+                for user in df_users.pop(n, ()):
+                    if user not in region_nodes:
+                        df[user].discard(n)
+                        df[user].add(region)
+                        df_users[region].add(user)
+                for n_ in df.pop(n, ()):
+                    df_users[n_].discard(n)
+                post_order_index.pop(n, None)
+            df[region] = frontier
+            for n in frontier:
+                df_users[n].add(region)
+
+            post_order[i] = region
+            post_order_index[region] = i
+            # nodes before this one are all still unable to form a region, so we revisit the new region and continue
 
         return r
 
+    def _make_cyclic_region(self, graph, head, doms, post_order_index):
+
+        initial_loop_nodes = self._find_initial_loop_nodes(graph, head, doms)
+        l.debug("Initial loop nodes %s", self._dbg_block_list(initial_loop_nodes))
+
+        normal_entries = set([n for n in graph.predecessors(head) if n not in initial_loop_nodes])
+        abnormal_entries = set()
+        for n in initial_loop_nodes:
+            if n == head:
+                continue
+            preds = set(graph.predecessors(n))
+            abnormal_entries |= (preds - initial_loop_nodes)
+        l.debug("Normal entries %s", self._dbg_block_list(normal_entries))
+        l.debug("Abnormal entries %s", self._dbg_block_list(abnormal_entries))
+
+        initial_exit_nodes = set()
+        for n in initial_loop_nodes:
+            succs = set(graph.successors(n))
+            initial_exit_nodes |= (succs - initial_loop_nodes)
+
+        l.debug("Initial exit nodes %s", self._dbg_block_list(initial_exit_nodes))
+
+        refined_loop_nodes, refined_exit_nodes = self._refine_loop(graph, head, initial_loop_nodes,
+                                                                   initial_exit_nodes, doms)
+        l.debug("Refined loop nodes %s", self._dbg_block_list(refined_loop_nodes))
+        l.debug("Refined exit nodes %s", self._dbg_block_list(refined_exit_nodes))
+
+        if len(refined_exit_nodes) > 1:
+            sorted_exit_nodes = sorted(list(refined_exit_nodes),
+                                       key=lambda n: post_order_index.get(n, len(post_order_index)))
+            normal_exit_node = sorted_exit_nodes[0]
+            abnormal_exit_nodes = set(sorted_exit_nodes[1:])
+        else:
+            normal_exit_node = next(iter(refined_exit_nodes)) if len(refined_exit_nodes) > 0 else None
+            abnormal_exit_nodes = set()
+
+        region = self._abstract_cyclic_region(graph, refined_loop_nodes, head, normal_entries, abnormal_entries,
+                                              normal_exit_node, abnormal_exit_nodes)
+
+        return region, refined_loop_nodes, not abnormal_entries
+
     @staticmethod
     def _compute_region(graph, node, frontier, include_frontier=False):
 
@@ -482,6 +546,8 @@ class RegionIdentifier(Analysis):
         for node in loop_nodes:
             graph.remove_node(node)
 
+        return region
+
     @staticmethod
     def _region_in_edges(graph, region, data=False):
 
@@ -539,6 +605,8 @@ class RegionIdentifier(Analysis):
         assert not node_a in graph
         assert not node_b in graph
 
+        return new_node
+
     def _absorb_node(self, graph, node_mommy, node_kiddie, force_multinode=False):  # pylint:disable=no-self-use
 
         in_edges_mommy = graph.in_edges(node_mommy, data=True)
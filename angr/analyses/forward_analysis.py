@@ -1,7 +1,5 @@
 import networkx
 
-from claripy.utils.orderedset import OrderedSet
-
 from ..misc.ux import deprecated
 # errors
 from ..errors import AngrForwardAnalysisError
@@ -22,8 +20,13 @@ class GraphVisitor(object):
     """
     def __init__(self):
 
-        self._sorted_nodes = OrderedSet()
+        # all nodes, in traversal order. the position of a node in this list is its index
+        self._sorted_nodes = [ ]
         self._node_to_index = { }
+        # indices of successors of each node, computed on demand
+        self._successor_indices = { }
+        # nodes to visit, as a bitset of node indices
+        self._worklist = 0
         self._reached_fixedpoint = set()
 
     #
@@ -103,13 +106,12 @@ class GraphVisitor(object):
         :return: None
         """
 
-        self._sorted_nodes.clear()
-        self._node_to_index.clear()
         self._reached_fixedpoint.clear()
+        self._successor_indices.clear()
 
-        for i, n in enumerate(self.sort_nodes()):
-            self._node_to_index[n] = i
-            self._sorted_nodes.add(n)
+        self._sorted_nodes = list(self.sort_nodes())
+        self._node_to_index = { n: i for i, n in enumerate(self._sorted_nodes) }
+        self._worklist = (1 << len(self._sorted_nodes)) - 1
 
     def next_node(self):
         """
@@ -118,10 +120,13 @@ class GraphVisitor(object):
         :return: A node in the graph.
         """
 
-        if not self._sorted_nodes:
+        if not self._worklist:
             return None
 
-        return self._sorted_nodes.pop(last=False)
+        # the node with the lowest index goes first
+        lowest = self._worklist & -self._worklist
+        self._worklist ^= lowest
+        return self._sorted_nodes[lowest.bit_length() - 1]
 
     def all_successors(self, node, skip_reached_fixedpoint=False):
         """
@@ -153,16 +158,26 @@ class GraphVisitor(object):
         :return:     None
         """
 
-        successors = self.successors(node) #, skip_reached_fixedpoint=True)
-
         if include_self:
-            self._sorted_nodes.add(node)
+            self.revisit_node(node)
 
-        for succ in successors:
-            self._sorted_nodes.add(succ)
+        succ_indices = self._successor_indices.get(node, None)
+        if succ_indices is None:
+            succ_indices = [ self._node_to_index[succ] for succ in self.successors(node) ]
+            self._successor_indices[node] = succ_indices
+
+        for i in succ_indices:
+            self._worklist |= 1 << i
 
-        # reorder it
-        self._sorted_nodes = OrderedSet(sorted(self._sorted_nodes, key=lambda n: self._node_to_index[n]))
+    def revisit_node(self, node):
+        """
+        Revisit a single node in the future, without touching its successors.
+
+        :param node: The node to revisit in the future.
+        :return:     None
+        """
+
+        self._worklist |= 1 << self._node_to_index[node]
 
     def reached_fixedpoint(self, node):
         """
@@ -407,6 +422,8 @@ class ForwardAnalysis(object):
 
         # A mapping between node and abstract state
         self._state_map = { }
+        # A mapping between node and the input abstract state it was last analyzed with
+        self._visited_input_states = { }
 
         # The graph!
         # Analysis results (nodes) are stored here
@@ -573,21 +590,20 @@ class ForwardAnalysis(object):
             job_state = self._pop_input_state(n)
             if job_state is None:
                 job_state = self._initial_abstract_state(n)
-
-            if n is None:
-                break
+            self._visited_input_states[n] = job_state
 
             changed, output_state = self._run_on_node(n, job_state)
 
             # output state of node n is input state for successors to node n
-            self._add_input_state(n, output_state)
+            changed_successors = self._add_input_state(n, output_state)
 
             if not changed:
                 # reached a fixed point
                 continue
 
-            # add all successors
-            self._graph_visitor.revisit(n, include_self=False)
+            # only visit successors whose input state is different from the one they were analyzed with last time
+            for succ in changed_successors:
+                self._graph_visitor.revisit_node(succ)
 
     def _add_input_state(self, node, input_state):
         """
@@ -595,17 +611,26 @@ class ForwardAnalysis(object):
 
         :param node:        The node whose successors' input states will be touched.
         :param input_state: The state that will be added to successors of the node.
-        :return:            None
+        :return:            A list of successors whose input state has changed. Abstract states without an __eq__
+                            method are always considered as changed.
+        :rtype:             list
         """
 
         successors = self._graph_visitor.successors(node)
 
+        changed = [ ]
         for succ in successors:
             if succ in self._state_map:
                 self._state_map[succ] = self._merge_states(succ, *([ self._state_map[succ], input_state ]))
             else:
                 self._state_map[succ] = input_state
 
+            prev_state = self._visited_input_states.get(succ, None)
+            if prev_state is None or prev_state != self._state_map[succ]:
+                changed.append(succ)
+
+        return changed
+
     def _pop_input_state(self, node):
         """
         Get the input abstract state for this node, and remove it from the state map.
@@ -39,6 +39,13 @@ class Func(object):
     def can_call_other_funcs(self): #pylint disable=no-self-use
         return True
 
+    def needs_loop(self): #pylint disable=no-self-use
+        """
+        Whether any implementation of this function has to loop over memory, either by itself or in a function it
+        calls. Used to rule out loop-free functions without running any tests.
+        """
+        return False
+
     def pre_test(self, func, runner): #pylint disable=no-self-use,unused-argument
         """
         custom tests run before, return False if it for sure is not the function
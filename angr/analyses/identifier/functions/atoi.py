@@ -19,6 +19,9 @@ class atoi(Func):
     def num_args(self):
         return 1
 
+    def needs_loop(self): #pylint disable=no-self-use
+        return True
+
     def get_name(self):
         if self.allows_negative:
             suffix = ""
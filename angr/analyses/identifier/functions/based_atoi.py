@@ -63,6 +63,9 @@ class based_atoi(Func):
     def num_args(self):
         return OneTwoOrThree()
 
+    def needs_loop(self): #pylint disable=no-self-use
+        return True
+
     def args(self): #pylint disable=no-self-use
         return ["buf", "size", "err"]
 
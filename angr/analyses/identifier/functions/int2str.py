@@ -69,6 +69,9 @@ class int2str(Func):
     def num_args(self):
         return 3
 
+    def needs_loop(self): #pylint disable=no-self-use
+        return True
+
     def args(self): #pylint disable=no-self-use
         return ["buf", "len", "val"]
 
@@ -131,6 +134,9 @@ class int2str_v2(Func):
     def num_args(self):
         return TwoOrThree()
 
+    def needs_loop(self): #pylint disable=no-self-use
+        return True
+
     def args(self): #pylint disable=no-self-use
         return ["val", "buf", "max"]
 
@@ -192,6 +198,9 @@ class int2str_v3(Func):
     def num_args(self):
         return TwoOrThree()
 
+    def needs_loop(self): #pylint disable=no-self-use
+        return True
+
     def args(self): #pylint disable=no-self-use
         return ["buf", "val", "max"]
 
@@ -253,6 +262,9 @@ class int2str_v4(Func):
     def num_args(self):
         return ThreeOrFour()
 
+    def needs_loop(self): #pylint disable=no-self-use
+        return True
+
     def args(self): #pylint disable=no-self-use
         return ["buf", "val", "base"]
 
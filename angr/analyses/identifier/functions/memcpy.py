@@ -27,6 +27,9 @@ class memcpy(Func):
     def num_args(self):
         return 3
 
+    def needs_loop(self): #pylint disable=no-self-use
+        return True
+
     def args(self):
         return ["dst", "src", "len"]
 
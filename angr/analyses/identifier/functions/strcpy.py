@@ -21,6 +21,9 @@ class strcpy(Func):
     def num_args(self):
         return 2
 
+    def needs_loop(self): #pylint disable=no-self-use
+        return True
+
     def args(self): #pylint disable=no-self-use
         return ["dst", "src"]
 
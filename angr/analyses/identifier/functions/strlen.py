@@ -14,6 +14,9 @@ class strlen(Func):
     def num_args(self):
         return 1
 
+    def needs_loop(self): #pylint disable=no-self-use
+        return True
+
     def get_name(self):
         return "strlen"
 
@@ -22,6 +22,9 @@ class strncmp(Func):
     def num_args(self):
         return 3
 
+    def needs_loop(self): #pylint disable=no-self-use
+        return True
+
     def args(self): #pylint disable=no-self-use
         return ["buf1", "buf2", "len"]
 
@@ -24,6 +24,9 @@ class strncpy(Func):
     def num_args(self):
         return 3
 
+    def needs_loop(self): #pylint disable=no-self-use
+        return True
+
     def args(self): #pylint disable=no-self-use
         return ["dst", "src", "len"]
 
@@ -40,6 +40,9 @@ class strtol(Func):
     def num_args(self): #pylint disable=no-self-use
         return 3
 
+    def needs_loop(self): #pylint disable=no-self-use
+        return True
+
     def args(self): #pylint disable=no-self-use
         return ["nptr", "endpointer", "base"]
 
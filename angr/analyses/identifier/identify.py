@@ -1,8 +1,10 @@
 
-from collections import defaultdict
+from collections import defaultdict, Counter
 from itertools import chain
 import logging
+import multiprocessing
 
+import networkx
 from networkx import NetworkXError
 
 from cle.backends.cgc import CGC
@@ -36,6 +38,16 @@ class FuncInfo(object):
         self.preamble_sp_change = None
 
 
+class FuncFeatures(object):
+    """
+    Cheap static features of a function, used to rule out candidates before running any tests.
+    """
+    def __init__(self):
+        self.num_calls = None
+        self.has_loop = None
+        self.loop_ops = None
+
+
 class Identifier(Analysis):
 
     _special_case_funcs = ["free"]
@@ -67,6 +79,7 @@ class Identifier(Analysis):
         self.callsites = None
         self.inv_callsites = None
         self.func_info = dict()
+        self.func_features = dict()
         self.block_to_func = dict()
 
         self.map_callsites()
@@ -109,7 +122,15 @@ class Identifier(Analysis):
             return True
         return False
 
-    def run(self, only_find=None):
+    def run(self, only_find=None, processes=None):
+        """
+        Identify library functions. Matches are yielded as (function address, name) pairs.
+
+        :param only_find:       Only look for functions with these names.
+        :param int processes:   Number of worker processes. If larger than 1, the functions that have candidates left
+                                after the static prefilter are tested in parallel, and matches are yielded in the order
+                                they are found. Requires the fork start method.
+        """
         if only_find is not None:
             self.only_find = only_find
 
@@ -117,10 +138,7 @@ class Identifier(Analysis):
             l.warning("Too large")
             return
 
-        for f in self._cfg.functions.values():
-            if f.is_syscall:
-                continue
-            match = self.identify_func(f)
+        for f, match in self._identify_funcs(processes):
             if match is not None:
                 match_func = match
                 match_name = match_func.get_name()
@@ -213,23 +231,106 @@ class Identifier(Analysis):
         for r in regs:
             state.add_constraints(before_state.registers.load(r) == 0)
 
-    def identify_func(self, function):
-        l.debug("function at %#x", function.addr)
-        if function.is_syscall:
-            return None
+    def _identify_funcs(self, processes=None):
+        """
+        Run identify_func() on every function that is not a syscall.
 
-        func_info = self.get_func_info(function)
-        if func_info is None:
-            l.debug("func_info is none")
-            return None
+        :param int processes:   Number of worker processes.
+        :return:                A generator of (function, match) pairs.
+        """
+        global _worker_identifier  # pylint:disable=global-statement
 
-        l.debug("num args %d", len(func_info.stack_args))
+        functions = [ f for f in self._cfg.functions.values() if not f.is_syscall ]
+
+        if processes is not None and processes > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+            l.warning("Parallel identification requires the fork start method. Running serially.")
+            processes = None
+
+        if processes is None or processes <= 1:
+            for f in functions:
+                yield f, self.identify_func(f)
+            return
+
+        # functions without any candidate left are settled right here, without executing anything
+        to_test = [ ]
+        for f in functions:
+            func_info = self.get_func_info(f)
+            if func_info is not None and self._candidate_funcs(f, func_info):
+                to_test.append(f.addr)
+            else:
+                yield f, self.identify_func(f)
+
+        if not to_test:
+            return
+
+        # build the base state once, instead of once per worker
+        if self._runner.base_state is None:
+            self._runner.base_state = self._runner._get_recv_state()
+
+        _worker_identifier = self
+        try:
+            pool = multiprocessing.get_context('fork').Pool(processes)
+            try:
+                for func_addr, match in pool.imap_unordered(_identify_func_in_worker, to_test):
+                    yield self._cfg.functions[func_addr], match
+            finally:
+                pool.terminate()
+        finally:
+            _worker_identifier = None
+
+    def get_func_features(self, func):
+        if isinstance(func, int):
+            func = self._cfg.functions[func]
+        if func not in self.func_features:
+            self.func_features[func] = self._find_func_features(func)
+        return self.func_features[func]
+
+    def _find_func_features(self, func):
+        features = FuncFeatures()
+        features.num_calls = len(func.get_call_sites())
+
+        # blocks that are part of a loop, including blocks that jump to themselves (e.g. rep-prefixed instructions)
+        loop_blocks = set()
+        for scc in networkx.strongly_connected_components(func.graph):
+            if len(scc) > 1:
+                loop_blocks.update(scc)
+        loop_blocks.update(n for n in func.graph.nodes() if func.graph.has_edge(n, n))
+        features.has_loop = len(loop_blocks) > 0
+
+        # histogram of VEX statement and expression tags inside loops
+        features.loop_ops = Counter()
+        for n in loop_blocks:
+            try:
+                irsb = func._get_block(n.addr, size=n.size).vex
+            except (SimEngineError, SimMemoryError):
+                # we cannot tell, so make sure nothing is ruled out because of this block
+                features.loop_ops.update(('Ist_Store', 'Iex_Load'))
+                continue
+            for stmt in irsb.statements:
+                features.loop_ops[stmt.tag] += 1
+                for e in stmt.expressions:
+                    features.loop_ops[e.tag] += 1
+
+        return features
+
+    def _candidate_funcs(self, function, func_info):
+        """
+        Get the library functions `function` may be, ruling out candidates by argument count, var args, calls and loop
+        structure. Nothing is executed.
 
+        :return: A list of instances of the candidate Func classes, in the order they should be tested.
+        """
         try:
             calls_other_funcs = len(list(self._cfg.functions.callgraph.successors(function.addr))) > 0
         except NetworkXError:
             calls_other_funcs = False
 
+        features = self.get_func_features(function)
+        # all functions that loop over their input access memory in the loop, unless the loop is in a callee
+        loops_over_memory = calls_other_funcs or features.num_calls > 0 or \
+                            any(features.loop_ops[tag] for tag in ('Iex_Load', 'Ist_Store', 'Ist_LoadG', 'Ist_StoreG'))
+
+        candidates = [ ]
         for name, f in Functions.items():
             # check if we should be finding it
             if self.only_find is not None and name not in self.only_find:
@@ -244,8 +345,27 @@ class Identifier(Analysis):
                 continue
             if calls_other_funcs and not f.can_call_other_funcs():
                 continue
+            if f.needs_loop() and not loops_over_memory:
+                continue
+
+            candidates.append(f)
+
+        return candidates
+
+    def identify_func(self, function):
+        l.debug("function at %#x", function.addr)
+        if function.is_syscall:
+            return None
+
+        func_info = self.get_func_info(function)
+        if func_info is None:
+            l.debug("func_info is none")
+            return None
 
-            l.debug("testing: %s", name)
+        l.debug("num args %d", len(func_info.stack_args))
+
+        for f in self._candidate_funcs(function, func_info):
+            l.debug("testing: %s", type(f).__name__)
             if not self.check_tests(function, f):
                 continue
             # match!
@@ -831,3 +951,18 @@ class Identifier(Analysis):
 
 from angr.analyses import AnalysesHub
 AnalysesHub.register_default('Identifier', Identifier)
+
+
+# the Identifier whose run() forked the workers
+_worker_identifier = None
+
+
+def _identify_func_in_worker(func_addr):
+    """
+    Identify a single function in a worker process.
+
+    :param int func_addr:   Address of the function.
+    :return:                The address and the matching Func instance, or None if there is no match.
+    """
+    identifier = _worker_identifier
+    return func_addr, identifier.identify_func(identifier._cfg.functions[func_addr])
@@ -31,6 +31,10 @@ class Loop(object):
 class LoopFinder(Analysis):
     """
     Extracts all the loops from all the functions in a binary.
+
+    Loops are the natural loops in the loop nesting forest of each function, as kept by the dominator index of the
+    knowledge base (`kb.dominators`), so they are shared with any other analysis that looks at the same functions.
+    Irreducible loops have no header that dominates them, and are not reported.
     """
 
     def __init__(self, functions=None, normalize=True):
@@ -51,123 +55,53 @@ class LoopFinder(Analysis):
             with self._resilience():
                 if normalize:
                     function.normalize()
-                tops, alls = self._parse_loops_from_graph(function.graph)
+                # loops only change when the function does
+                tops, alls = function.get_derived('loops', self._loops_from_nesting)
                 self.loops += alls
                 self.loops_hierarchy[function.addr] = tops
 
         if not found_any:
             l.error("No knowledge of functions is present. Did you forget to construct a CFG?")
 
-    def _parse_loop_graph(self, subg, bigg):
-        """
-        Create a Loop object for a strongly connected graph, and any strongly
-        connected subgraphs, if possible.
-
-        :param subg:    A strongly connected subgraph.
-        :param bigg:    The graph which subg is a subgraph of.
-
-        :return:        A list of Loop objects, some of which may be inside others,
-                        but all need to be documented.
-        """
-        loop_body_nodes = list(subg.nodes())[:]
-        entry_edges = []
-        break_edges = []
-        continue_edges = []
-        entry_node = None
-        for node in loop_body_nodes:
-            for pred_node in bigg.predecessors(node):
-                if pred_node not in loop_body_nodes:
-                    if entry_node is not None and entry_node != node:
-                        l.warning("Bad loop: more than one entry point (%s, %s)", entry_node, node)
-                        return None, []
-                    entry_node = node
-                    entry_edges.append((pred_node, node))
-                    subg.add_edge(pred_node, node)
-            for succ_node in bigg.successors(node):
-                if succ_node not in loop_body_nodes:
-                    break_edges.append((node, succ_node))
-                    subg.add_edge(node, succ_node)
-        if entry_node is None:
-            entry_node = min(loop_body_nodes, key=lambda n: n.addr)
-            l.info("Couldn't find entry point, assuming it's the first by address (%s)", entry_node)
-
-        acyclic_subg = subg.copy()
-        for pred_node in subg.predecessors(entry_node):
-            if pred_node in loop_body_nodes:
-                continue_edge = (pred_node, entry_node)
-                acyclic_subg.remove_edge(*continue_edge)
-                continue_edges.append(continue_edge)
-
-        removed_exits = {}
-        removed_entries = {}
-        tops, alls = self._parse_loops_from_graph(acyclic_subg)
-        for subloop in tops:
-            if subloop.entry in loop_body_nodes:
-                # break existing entry edges, exit edges
-                # re-link in loop object
-                # the exception logic is to handle when you have two loops adjacent to each other
-                # you gotta link the two loops together and remove the dangling edge
-                for entry_edge in subloop.entry_edges:
-                    try:
-                        subg.remove_edge(*entry_edge)
-                    except networkx.NetworkXError:
-                        if entry_edge in removed_entries:
-                            subg.add_edge(removed_entries[entry_edge], subloop)
-                            try:
-                                subg.remove_edge(removed_entries[entry_edge], entry_edge[1])
-                            except networkx.NetworkXError:
-                                pass
-                        else:
-                            raise
-                    else:
-                        subg.add_edge(entry_edge[0], subloop)
-                        removed_entries[entry_edge] = subloop
-                for exit_edge in subloop.break_edges:
-                    try:
-                        subg.remove_edge(*exit_edge)
-                    except networkx.NetworkXError:
-                        if exit_edge in removed_entries:
-                            subg.add_edge(subloop, removed_entries[exit_edge])
-                            try:
-                                subg.remove_edge(exit_edge[0], removed_entries[exit_edge])
-                            except networkx.NetworkXError:
-                                pass
-                        else:
-                            raise
-                    else:
-                        subg.add_edge(subloop, exit_edge[1])
-                        removed_exits[exit_edge] = subloop
-                subg = next(filter(lambda g: entry_node in g.nodes(),
-                        networkx.weakly_connected_component_subgraphs(subg)))
-
-        me = Loop(entry_node,
-             entry_edges,
-             break_edges,
-             continue_edges,
-             loop_body_nodes,
-             subg,
-             tops[:])
-        return me, [me] + alls
-
-    def _parse_loops_from_graph(self, graph):
+    def _loops_from_nesting(self, function):
         """
-        Return all Loop instances that can be extracted from a graph.
-
-        :param graph:   The graph to analyze.
+        Create Loop objects for all natural loops of a function.
 
-        :return:        A list of all the Loop instances that were found in the graph.
+        :param function:    The function.
+        :return:            A list of the top-level loops, and a list of all loops with each loop before its subloops.
         """
-        outtop = []
-        outall = []
-        for subg in networkx.strongly_connected_component_subgraphs(graph):
-            if len(subg.nodes()) == 1:
-                if len(list(subg.successors(list(subg.nodes())[0]))) == 0:
-                    continue
-            thisloop, allloops = self._parse_loop_graph(subg, graph)
-            if thisloop is not None:
-                outall += allloops
-                outtop.append(thisloop)
-        return outtop, outall
+        graph = function.graph
+        nesting = self.kb.dominators.loops(function)
+
+        def _by_addr(node):
+            return getattr(node, 'addr', 0)
+
+        def _make_loop(natural, out):
+            body = natural.body
+            entry_edges = sorted(((pred, natural.header) for pred in graph.predecessors(natural.header)
+                                  if pred not in body), key=lambda e: _by_addr(e[0]))
+            continue_edges = sorted(((latch, natural.header) for latch in natural.latching_nodes),
+                                    key=lambda e: _by_addr(e[0]))
+            break_edges = sorted(((src, dst) for src in body for dst in graph.successors(src) if dst not in body),
+                                 key=lambda e: (_by_addr(e[0]), _by_addr(e[1])))
+
+            loop_graph = networkx.DiGraph(graph.subgraph(body))
+            for src, dst in entry_edges + break_edges:
+                loop_graph.add_edge(src, dst, **graph[src][dst])
+
+            index = len(out)
+            out.append(None)
+            children = sorted(natural.children, key=lambda c: _by_addr(c.header))
+            subloops = [ _make_loop(child, out) for child in children ]
+            loop = Loop(natural.header, entry_edges, break_edges, continue_edges, sorted(body, key=_by_addr),
+                        loop_graph, subloops)
+            out[index] = loop
+            return loop
+
+        alls = [ ]
+        toplevel = sorted(nesting.toplevel_loops, key=lambda n: _by_addr(n.header))
+        tops = [ _make_loop(natural, alls) for natural in toplevel ]
+        return tops, alls
 
 from angr.analyses import AnalysesHub
 AnalysesHub.register_default('LoopFinder', LoopFinder)
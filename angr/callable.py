@@ -1,7 +1,9 @@
 
 import pycparser
+import claripy
 
-from .calling_conventions import DEFAULT_CC
+from . import sim_options as o
+from .calling_conventions import DEFAULT_CC, PointerWrapper
 
 
 class Callable(object):
@@ -51,7 +53,7 @@ class Callable(object):
     def __call__(self, *args):
         self.perform_call(*args)
         if self.result_state is not None:
-            return self.result_state.solver.simplify(self._cc.get_return_val(self.result_state, stack_base=self.result_state.regs.sp - self._cc.STACKARG_SP_DIFF))
+            return self._get_return_val(self.result_state)
         else:
             return None
 
@@ -62,6 +64,67 @@ class Callable(object):
                     ret_addr=self._deadend_addr,
                     toc=self._toc)
 
+        self._run_state(state)
+
+    def call_many(self, arg_vectors, unicorn=True):
+        """
+        Call this Callable once for each of the given argument vectors.
+
+        The base state is prepared only once and snapshotted. Every call is performed on a copy of that snapshot with
+        only the arguments written into it, which is much cheaper than building a fresh call state each time. Results
+        are yielded as soon as each call finishes, in the order of `arg_vectors`.
+
+        :param arg_vectors: An iterable of argument sequences.
+        :param bool unicorn: Run calls whose arguments are all concrete with unicorn enabled.
+        :return:            A generator of return values, one for each argument vector. `result_state` and
+                            `result_path_group` are updated before each value is yielded.
+        """
+
+        snapshot = self._call_snapshot()
+
+        for args in arg_vectors:
+            state = snapshot.copy()
+            self._cc.setup_callsite(state, self._deadend_addr, args)
+            if unicorn and all(self._is_concrete_arg(arg) for arg in args):
+                state.options.add(o.UNICORN)
+
+            self.result_state = None
+            self._run_state(state)
+            if self.result_state is not None:
+                yield self._get_return_val(self.result_state)
+            else:
+                yield None
+
+    def _call_snapshot(self):
+        """
+        Build the state that every call of `call_many` is set up from, i.e. the call state without any arguments.
+        """
+
+        if self._base_state is None:
+            state = self._project.factory.blank_state(addr=self._addr)
+        else:
+            state = self._base_state.copy()
+            state.regs.ip = self._addr
+
+        if state.arch.name == 'PPC64' and self._toc is not None:
+            state.regs.r2 = self._toc
+
+        return state
+
+    @staticmethod
+    def _is_concrete_arg(arg):
+        if isinstance(arg, PointerWrapper):
+            return Callable._is_concrete_arg(arg.value)
+        if isinstance(arg, (list, tuple)):
+            return all(Callable._is_concrete_arg(a) for a in arg)
+        if isinstance(arg, claripy.ast.Base):
+            return not arg.symbolic
+        return isinstance(arg, (int, float, bytes, str))
+
+    def _get_return_val(self, state):
+        return state.solver.simplify(self._cc.get_return_val(state, stack_base=state.regs.sp - self._cc.STACKARG_SP_DIFF))
+
+    def _run_state(self, state):
         def step_func(pg):
             pg2 = pg.prune()
             if len(pg2.active) > 1:
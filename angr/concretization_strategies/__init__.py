@@ -1,3 +1,5 @@
+import claripy
+
 class SimConcretizationStrategy(object):
     """
     Concretization strategies control the resolution of symbolic memory indices
@@ -22,32 +24,101 @@ class SimConcretizationStrategy(object):
         """
         Gets the minimum solution of an address.
         """
-        return memory.state.solver.min(addr, exact=kwargs.pop('exact', self._exact), **kwargs)
+        return self._solve(memory, 'min', addr, **kwargs)
 
     def _max(self, memory, addr, **kwargs):
         """
         Gets the maximum solution of an address.
         """
-        return memory.state.solver.max(addr, exact=kwargs.pop('exact', self._exact), **kwargs)
+        return self._solve(memory, 'max', addr, **kwargs)
 
     def _any(self, memory, addr, **kwargs):
         """
         Gets any solution of an address.
         """
-        return memory.state.solver.eval(addr, exact=kwargs.pop('exact', self._exact), **kwargs)
+        return self._solve(memory, 'any', addr, **kwargs)
 
     def _eval(self, memory, addr, n, **kwargs):
         """
         Gets n solutions for an address.
         """
-        return memory.state.solver.eval_upto(addr, n, exact=kwargs.pop('exact', self._exact), **kwargs)
+        return self._solve(memory, 'eval', addr, n=n, **kwargs)
 
     def _range(self, memory, addr, **kwargs):
         """
         Gets the (min, max) range of solutions for an address.
         """
+        if not kwargs:
+            # if another strategy has already found all solutions of the address in this block, the range is known
+            solutions = self._cached_solutions(memory, addr)
+            if solutions:
+                return min(solutions), max(solutions)
         return (self._min(memory, addr, **kwargs), self._max(memory, addr, **kwargs))
 
+    def _cached_solutions(self, memory, addr):
+        """
+        Look up a cached result of an eval query that returned all solutions of an address, without running a query.
+
+        :return:    The solutions, or None if no such result is cached.
+        """
+        if not isinstance(addr, claripy.ast.Base):
+            return None
+
+        cache = memory.state.scratch.concretization_cache
+        constraints = memory.state.solver.constraints
+        if cache.get('version', None) != (len(constraints), constraints[-1] if constraints else None):
+            return None
+
+        addr_hash = hash(addr)
+        for key, (cached_addr, r) in cache.items():
+            if key == 'version' or cached_addr is not addr:
+                continue
+            query, h, n, exact = key
+            # fewer solutions than were asked for means that these are all of them
+            if query == 'eval' and h == addr_hash and exact and len(r) < n:
+                return r
+        return None
+
+    def _solve(self, memory, query, addr, n=None, **kwargs):
+        """
+        Run a solver query on an address. Results of queries without extra constraints are cached in the scratch of
+        the state for the duration of the current block, as long as the constraints of the state do not change, so
+        that addresses accessed several times in a block (or by several strategies) are only solved once.
+        """
+        solver = memory.state.solver
+        exact = kwargs.pop('exact', self._exact)
+
+        if kwargs or not isinstance(addr, claripy.ast.Base):
+            return self._solve_uncached(solver, query, addr, n, exact, **kwargs)
+
+        cache = memory.state.scratch.concretization_cache
+        constraints = solver.constraints
+        version = (len(constraints), constraints[-1] if constraints else None)
+        if cache.get('version', None) != version:
+            cache.clear()
+            cache['version'] = version
+
+        key = (query, hash(addr), n, exact)
+        cached = cache.get(key, None)
+        # ASTs are hash-consed, so comparing identities rules out hash collisions
+        if cached is not None and cached[0] is addr:
+            return cached[1]
+
+        r = self._solve_uncached(solver, query, addr, n, exact)
+        cache[key] = (addr, r)
+        return r
+
+    @staticmethod
+    def _solve_uncached(solver, query, addr, n, exact, **kwargs):
+        if query == 'min':
+            return solver.min(addr, exact=exact, **kwargs)
+        elif query == 'max':
+            return solver.max(addr, exact=exact, **kwargs)
+        elif query == 'any':
+            return solver.eval(addr, exact=exact, **kwargs)
+        else:
+            return solver.eval_upto(addr, n, exact=exact, **kwargs)
+
     def concretize(self, memory, addr):
         """
         Concretizes the address into a list of values.
@@ -1,3 +1,4 @@
+import time
 import logging
 
 from ..engines import SimEngine
@@ -77,6 +78,10 @@ class SimEngineUnicorn(SimEngine):
             unicorn.countdown_symbolic_registers = unicorn.cooldown_symbolic_registers
             return False
 
+        if o.UNICORN_ADAPTIVE_HANDOFF in state.options and not unicorn.handoff.should_enter(state.addr):
+            l.info("handing off to unicorn at %#x has not been profitable", state.addr)
+            return False
+
         return True
 
     def _process(self, state, successors, step, extra_stop_points):
@@ -108,6 +113,7 @@ class SimEngineUnicorn(SimEngine):
                 extra_stop_points.add(bp.kwargs["instruction"])
 
         # initialize unicorn plugin
+        start_time = time.time()
         state.unicorn.setup()
         try:
             state.unicorn.set_stops(extra_stop_points)
@@ -119,6 +125,10 @@ class SimEngineUnicorn(SimEngine):
         finally:
             state.unicorn.destroy()
 
+        total_time = time.time() - start_time
+        state.unicorn.handoff.record(successors.addr, state.unicorn.steps, total_time - state.unicorn.time,
+                                     state.unicorn.time)
+
         if state.unicorn.steps == 0 or state.unicorn.stop_reason == STOP.STOP_NOSTART:
             # fail out, force fallback to next engine
             successors.initial_state.unicorn.countdown_symbolic_memory = state.unicorn.countdown_symbolic_memory
@@ -243,6 +243,7 @@ class SimEngineVEX(SimEngine):
 
         # set the current basic block address that's being processed
         state.scratch.bbl_addr = irsb.addr
+        state.scratch.concretization_cache = { }
 
         for stmt_idx, stmt in enumerate(ss):
             if isinstance(stmt, pyvex.IRStmt.IMark):
@@ -1,6 +1,7 @@
 from .base import SimIRExpr
 from .... import sim_options as o
 from ....state_plugins.sim_action import SimActionData
+from ....state_plugins.register_array import SimRegisterArray
 
 class SimIRExpr_Get(SimIRExpr):
     def _execute(self):
@@ -9,7 +10,11 @@ class SimIRExpr_Get(SimIRExpr):
         self.type = self._expr.type
 
         # get it!
-        self.expr = self.state.registers.load(self._expr.offset, size)
+        registers = self.state.registers
+        if isinstance(registers, SimRegisterArray) and registers.direct_access:
+            self.expr = registers.get(self._expr.offset, size)
+        else:
+            self.expr = registers.load(self._expr.offset, size)
 
         if self.type.startswith('Ity_F'):
             self.expr = self.expr.raw_to_fp()
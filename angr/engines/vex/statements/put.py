@@ -2,6 +2,7 @@ from . import SimIRStmt
 from .... import sim_options as o
 from ....state_plugins.sim_action_object import SimActionObject
 from ....state_plugins.sim_action import SimActionData
+from ....state_plugins.register_array import SimRegisterArray
 
 class SimIRStmt_Put(SimIRStmt):
     def _execute(self):
@@ -19,4 +20,8 @@ class SimIRStmt_Put(SimIRStmt):
 
         # do the put (if we should)
         if o.DO_PUTS in self.state.options:
-            self.state.registers.store(self.stmt.offset, data.expr, action=a)
+            registers = self.state.registers
+            if a is None and isinstance(registers, SimRegisterArray) and registers.direct_access:
+                registers.put(self.stmt.offset, data.expr)
+            else:
+                registers.store(self.stmt.offset, data.expr, action=a)
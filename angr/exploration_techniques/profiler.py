@@ -0,0 +1,171 @@
+import time
+from collections import defaultdict
+
+from . import ExplorationTechnique
+from ..misc import profiling
+
+
+class StepProfile(object):
+    """
+    What has been spent on the steps taken from one address.
+    """
+
+    __slots__ = ('addr', 'sort', 'procedure', 'function', 'steps', 'time', 'solver_queries', 'solver_time',
+                 'memory_loads', 'memory_stores', 'successors')
+
+    def __init__(self, addr, sort, procedure, function):
+        self.addr = addr
+        self.sort = sort                # the kind of step, e.g. IRSB, SimProcedure or Unicorn
+        self.procedure = procedure      # the name of the SimProcedure that was run, if any
+        self.function = function        # the address of the function the steps were taken in
+        self.steps = 0
+        self.time = 0.
+        self.solver_queries = 0
+        self.solver_time = 0.
+        self.memory_loads = 0
+        self.memory_stores = 0
+        self.successors = 0
+
+    def __repr__(self):
+        return "<StepProfile %#x (%s): %d steps, %.3fs, %d solver queries>" % (
+            self.addr, self.procedure or self.sort, self.steps, self.time, self.solver_queries)
+
+
+class Profiler(ExplorationTechnique):
+    """
+    Attributes where the time of symbolic execution goes.
+
+    For every step, the wall time, the number and duration of solver queries, the number of memory loads and stores and
+    the number of successors are recorded, keyed by the address the step was taken from. Steps that run a SimProcedure
+    (including syscalls) are labelled with its name, and steps in unicorn are labelled as such, with everything
+    unicorn executed attributed to the address where it was entered. The call stacks the steps were taken in are
+    recorded as well, so that a flame graph can be drawn.
+
+    The profiler only counts, so its overhead is a few timer calls and dictionary updates per step. Profiling a
+    simulation manager is enabled by using this technique.
+    """
+
+    def __init__(self):
+        super(Profiler, self).__init__()
+        self.profiles = { }
+        self.total_time = 0.
+        self._stacks = defaultdict(float)
+
+    def successors(self, simgr, state, **kwargs):
+        if profiling.enabled:
+            # another profiler is already counting this step
+            return simgr.successors(state, **kwargs)
+
+        solver_queries, solver_time = profiling.solver_queries, profiling.solver_time
+        memory_loads, memory_stores = profiling.memory_loads, profiling.memory_stores
+        succs = None
+        profiling.enabled = True
+        start = time.time()
+        try:
+            succs = simgr.successors(state, **kwargs)
+            return succs
+        finally:
+            elapsed = time.time() - start
+            profiling.enabled = False
+
+            if succs is not None:
+                sort = succs.sort
+                procedure = succs.artifacts.get('procedure', None)
+                procedure = procedure.display_name if procedure is not None else None
+            else:
+                sort, procedure = 'error', None
+
+            addr = state.addr
+            profile = self.profiles.get(addr, None)
+            if profile is None:
+                profile = self.profiles[addr] = StepProfile(addr, sort, procedure, state.callstack.func_addr)
+            profile.steps += 1
+            profile.time += elapsed
+            profile.solver_queries += profiling.solver_queries - solver_queries
+            profile.solver_time += profiling.solver_time - solver_time
+            profile.memory_loads += profiling.memory_loads - memory_loads
+            profile.memory_stores += profiling.memory_stores - memory_stores
+            if succs is not None:
+                profile.successors += len(succs.all_successors)
+            self.total_time += elapsed
+
+            self._stacks[(tuple(frame.func_addr for frame in state.callstack), addr)] += elapsed
+
+    #
+    # Reports
+    #
+
+    def hot_blocks(self, n=20, key='time'):
+        """
+        Get the addresses that the most has been spent on.
+
+        :param int n:   The number of profiles to return.
+        :param str key: The StepProfile attribute to sort by, e.g. 'time', 'solver_time' or 'steps'.
+        :return:        A list of StepProfile, the most expensive first.
+        :rtype:         list
+        """
+        return sorted(self.profiles.values(), key=lambda p: getattr(p, key), reverse=True)[:n]
+
+    def report(self, n=20, key='time'):
+        """
+        Format a table of the addresses that the most has been spent on.
+
+        :param int n:   The number of rows.
+        :param str key: The StepProfile attribute to sort by.
+        :return:        The table.
+        :rtype:         str
+        """
+        lines = [ "%-12s %-24s %-24s %8s %10s %6s %8s %10s %8s %8s %8s" % (
+            "address", "function", "block", "steps", "time", "%", "queries", "solver", "loads", "stores", "succs") ]
+        for p in self.hot_blocks(n=n, key=key):
+            lines.append("%-12s %-24s %-24s %8d %10.4f %6.2f %8d %10.4f %8d %8d %8d" % (
+                "%#x" % p.addr,
+                self._function_name(p.function)[:24],
+                (p.procedure or p.sort or '')[:24],
+                p.steps,
+                p.time,
+                100. * p.time / self.total_time if self.total_time else 0.,
+                p.solver_queries,
+                p.solver_time,
+                p.memory_loads,
+                p.memory_stores,
+                p.successors,
+            ))
+        return "\n".join(lines)
+
+    def folded_stacks(self):
+        """
+        Get the time spent in each call stack in the folded format of flamegraph.pl: one line per stack, with the
+        frames from the outermost to the innermost separated by semicolons, followed by the time in microseconds.
+
+        :return:    The lines.
+        :rtype:     list
+        """
+        lines = [ ]
+        for (stack, addr), elapsed in sorted(self._stacks.items()):
+            frames = [ self._function_name(func_addr) for func_addr in reversed(stack) ]
+            profile = self.profiles[addr]
+            frames.append(profile.procedure or "%#x" % addr)
+            lines.append("%s %d" % (";".join(frames), int(elapsed * 1000000)))
+        return lines
+
+    def dump_flamegraph(self, path):
+        """
+        Write the folded call stacks to a file, to be turned into a flame graph with flamegraph.pl.
+
+        :param str path:    The path of the file.
+        """
+        with open(path, 'w') as f:
+            for line in self.folded_stacks():
+                f.write(line + "\n")
+
+    def _function_name(self, func_addr):
+        if func_addr is None:
+            return "unknown"
+        if self.project is not None:
+            if self.project.is_hooked(func_addr):
+                return self.project.hooked_by(func_addr).display_name
+            func = self.project.kb.functions.function(addr=func_addr)
+            if func is not None:
+                return func.name
+        return "sub_%x" % func_addr
@@ -2,6 +2,11 @@ import angr
 from typing import List
 import logging
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from . import ExplorationTechnique
 from .. import BP_BEFORE, BP_AFTER, sim_options
 from ..errors import AngrTracerError
@@ -179,16 +184,15 @@ class Tracer(ExplorationTechnique):
             if sync is not None:
                 raise Exception("TODO")
 
-            for addr in state.history.recent_bbl_addrs:
-                if addr == state.unicorn.transmit_addr:
-                    continue
+            transmit_addr = state.unicorn.transmit_addr
+            block_addrs = [addr for addr in state.history.recent_bbl_addrs if addr != transmit_addr]
 
-                if self._compare_addr(self._trace[idx], addr):
-                    idx += 1
-                else:
-                    raise Exception('BUG! Please investigate the claim in the comment above me')
+            divergence = self._compare_addr_run(idx, block_addrs)
+            if divergence is not None:
+                raise Exception('BUG! Please investigate the claim in the comment above me (diverged at block %d of %d)'
+                                % (divergence, len(block_addrs)))
 
-            idx -= 1 # use normal code to do the last synchronization
+            idx += len(block_addrs) - 1 # use normal code to do the last synchronization
 
         if sync is not None:
             timer -= 1
@@ -274,6 +278,107 @@ class Tracer(ExplorationTechnique):
             else:
                 raise AngrTracerError("Trace desynced on jumping into %s. Did you load the right version of this library?" % current_bin.provides)
 
+    def _compare_addr_run(self, trace_idx, state_addrs):
+        """
+        Compare a run of consecutive block addresses (e.g. everything unicorn executed in one step) against the trace
+        starting at `trace_idx`. ASLR slides are looked up once per run of blocks inside the same object instead of once
+        per block, and the comparison itself is done in a single vectorized operation when numpy is available. A block
+        that the batched comparison rejects is checked again with `_compare_addr`, so that the result is always the same
+        as comparing the blocks one by one.
+
+        :param int trace_idx:       Index in the trace that the first address should match.
+        :param list state_addrs:    Untranslated block addresses, in execution order.
+        :return:                    The index in `state_addrs` of the first block that diverges from the trace, or None
+                                    if the whole run follows the trace.
+        """
+        count = len(state_addrs)
+        start = 0
+
+        while start < count:
+            addrs = state_addrs[start:]
+            slides = self._slides_for_run(trace_idx + start, addrs)
+            mismatch = self._first_mismatch(trace_idx + start, addrs, slides)
+
+            if mismatch is None:
+                if len(slides) < len(addrs):
+                    # either the trace ended before the run did, or the run jumped into an object that does not match
+                    # the trace
+                    return start + len(slides)
+                return None
+
+            idx = start + mismatch
+            if not self._compare_addr(self._trace[trace_idx + idx], state_addrs[idx]):
+                return idx
+            start = idx + 1
+
+        return None
+
+    def _first_mismatch(self, trace_idx, state_addrs, slides):
+        """
+        Find the first block of a run whose address, translated with its slide, is not the one in the trace.
+
+        :return:    The index of the block, or None if all blocks that have a slide match the trace.
+        """
+        count = len(slides)
+        trace_slice = self._trace[trace_idx:trace_idx + count]
+
+        if numpy is not None:
+            mask = (1 << 64) - 1
+            addrs = numpy.array(state_addrs[:count], dtype=numpy.uint64)
+            translated = addrs + numpy.array([s & mask if s is not None else 0 for s in slides], dtype=numpy.uint64)
+            matches = translated == numpy.array(trace_slice, dtype=numpy.uint64)
+            matches &= numpy.array([s is not None for s in slides], dtype=bool)
+            mismatches = numpy.flatnonzero(~matches)
+            if len(mismatches):
+                return int(mismatches[0])
+        else:
+            for i, (addr, slide, trace_addr) in enumerate(zip(state_addrs, slides, trace_slice)):
+                if slide is None or trace_addr != addr + slide:
+                    return i
+
+        return None
+
+    def _slides_for_run(self, trace_idx, state_addrs):
+        """
+        Determine the ASLR slide for every address of a run of blocks, walking the run object by object, in the same
+        way as `_compare_addr` would for each block.
+
+        :return:    A list of slides (None for addresses that cannot match the trace). It is truncated at the end of the
+                    trace, or at the first block that jumps into a new object which cannot be matched against the trace.
+        """
+        loader = self.project.loader
+        count = min(len(state_addrs), len(self._trace) - trace_idx)
+        slides = [ ]
+
+        i = 0
+        while i < count:
+            addr = state_addrs[i]
+            obj = loader.find_object_containing(addr)
+
+            if obj is None or obj is loader._extern_object or obj is loader._kernel_object:
+                # these never get a slide of their own, but _compare_addr accepts them at the current slide
+                slide = self._current_slide
+            elif obj in self._aslr_slides:
+                slide = self._current_slide = self._aslr_slides[obj]
+            else:
+                # first time we see this object - let the scalar path learn (or reject) its slide
+                if not self._compare_addr(self._trace[trace_idx + i], addr):
+                    return slides
+                # _compare_addr does not record anything when the object is at the current slide
+                slide = self._current_slide = self._aslr_slides.setdefault(obj, self._current_slide)
+
+            # extend the run as long as we stay inside the same object
+            j = i + 1
+            if obj is not None:
+                min_addr, max_addr = obj.min_addr, obj.max_addr
+                while j < count and min_addr <= state_addrs[j] <= max_addr:
+                    j += 1
+
+            slides.extend([slide] * (j - i))
+            i = j
+
+        return slides
+
     def _analyze_misfollow(self, state, idx):
         angr_addr = state.addr
         obj = self.project.loader.find_object_containing(angr_addr)
@@ -1,4 +1,8 @@
 import logging
+from collections import Counter
+
+import claripy
+from cachetools import LRUCache
 
 from .sim_state import SimState
 from .calling_conventions import DEFAULT_CC, SimRegArg, SimStackArg, PointerWrapper
@@ -17,6 +21,18 @@ class AngrObjectFactory(object):
         self.project = project
         self._default_cc = DEFAULT_CC[project.arch.name]
 
+        # initialized states that templated states are copied from, keyed by the parameters they were built with
+        self._state_templates = LRUCache(maxsize=64)
+        self.state_template_stats = Counter()
+
+    def __getstate__(self):
+        s = dict(self.__dict__)
+        s['_state_templates'] = LRUCache(maxsize=64)
+        return s
+
+    def __setstate__(self, s):
+        self.__dict__.update(s)
+
     @property
     def default_engine(self):
         return self.project.engines.default_engine
@@ -59,10 +75,14 @@ class AngrObjectFactory(object):
         :param concrete_fs:     bool describing whether the host filesystem should be consulted when opening files.
         :param chroot:          A path to use as a fake root directory, Behaves similarly to a real chroot. Used only
                                 when concrete_fs is set to True.
+        :param template:        Copy the state from a cached template built with the same parameters, see
+                                :meth:`clear_state_templates()`.
         :param kwargs:          Any additional keyword args will be passed to the SimState constructor.
         :return:                The blank state.
         :rtype:                 SimState
         """
+        if kwargs.pop('template', False):
+            return self._templated_state('blank', self.project.simos.state_blank, kwargs)
         return self.project.simos.state_blank(**kwargs)
 
     def entry_state(self, **kwargs):
@@ -81,10 +101,14 @@ class AngrObjectFactory(object):
         :param args:            a list of values to use as the program's argv. May be mixed strings and bitvectors.
         :param env:             a dictionary to use as the environment for the program. Both keys and values may be
                                 mixed strings and bitvectors.
+        :param template:        Copy the state from a cached template built with the same parameters, see
+                                :meth:`clear_state_templates()`.
         :return:                The entry state.
         :rtype:                 SimState
         """
 
+        if kwargs.pop('template', False):
+            return self._templated_state('entry', self.project.simos.state_entry, kwargs)
         return self.project.simos.state_entry(**kwargs)
 
     def full_init_state(self, **kwargs):
@@ -105,9 +129,13 @@ class AngrObjectFactory(object):
         :param args:            a list of values to use as arguments to the program. May be mixed strings and bitvectors.
         :param env:             a dictionary to use as the environment for the program. Both keys and values may be
                                 mixed strings and bitvectors.
+        :param template:        Copy the state from a cached template built with the same parameters, see
+                                :meth:`clear_state_templates()`.
         :return:                The fully initialized state.
         :rtype:                 SimState
         """
+        if kwargs.pop('template', False):
+            return self._templated_state('full_init', self.project.simos.state_full_init, kwargs)
         return self.project.simos.state_full_init(**kwargs)
 
     def call_state(self, addr, *args, **kwargs):
@@ -132,6 +160,8 @@ class AngrObjectFactory(object):
         :param concrete_fs:     bool describing whether the host filesystem should be consulted when opening files.
         :param chroot:          A path to use as a fake root directory, Behaves similarly to a real chroot. Used only
                                 when concrete_fs is set to True.
+        :param template:        Set up the call on a copy of a cached blank state template built with the same
+                                parameters, see :meth:`clear_state_templates()`. Cannot be combined with base_state.
         :param kwargs:          Any additional keyword args will be passed to the SimState constructor.
         :return:                The state at the beginning of the function.
         :rtype:                 SimState
@@ -152,8 +182,110 @@ class AngrObjectFactory(object):
         set alloc_base to point to somewhere other than the stack, set grow_like_stack to False so that sequencial
         allocations happen at increasing addresses.
         """
+        if kwargs.pop('template', False) and kwargs.get('base_state', None) is None:
+            call_kwargs = { }
+            for k in ('cc', 'toc', 'ret_addr', 'stack_base', 'alloc_base', 'grow_like_stack'):
+                if k in kwargs:
+                    call_kwargs[k] = kwargs.pop(k)
+            kwargs['addr'] = addr
+            base_state = self._templated_state('call', self.project.simos.state_blank, kwargs)
+            # state_call() copies the base state once more, so do not hand out the template itself
+            return self.project.simos.state_call(addr, *args, base_state=base_state, **call_kwargs)
         return self.project.simos.state_call(addr, *args, **kwargs)
 
+    def clear_state_templates(self):
+        """
+        Drop all cached state templates.
+
+        States requested with `template=True` are copies of an initialized state that is built only once for each set
+        of parameters and kept unmodified afterwards. Since states are copied on write, this is much cheaper than
+        building a fresh state, i.e. setting up plugins, the file system, argv, envp and auxv on the stack and TLS.
+        The stdin parameter is not part of the template, it is installed on each copy. `state_template_stats` counts
+        cold builds ('cold'), template hits ('hit') and requests whose parameters cannot be used as a cache key
+        ('uncacheable').
+
+        Templates have to be cleared manually when anything they were built from changes, e.g. the memory of the
+        loaded objects.
+        """
+        self._state_templates.clear()
+
+    def _templated_state(self, kind, builder, kwargs):
+        """
+        Get a copy of the template state built by `builder(**kwargs)`, building the template if needed.
+
+        :param str kind:    The kind of state, part of the cache key.
+        :param builder:     The SimOS method that builds the state.
+        :param dict kwargs: The parameters to build the state with.
+        :return:            A new state.
+        :rtype:             SimState
+        """
+        stdin = kwargs.pop('stdin', None)
+
+        try:
+            key = (kind, ) + tuple((k, self._template_key(kwargs[k])) for k in sorted(kwargs))
+            hash(key)
+        except TypeError:
+            self.state_template_stats['uncacheable'] += 1
+            if stdin is not None:
+                kwargs['stdin'] = stdin
+            return builder(**kwargs)
+
+        template = self._state_templates.get(key, None)
+        if template is None:
+            self.state_template_stats['cold'] += 1
+            template = builder(**kwargs)
+            self._state_templates[key] = template
+        else:
+            self.state_template_stats['hit'] += 1
+
+        state = template.copy()
+        if stdin is not None:
+            self._install_stdin(state, stdin)
+        return state
+
+    @staticmethod
+    def _template_key(obj):
+        """
+        Turn the parameters of a state into something hashable. Raises TypeError if that is not possible.
+        """
+        if isinstance(obj, dict):
+            # keep the order, e.g. the order of environment variables determines the layout of the stack
+            return (dict, ) + tuple((AngrObjectFactory._template_key(k), AngrObjectFactory._template_key(v))
+                                    for k, v in obj.items())
+        if isinstance(obj, (list, tuple)):
+            return (type(obj), ) + tuple(AngrObjectFactory._template_key(v) for v in obj)
+        if isinstance(obj, (set, frozenset)):
+            return frozenset(AngrObjectFactory._template_key(v) for v in obj)
+        if isinstance(obj, claripy.ast.Base):
+            # ASTs cannot be compared with ==
+            return obj.cache_key
+        if isinstance(obj, (int, float, bool, str, bytes, type(None), type)):
+            return obj
+        # anything else (SimFiles, plugins, ...) may be mutable, so two of them are only the same if they are identical
+        raise TypeError("Cannot use an object of type %s in a state template key" % type(obj))
+
+    @staticmethod
+    def _install_stdin(state, stdin):
+        """
+        Replace the stdin of a state, accepting the same values as the stdin parameter of
+        :meth:`SimOS.state_blank()`.
+        """
+        if not isinstance(stdin, SimFileBase):
+            if type(stdin) is type:
+                stdin = stdin(name='stdin', has_end=False)
+            else:
+                stdin = SimFileStream(name='stdin', content=stdin, has_end=True)
+
+        posix = state.posix
+        old_stdin = posix.stdin
+        posix.stdin = stdin
+        stdin.set_state(state)
+        for fd in posix.fd.values():
+            if isinstance(fd, SimFileDescriptorDuplex) and fd._read_file is old_stdin:
+                fd._read_file = stdin
+            elif isinstance(fd, SimFileDescriptor) and fd.file is old_stdin:
+                fd.file = stdin
+
     def simulation_manager(self, thing=None, **kwargs):
         """
         Constructs a new simulation manager.
@@ -188,6 +320,20 @@ class AngrObjectFactory(object):
         """
         return self.simulation_manager(*args, **kwargs)
 
+    def snapshot(self, checkpoint, state=None, **kwargs):
+        """
+        Execute a state until it reaches a checkpoint, and freeze it so that many states can be forked from it. This
+        saves executing the same concrete prefix of a program once for every set of symbolic inputs.
+
+        :param checkpoint:      The checkpoint. Any value accepted by the "find" parameter of
+                                :meth:`SimulationManager.explore()`, e.g. an address.
+        :param state:           The state to start from. Defaults to :meth:`entry_state()`.
+        :param kwargs:          Any additional keyword arguments will be passed to :meth:`SimulationManager.explore()`.
+        :returns:               The snapshot.
+        :rtype:                 angr.state_snapshot.StateSnapshot
+        """
+        return self.simulation_manager(state).snapshot(checkpoint, **kwargs)
+
     def callable(self, addr, concrete_only=False, perform_merge=True, base_state=None, toc=None, cc=None):
         """
         A Callable is a representation of a function in the binary that can be interacted with like a native python
@@ -306,3 +452,4 @@ from .errors import AngrError
 from .sim_manager import SimulationManager
 from .codenode import HookNode
 from .block import Block
+from .storage.file import SimFileBase, SimFileStream, SimFileDescriptor, SimFileDescriptorDuplex
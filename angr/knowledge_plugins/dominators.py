@@ -0,0 +1,95 @@
+import networkx
+
+from .plugin import KnowledgeBasePlugin
+from .functions import Function
+from ..utils.graph import Dominators, LoopNesting, TemporaryNode
+
+
+class DominatorIndex(KnowledgeBasePlugin):
+    """
+    Dominators, post-dominators, and loop nesting of functions in the knowledge base.
+
+    Everything is computed on demand and cached on the function itself, so the results are shared by all analyses until
+    the transition graph of the function changes. Functions can be given either as Function instances or as addresses.
+    """
+
+    def __init__(self, kb):
+        super(DominatorIndex, self).__init__()
+        self._kb = kb
+
+    def copy(self):
+        return DominatorIndex(self._kb)
+
+    def _function(self, func):
+        if isinstance(func, Function):
+            return func
+        return self._kb.functions[func]
+
+    #
+    # Public methods
+    #
+
+    def dominators(self, func):
+        """
+        Get the dominator tree of a function.
+
+        :param func:    The function, or its address.
+        :return:        A Dominators instance.
+        :rtype:         angr.utils.graph.Dominators
+        """
+
+        return self._function(func).get_derived('dominators', lambda f: Dominators(f.graph, f.startpoint))
+
+    def post_dominators(self, func):
+        """
+        Get the post-dominator tree of a function. If the function has more than one exit, all exits are immediately
+        post-dominated by a virtual end node (a TemporaryNode). Nodes that cannot reach any exit, like the ones inside
+        an infinite loop, are not post-dominated by anything.
+
+        :param func:    The function, or its address.
+        :return:        A Dominators instance.
+        :rtype:         angr.utils.graph.Dominators
+        """
+
+        return self._function(func).get_derived('post_dominators', self._build_post_dominators)
+
+    def loops(self, func):
+        """
+        Get the loop nesting forest of a function.
+
+        :param func:    The function, or its address.
+        :return:        A LoopNesting instance.
+        :rtype:         angr.utils.graph.LoopNesting
+        """
+
+        func = self._function(func)
+        return func.get_derived('loop_nesting', lambda f: LoopNesting(f.graph, self.dominators(f)))
+
+    def dominates(self, func, dominator_node, node):
+        return self.dominators(func).dominates(dominator_node, node)
+
+    def post_dominates(self, func, post_dominator_node, node):
+        return self.post_dominators(func).dominates(post_dominator_node, node)
+
+    #
+    # Private methods
+    #
+
+    @staticmethod
+    def _build_post_dominators(func):
+
+        graph = func.graph
+        exits = [ n for n in graph.nodes() if graph.out_degree(n) == 0 ]
+
+        if len(exits) == 1:
+            return Dominators(graph, exits[0], reverse=True)
+
+        # add a virtual end node that all exits jump to
+        end_node = TemporaryNode('end_node')
+        graph = networkx.DiGraph(graph)
+        for n in exits:
+            graph.add_edge(n, end_node)
+        return Dominators(graph, end_node, reverse=True)
+
+
+KnowledgeBasePlugin.register_default('dominators', DominatorIndex)
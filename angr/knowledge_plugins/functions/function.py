@@ -18,7 +18,8 @@ class Function(object):
     A representation of a function and various information about it.
     """
 
-    __slots__ = ('transition_graph', '_local_transition_graph', 'normalized', '_ret_sites', '_jumpout_sites',
+    __slots__ = ('transition_graph', '_local_transition_graph', '_graph_version', '_graph_cache',
+                 '_normalized_version', '_ret_sites', '_jumpout_sites',
                  '_callout_sites', '_endpoints', '_call_sites', '_retout_sites', 'addr', '_function_manager',
                  'is_syscall', '_project', 'is_plt', 'addr', 'is_simprocedure', '_name', 'binary_name',
                  '_argument_registers', '_argument_stack_variables',
@@ -38,7 +39,10 @@ class Function(object):
         """
         self.transition_graph = networkx.DiGraph()
         self._local_transition_graph = None
-        self.normalized = False
+        # incremented whenever the transition graph changes. data derived from the graph is only valid for one version
+        self._graph_version = 0
+        self._graph_cache = { }
+        self._normalized_version = None
 
         # block nodes at whose ends the function returns
         self._ret_sites = set()
@@ -171,6 +175,24 @@ class Function(object):
     def returning(self, v):
         self._returning = v
 
+    @property
+    def normalized(self):
+        """
+        Whether the function has been normalized and has not changed since.
+        """
+        return self._normalized_version == self._graph_version
+
+    @normalized.setter
+    def normalized(self, v):
+        self._normalized_version = self._graph_version if v else None
+
+    @property
+    def graph_version(self):
+        """
+        The version of the transition graph of this function. It changes whenever the transition graph changes.
+        """
+        return self._graph_version
+
     @property
     def blocks(self):
         """
@@ -518,6 +540,14 @@ class Function(object):
         self._block_sizes = {}
         self.startpoint = None
         self.transition_graph = networkx.DiGraph()
+        self._invalidate_graphs()
+
+    def _invalidate_graphs(self):
+        """
+        Drop the local transition graph and everything derived from it. Must be called whenever the transition graph
+        changes.
+        """
+        self._graph_version += 1
         self._local_transition_graph = None
 
     def _confirm_fakeret(self, src, dst):
@@ -535,6 +565,7 @@ class Function(object):
             self._register_nodes(True, dst)
 
         self.transition_graph[src][dst]['confirmed'] = True
+        self._invalidate_graphs()
 
     def _transit_to(self, from_node, to_node, outside=False, ins_addr=None, stmt_idx=None):
         """
@@ -571,7 +602,7 @@ class Function(object):
             self._add_endpoint(from_node, 'transition')
 
         # clear the cache
-        self._local_transition_graph = None
+        self._invalidate_graphs()
 
     def _call_to(self, from_node, to_func, ret_node, stmt_idx=None, ins_addr=None, return_to_outside=False):
         """
@@ -599,7 +630,7 @@ class Function(object):
             if ret_node is not None:
                 self._fakeret_to(from_node, ret_node, to_outside=return_to_outside)
 
-        self._local_transition_graph = None
+        self._invalidate_graphs()
 
     def _fakeret_to(self, from_node, to_node, confirmed=None, to_outside=False):
         self._register_nodes(True, from_node)
@@ -613,12 +644,12 @@ class Function(object):
             if confirmed:
                 self._register_nodes(not to_outside, to_node)
 
-        self._local_transition_graph = None
+        self._invalidate_graphs()
 
     def _remove_fakeret(self, from_node, to_node):
         self.transition_graph.remove_edge(from_node, to_node)
 
-        self._local_transition_graph = None
+        self._invalidate_graphs()
 
     def _return_from_call(self, from_func, to_node, to_outside=False):
         self.transition_graph.add_edge(from_func, to_node, type='real_return', to_outside=to_outside)
@@ -626,12 +657,14 @@ class Function(object):
             if 'type' in data and data['type'] == 'fake_return':
                 data['confirmed'] = True
 
-        self._local_transition_graph = None
+        self._invalidate_graphs()
 
     def _register_nodes(self, is_local, *nodes):
         if not isinstance(is_local, bool):
             raise AngrValueError('_register_nodes(): the "is_local" parameter must be a bool')
 
+        self._invalidate_graphs()
+
         for node in nodes:
             self.transition_graph.add_node(node)
             node._graph = self.transition_graph
@@ -805,6 +838,26 @@ class Function(object):
 
         return g
 
+    def get_derived(self, key, builder):
+        """
+        Get data derived from the graph of this function, e.g. its loops or dominators. The data is computed by calling
+        `builder(self)` only once for each version of the transition graph, and shared by everyone asking for the same
+        key. Do not modify the returned data.
+
+        :param key:         A hashable key that identifies the data.
+        :param builder:     A callable that takes the function and computes the data.
+        :return:            The data.
+        """
+
+        cached = self._graph_cache.get(key, None)
+        if cached is not None and cached[0] == self._graph_version:
+            return cached[1]
+
+        version = self._graph_version
+        data = builder(self)
+        self._graph_cache[key] = (version, data)
+        return data
+
     def subgraph(self, ins_addrs):
         """
         Generate a sub control flow graph of instruction addresses based on self.graph
@@ -936,6 +989,9 @@ class Function(object):
         :return: None
         """
 
+        if self.normalized:
+            return
+
         # let's put a check here
         if self.startpoint is None:
             # this function is empty
@@ -1035,7 +1091,7 @@ class Function(object):
             self.startpoint = self.get_node(self.startpoint.addr)
 
         # Clear the cache
-        self._local_transition_graph = None
+        self._invalidate_graphs()
 
         self.normalized = True
 
@@ -0,0 +1,16 @@
+"""
+Counters of expensive operations, which the Profiler exploration technique attributes to the steps it profiles.
+
+The counters are only updated while `enabled` is set, which the profiler does for the duration of each step.
+"""
+
+enabled = False
+
+# queries that had to go to the solver, and the time they took in seconds
+solver_queries = 0
+solver_time = 0.
+in_solver = False
+
+# loads from and stores to memory (not registers)
+memory_loads = 0
+memory_stores = 0
@@ -1,7 +1,7 @@
 import sys
 import itertools
 import types
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 import ana
 import claripy
@@ -605,8 +605,30 @@ class SimulationManager(ana.Storable):
     @staticmethod
     def _merge_key(state):
         return (state.addr if not state.regs._ip.symbolic else 'SYMBOLIC',
-                [x.func_addr for x in state.callstack],
-                set(state.posix.fd) if state.has_plugin('posix') else None)
+                tuple(x.func_addr for x in state.callstack),
+                frozenset(state.posix.fd) if state.has_plugin('posix') else None)
+
+    def snapshot(self, checkpoint, stash='active', **kwargs):
+        """
+        Execute the states in a stash until one of them reaches a checkpoint, and freeze that state so that many states
+        can be forked from it. See :class:`StateSnapshot`.
+
+        :param checkpoint:  The checkpoint. Any value accepted by the "find" parameter of :meth:`explore()`.
+        :param stash:       The stash to run (default: 'active')
+        :param kwargs:      Any additional keyword arguments will be passed to :meth:`explore()`.
+
+        :returns:           The snapshot.
+        :rtype:             StateSnapshot
+        """
+        find_stash = '_snapshot'
+        self.explore(stash=stash, find=checkpoint, find_stash=find_stash, num_find=1, **kwargs)
+        found = self._stashes.pop(find_stash, [ ])
+        if not found:
+            raise AngrError("No state reached the checkpoint")
+        if len(found) > 1 or self._stashes.get(stash):
+            l.warning("The execution up to the checkpoint was not concrete. Only one of the states is frozen.")
+
+        return StateSnapshot(found[0])
 
     def merge(self, merge_func=None, merge_key=None, stash='active'):
         """
@@ -617,6 +639,7 @@ class SimulationManager(ana.Storable):
                             the states as the argument. Should return the merged state.
         :param merge_key:   If provided, should be a function that takes a state and returns a key that will compare
                             equal for all states that are allowed to be merged together, as a first aproximation.
+                            States are grouped in a single pass if the keys are hashable.
                             By default: uses PC, callstack, and open file descriptors.
 
         :returns:           The simulation manager, for chaining.
@@ -628,9 +651,7 @@ class SimulationManager(ana.Storable):
         if merge_key is None: merge_key = self._merge_key
 
         merge_groups = [ ]
-        while to_merge:
-            base_key = merge_key(to_merge[0])
-            g, to_merge = self._filter_states(lambda s: base_key == merge_key(s), to_merge)
+        for g in self._group_states(merge_key, to_merge):
             if len(g) <= 1:
                 not_to_merge.extend(g)
             else:
@@ -682,49 +703,80 @@ class SimulationManager(ana.Storable):
             (match if filter_func(state) else nomatch).append(state)
         return match, nomatch
 
+    @staticmethod
+    def _group_states(key_func, states):
+        """
+        Group states by the keys returned by a function, keeping the order in which the keys first show up.
+
+        :param key_func:    A function that takes a state and returns its key.
+        :param states:      The states to group.
+        :returns:           A list of lists of states.
+        """
+
+        keys = [ key_func(s) for s in states ]
+        try:
+            groups = OrderedDict()
+            for k, s in zip(keys, states):
+                groups.setdefault(k, [ ]).append(s)
+            return list(groups.values())
+        except TypeError:
+            # the keys are not hashable. fall back to comparing them.
+            groups = [ ]
+            for k, s in zip(keys, states):
+                for group_key, g in groups:
+                    if group_key == k:
+                        g.append(s)
+                        break
+                else:
+                    groups.append((k, [ s ]))
+            return [ g for _, g in groups ]
+
     def _merge_states(self, states):
         """
         Merges a list of states.
 
+        If there is a state hierarchy, states are merged bottom-up at the common ancestors of their histories, so that
+        every merge only has to deal with what changed since the closest common ancestor.
+
         :param states:      the states to merge
         :returns SimState:  the resulting state
         """
 
         if self._hierarchy:
-            optimal, common_history, others = self._hierarchy.most_mergeable(states)
+            steps, leftovers = self._hierarchy.merge_plan(states)
         else:
-            optimal, common_history, others = states, None, []
+            steps, leftovers = [ ], list(range(len(states)))
 
-        if len(optimal) >= 2:
-            # We found optimal states (states that share a common ancestor) to merge.
-            # Compute constraints for each state starting from the common ancestor,
-            # and use them as merge conditions.
-            constraints = [s.history.constraints_since(common_history) for s in optimal]
+        merged = list(states)
+        for common_history, slots in steps:
+            # Compute constraints for each state starting from the common ancestor, and use them as merge conditions.
+            optimal = [ merged[i] for i in slots ]
+            constraints = [ s.history.constraints_since(common_history) for s in optimal ]
 
             o = optimal[0]
             m, _, _ = o.merge(*optimal[1:],
                               merge_conditions=constraints,
-                              common_ancestor=common_history.strongref_state
+                              common_ancestor=common_history.strongref_state,
+                              common_ancestor_history=common_history,
                               )
+            self._hierarchy.add_state(m)
+            merged.append(m)
 
-        else:
-            l.warning(
-                "Cannot find states with common history line to merge. Fall back to the naive merging strategy "
-                "and merge all states."
-                )
-            s = states[0]
-            m, _, _ = s.merge(*states[1:])
+        others = [ merged[i] for i in leftovers ]
+        if len(others) == 1:
+            return others[0]
 
-            others = []
+        l.warning(
+            "Cannot find states with common history line to merge. Fall back to the naive merging strategy "
+            "and merge all states."
+            )
+        s = others[0]
+        m, _, _ = s.merge(*others[1:])
 
         if self._hierarchy:
             self._hierarchy.add_state(m)
 
-        if len(others):
-            others.append(m)
-            return self._merge_states(others)
-        else:
-            return m
+        return m
 
     #
     #   ...
@@ -807,5 +859,6 @@ class ErrorRecord:
 from .errors import SimError, SimMergeError
 from .sim_state import SimState
 from .state_hierarchy import StateHierarchy
+from .state_snapshot import StateSnapshot
 from .errors import AngrError, SimUnsatError, SimulationManagerError
 from .exploration_techniques import ExplorationTechnique, Veritesting, Threading, Explorer
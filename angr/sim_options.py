@@ -181,6 +181,9 @@ FAST_MEMORY = "FAST_MEMORY"
 # use FastMemory for registers
 FAST_REGISTERS = "FAST_REGISTERS"
 
+# keep concrete registers in a bytearray, with SimRegisterArray
+ARRAY_REGISTERS = "ARRAY_REGISTERS"
+
 # Under-constrained symbolic execution
 UNDER_CONSTRAINED_SYMEXEC = "UNDER_CONSTRAINED_SYMEXEC"
 
@@ -199,6 +202,14 @@ UNICORN_AGGRESSIVE_CONCRETIZATION = "UNICORN_AGGRESSIVE_CONCRETIZATION"
 
 UNICORN_HANDLE_TRANSMIT_SYSCALL = "UNICORN_HANDLE_TRANSMIT_SYSCALL"
 
+# decide where to hand off execution to unicorn from the cost of previous handoffs at the same address,
+# see angr.state_plugins.unicorn_engine.UnicornHandoffPolicy
+UNICORN_ADAPTIVE_HANDOFF = "UNICORN_ADAPTIVE_HANDOFF"
+
+# share the unicorn page cache, block cache and translated code between all states of the same binary,
+# see angr.state_plugins.unicorn_engine.share_page_cache() to also share cached pages between processes
+UNICORN_SHARED_CACHE = "UNICORN_SHARED_CACHE"
+
 # floating point support
 SUPPORT_FLOATING_POINT = "SUPPORT_FLOATING_POINT"
 
@@ -232,6 +243,14 @@ REPLACEMENT_SOLVER = "REPLACEMENT_SOLVER"
 # use a cache-less solver in claripy
 CACHELESS_SOLVER = "CACHELESS_SOLVER"
 
+# check satisfiability in a z3 context shared (through push/pop) by a state and all its successors, so that only the
+# constraints added since the last query are asserted again
+INCREMENTAL_SOLVER = "INCREMENTAL_SOLVER"
+
+# only send the constraints that share variables with the queried expression to the solver in eval/min/max, and cache
+# the results of such queries across states. unsatisfiability caused by unrelated constraints is not detected.
+CONSTRAINT_INDEPENDENCE_SLICING = "CONSTRAINT_INDEPENDENCE_SLICING"
+
 # IR optimization
 OPTIMIZE_IR = "OPTIMIZE_IR"
 
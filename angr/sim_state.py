@@ -2,6 +2,7 @@ import functools
 import itertools
 import contextlib
 import weakref
+from collections import defaultdict, Counter
 
 import logging
 l = logging.getLogger(name=__name__)
@@ -29,6 +30,19 @@ merge_counter = itertools.count()
 
 _complained_se = False
 
+
+class _SharedPlugin(object):
+    """
+    A plugin that is shared by reference between several states after a copy, see SimStatePlugin.COPY_ON_WRITE.
+    """
+
+    __slots__ = ('plugin', 'refcount', )
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self.refcount = 1
+
+
 # pylint: disable=not-callable
 class SimState(PluginHub, ana.Storable):
     """
@@ -53,11 +67,18 @@ class SimState(PluginHub, ana.Storable):
     :ivar str unicorn:      Control of the Unicorn Engine
     """
 
+    # per plugin name, how many times the plugin was eagerly copied ('copied'), handed out by reference during a copy
+    # ('shared'), cloned on first access after being shared ('materialized'), or taken over without cloning by the last
+    # state still sharing it ('reclaimed')
+    plugin_copy_stats = defaultdict(Counter)
+
     def __init__(self, project=None, arch=None, plugins=None, memory_backer=None, permissions_backer=None, mode=None, options=None,
                  add_options=None, remove_options=None, special_memory_filler=None, os_name=None, plugin_preset='default', **kwargs):
         if kwargs:
             l.warning("Unused keyword arguments passed to SimState: %s", " ".join(kwargs))
         super(SimState, self).__init__()
+        # plugins that are shared with other states until they are first accessed from this one
+        self._cow_plugins = { }
         self.project = project
         self.arch = arch if arch is not None else project.arch.copy() if project is not None else None
 
@@ -128,6 +149,9 @@ class SimState(PluginHub, ana.Storable):
             if o.FAST_REGISTERS in self.options:
                 sim_registers_cls = self.plugin_preset.request_plugin('fast_memory')
                 sim_registers = sim_registers_cls(memory_id="reg", endness=self.arch.register_endness)
+            elif o.ARRAY_REGISTERS in self.options:
+                sim_registers_cls = self.plugin_preset.request_plugin('register_array')
+                sim_registers = sim_registers_cls(memory_id="reg", endness=self.arch.register_endness)
             else:
                 sim_registers_cls = self.plugin_preset.request_plugin('sym_memory')
                 sim_registers = sim_registers_cls(memory_id="reg", endness=self.arch.register_endness)
@@ -152,6 +176,7 @@ class SimState(PluginHub, ana.Storable):
         self.ip_constraints = []
 
     def _ana_getstate(self):
+        self._materialize_plugins()
         s = dict(ana.Storable._ana_getstate(self))
         s = { k:v for k,v in s.items() if k not in ('inspect', 'regs', 'mem')}
         s['_active_plugins'] = { k:v for k,v in s['_active_plugins'].items() if k not in ('inspect', 'regs', 'mem') }
@@ -159,6 +184,7 @@ class SimState(PluginHub, ana.Storable):
 
     def _ana_setstate(self, s):
         ana.Storable._ana_setstate(self, s)
+        self.__dict__.setdefault('_cow_plugins', { })
         for p in self.plugins.values():
             p.set_state(self)
             if p.STRONGREF_STATE:
@@ -185,6 +211,7 @@ class SimState(PluginHub, ana.Storable):
     @property
     def plugins(self):
         # TODO: This shouldn't be access directly.
+        self._materialize_plugins()
         return self._active_plugins
 
     @property
@@ -280,6 +307,21 @@ class SimState(PluginHub, ana.Storable):
         self._set_plugin_state(plugin, inhibit_init=inhibit_init)
         return super(SimState, self).register_plugin(name, plugin)
 
+    def get_plugin(self, name):
+        if name in self._cow_plugins:
+            return self._materialize_plugin(name)
+        return super(SimState, self).get_plugin(name)
+
+    def has_plugin(self, name):
+        return name in self._active_plugins or name in self._cow_plugins
+
+    def release_plugin(self, name):
+        sp = self._cow_plugins.pop(name, None)
+        if sp is not None:
+            sp.refcount -= 1
+        else:
+            super(SimState, self).release_plugin(name)
+
     def _init_plugin(self, plugin_cls):
         plugin = plugin_cls()
         self._set_plugin_state(plugin)
@@ -429,18 +471,48 @@ class SimState(PluginHub, ana.Storable):
             kwargs['addr'] = self.addr
         return self.project.factory.block(*args, backup_state=self, **kwargs)
 
-    # Returns a dict that is a copy of all the state's plugins
+    # Returns a dict that is a copy of all the state's plugins, and a dict of the plugins that are shared by reference
     def _copy_plugins(self):
         memo = {}
         out = {}
-        for n, p in self._active_plugins.items():
-            if id(p) in memo:
+        for n, p in list(self._active_plugins.items()):
+            if p.COPY_ON_WRITE:
+                # stop owning it ourselves as well, so that whoever touches it first gets their own copy
+                self._cow_plugins[n] = _SharedPlugin(p)
+                super(SimState, self).release_plugin(n)
+            elif id(p) in memo:
                 out[n] = memo[id(p)]
             else:
                 out[n] = p.copy(memo)
                 memo[id(p)] = out[n]
+                self.plugin_copy_stats[n]['copied'] += 1
+
+        shared = {}
+        for n, sp in self._cow_plugins.items():
+            sp.refcount += 1
+            shared[n] = sp
+            self.plugin_copy_stats[n]['shared'] += 1
+
+        return out, shared
+
+    def _materialize_plugin(self, name):
+        """
+        Get our own instance of a plugin we are sharing with other states, copying it if anyone else still shares it.
+        """
+        sp = self._cow_plugins.pop(name)
+        if sp.refcount == 1:
+            plugin = sp.plugin
+            self.plugin_copy_stats[name]['reclaimed'] += 1
+        else:
+            sp.refcount -= 1
+            plugin = sp.plugin.copy({})
+            self.plugin_copy_stats[name]['materialized'] += 1
+
+        return self.register_plugin(name, plugin)
 
-        return out
+    def _materialize_plugins(self):
+        for name in list(self._cow_plugins):
+            self._materialize_plugin(name)
 
     def copy(self):
         """
@@ -450,9 +522,10 @@ class SimState(PluginHub, ana.Storable):
         if self._global_condition is not None:
             raise SimStateError("global condition was not cleared before state.copy().")
 
-        c_plugins = self._copy_plugins()
+        c_plugins, shared_plugins = self._copy_plugins()
         state = SimState(project=self.project, arch=self.arch, plugins=c_plugins, options=self.options.copy(),
                          mode=self.mode, os_name=self.os_name)
+        state._cow_plugins = shared_plugins
 
         state.uninitialized_access_handler = self.uninitialized_access_handler
         state._special_memory_filler = self._special_memory_filler
@@ -1,5 +1,6 @@
 import logging
 import weakref
+from collections import defaultdict
 import networkx
 import itertools
 
@@ -216,3 +217,64 @@ class StateHierarchy(object):
 
         # didn't find any?
         return set(), None, states
+
+    def merge_plan(self, states):
+        """
+        Plan how to merge states bottom-up along the history tree, in a single pass over the ancestors of their
+        histories. States are merged at the lowest common ancestor of their histories first, and the result of each
+        merge takes part in the merge at the next common ancestor up the tree.
+
+        :param states:  a list of states
+        :returns:       a tuple of: (a list of merge steps, a list of slots that are left unmerged). Slots 0 to
+                        len(states) - 1 are the given states, and slot len(states) + i is the result of step i. Each
+                        step is a tuple of (the common history, a list of slots to merge at that history).
+        """
+
+        # the states whose histories are at each node
+        own_slots = defaultdict(list)
+        for i, s in enumerate(states):
+            own_slots[self.get_ref(s.history)].append(i)
+
+        # walk up from each history until we reach a node that was already seen, building the part of the history
+        # tree that leads to the states
+        children = defaultdict(list)
+        roots = [ ]
+        seen = set()
+        for n in own_slots:
+            while n not in seen:
+                seen.add(n)
+                parent = next(iter(self._graph.predecessors(n)), None) if n in self._graph else None
+                if parent is None:
+                    roots.append(n)
+                    break
+                children[parent].append(n)
+                n = parent
+
+        steps = [ ]
+        leftovers = [ ]
+        pending = { }
+        for root in roots:
+            # iterative post-order traversal
+            stack = [ (root, False) ]
+            while stack:
+                n, expanded = stack.pop()
+                if not expanded:
+                    stack.append((n, True))
+                    stack.extend((c, False) for c in children[n])
+                    continue
+
+                # the states below this node that have not been merged yet are merged here. the states at this node
+                # itself are only merged at an ancestor, since their constraints do not differ from this node on.
+                slots = [ ]
+                for c in children[n]:
+                    slots.extend(pending.pop(c, ()))
+                if len(slots) > 1:
+                    steps.append((n(), slots))
+                    slots = [ len(states) + len(steps) - 1 ]
+                slots.extend(own_slots.get(n, ()))
+                if slots:
+                    pending[n] = slots
+
+            leftovers.extend(pending.pop(root, ()))
+
+        return steps, leftovers
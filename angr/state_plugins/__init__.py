@@ -7,6 +7,7 @@ from .solver import *
 from .symbolic_memory import SimSymbolicMemory
 from .abstract_memory import *
 from .fast_memory import *
+from .register_array import SimRegisterArray
 from .log import *
 from .history import *
 from .scratch import *
@@ -16,6 +16,8 @@ class GDB(SimStatePlugin):
     Initialize or update a state from gdb dumps of the stack, heap, registers and data (or arbitrary) segments.
     """
 
+    COPY_ON_WRITE = True
+
     def __init__(self, omit_fp=False, adjust_stack=False):
         """
         :param omit_fp:         The frame pointer register is used for something else. (i.e. --omit_frame_pointer)
@@ -247,6 +247,15 @@ class SimInspector(SimStatePlugin):
                 l.debug("... FIRE")
                 bp.fire(self.state)
 
+    def has_breakpoints(self, *event_types):
+        """
+        Check whether there are any breakpoints for some types of events.
+
+        :param event_types: The types of events.
+        :return:            True if there is a breakpoint for any of them.
+        """
+        return any(self._breakpoints[t] for t in event_types)
+
     def make_breakpoint(self, event_type, *args, **kwargs):
         """
         Creates and adds a breakpoint which would trigger on `event_type`. Additional arguments are passed to the
@@ -8,6 +8,8 @@ class SimStateLibc(SimStatePlugin):
     This state plugin keeps track of various libc stuff:
     """
 
+    COPY_ON_WRITE = True
+
     #__slots__ = [ 'heap_location', 'max_str_symbolic_bytes' ]
 
     LOCALE_ARRAY = [
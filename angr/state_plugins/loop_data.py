@@ -23,6 +23,8 @@ class SimStateLoopData(SimStatePlugin):
     other loop analyses.
     """
 
+    COPY_ON_WRITE = True
+
     def __init__(self, back_edge_trip_counts=None, header_trip_counts=None, current_loop=None):
         """
         :param back_edge_trip_counts: Dictionary that stores back edge based trip counts for each loop.
@@ -14,6 +14,12 @@ class SimStatePlugin(object):
 
     STRONGREF_STATE = False
 
+    # If True, copying a state does not copy this plugin. Instead, the plugin is shared by reference between the state
+    # and its copy, and each of them makes its own copy the first time it retrieves the plugin (any retrieval is treated
+    # as a potential write). Only enable this for plugins that do not share objects with other plugins, since the
+    # deferred copy uses a fresh memo.
+    COPY_ON_WRITE = False
+
     def __init__(self):
         self.state = None # type: angr.SimState
 
@@ -0,0 +1,487 @@
+import logging
+
+import claripy
+
+from ..storage.memory import SimMemory
+from ..storage.memory_object import SimMemoryObject
+from ..storage.paged_memory import coalesce_ranges
+from ..errors import SimMemoryError
+
+l = logging.getLogger(name=__name__)
+
+# what is known about each byte of the register file
+_UNINITIALIZED = 0
+_CONCRETE = 1
+_SYMBOLIC = 2
+
+
+class SimRegisterArray(SimMemory):
+    """
+    A register file that keeps the concrete contents of registers in a bytearray that is indexed by register offset.
+    Only symbolic bytes are kept as memory objects, so that storing and loading concrete registers does not need to
+    create, split or concatenate any ASTs.
+
+    Bytes are laid out in the same order as in SimSymbolicMemory. Copies share their arrays until either of them is
+    stored to. States use it for their registers with the ARRAY_REGISTERS option.
+
+    Besides load() and store(), the register file can be accessed with get() and put(), which skip the breakpoints and
+    actions of a register access, and with get_concrete() and put_concrete(), which transfer plain integers.
+    """
+
+    def __init__(self, memory_id='reg', endness=None, size=None, concrete=None, kinds=None, objects=None,
+                 stored_ranges=None):
+        SimMemory.__init__(self, endness=endness)
+        self.id = memory_id
+        self._size = size
+        self._concrete = concrete
+        self._kinds = kinds
+        self._objects = objects
+
+        # whether the arrays are shared with a copy, and have to be copied before they are written to
+        self._shared = concrete is not None
+
+        # maps the start of each range that has been stored to since track_stores() to its end
+        self._stored_ranges = stored_ranges
+
+    def set_state(self, state):
+        super(SimRegisterArray, self).set_state(state)
+
+        if self._concrete is None:
+            if self._size is None:
+                self._size = max(offset + size for offset, size in self.state.arch.registers.values())
+            self._concrete = bytearray(self._size)
+            self._kinds = bytearray(self._size)
+            self._objects = { }
+            self._shared = False
+
+    @SimMemory.memo
+    def copy(self, memo): # pylint: disable=unused-argument
+        self._shared = True
+        return SimRegisterArray(
+            memory_id=self.id,
+            endness=self.endness,
+            size=self._size,
+            concrete=self._concrete,
+            kinds=self._kinds,
+            objects=self._objects,
+            stored_ranges=None if self._stored_ranges is None else dict(self._stored_ranges),
+        )
+
+    def _unshare(self):
+        self._concrete = bytearray(self._concrete)
+        self._kinds = bytearray(self._kinds)
+        self._objects = dict(self._objects)
+        self._shared = False
+
+    #
+    # Accessing bytes
+    #
+
+    def _translate_offset(self, offset):
+        if type(offset) is not int:
+            if not offset.singlevalued:
+                raise SimMemoryError("SimRegisterArray does not support symbolic register offsets")
+            offset = self.state.solver.eval(offset)
+        return offset
+
+    def _check_range(self, offset, size):
+        if offset < 0 or offset + size > self._size:
+            raise SimMemoryError("register access at offset %#x of %d bytes is out of range" % (offset, size))
+
+    def _read(self, offset, size, inspect=True, events=True):
+        """
+        Read bytes in memory order, filling in uninitialized ones.
+        """
+        self._check_range(offset, size)
+        end = offset + size
+        kinds = self._kinds
+        if kinds.count(_CONCRETE, offset, end) == size:
+            return claripy.BVV(int.from_bytes(self._concrete[offset:end], 'big'), size * self.state.arch.byte_width)
+
+        segments = [ ]
+        i = offset
+        while i < end:
+            kind = kinds[i]
+            if kind == _CONCRETE:
+                j = i + 1
+                while j < end and kinds[j] == _CONCRETE:
+                    j += 1
+                segments.append(claripy.BVV(int.from_bytes(self._concrete[i:j], 'big'),
+                                            (j - i) * self.state.arch.byte_width))
+            elif kind == _SYMBOLIC:
+                mo = self._objects[i]
+                j = self._object_end(i, end, mo)
+                segments.append(mo.bytes_at(i, j - i))
+            else:
+                j = i + 1
+                while j < end and kinds[j] == _UNINITIALIZED:
+                    j += 1
+                segments.append(self._fill_missing(i, j - i, inspect=inspect, events=events))
+            i = j
+
+        return segments[0] if len(segments) == 1 else claripy.Concat(*segments)
+
+    def _object_end(self, offset, end, mo):
+        """
+        Find where the bytes of a memory object that starts being referenced at an offset end, since parts of it may
+        have been overwritten.
+        """
+        end = min(mo.last_addr + 1, end)
+        i = offset + 1
+        while i < end and self._objects.get(i, None) is mo:
+            i += 1
+        return i
+
+    def _write(self, offset, data):
+        """
+        Write bytes in memory order.
+        """
+        size = len(data) // self.state.arch.byte_width
+        self._check_range(offset, size)
+
+        if self._shared:
+            self._unshare()
+
+        end = offset + size
+        kinds = self._kinds
+        if kinds.count(_SYMBOLIC, offset, end):
+            for i in range(offset, end):
+                self._objects.pop(i, None)
+
+        if not data.symbolic:
+            value = data.args[0] if data.op == 'BVV' else self.state.solver.eval(data)
+            self._concrete[offset:end] = value.to_bytes(size, 'big')
+            kinds[offset:end] = bytes((_CONCRETE,)) * size
+        else:
+            data.make_uuid()
+            mo = SimMemoryObject(data, offset, length=size, byte_width=self.state.arch.byte_width)
+            for i in range(offset, end):
+                self._objects[i] = mo
+            kinds[offset:end] = bytes((_SYMBOLIC,)) * size
+
+        if self._stored_ranges is not None and self._stored_ranges.get(offset, offset) < end:
+            self._stored_ranges[offset] = end
+
+    def _fill_missing(self, offset, size, inspect=True, events=True):
+        name = "reg_%s" % self.state.arch.translate_register_name(offset)
+        bits = size * self.state.arch.byte_width
+        if o.SPECIAL_MEMORY_FILL in self.state.options and self.state._special_memory_filler is not None:
+            value = self.state._special_memory_filler(name, bits, self.state)
+        else:
+            value = self.state.solver.Unconstrained(name, bits, key=self.variable_key_prefix + (offset,),
+                                                    inspect=inspect, events=events, eternal=False)
+            if o.CGC_ZERO_FILL_UNCONSTRAINED_MEMORY not in self.state.options:
+                l.warning("Register %s has an unspecified value; Generating an unconstrained value of %d bytes.",
+                          self.state.arch.translate_register_name(offset, size=size), size)
+        if self.state.arch.register_endness == 'Iend_LE':
+            value = value.reversed
+
+        if events:
+            self.state.history.add_event('uninitialized', memory_id=self.id, addr=offset, size=size)
+        self._write(offset, value)
+        return value
+
+    #
+    # SimMemory interface
+    #
+
+    def _store(self, req):
+        req._adjust_condition(self.state)
+
+        offset = self._translate_offset(req.addr)
+        data = req.data
+        size = self.state.solver.eval(req.size) if req.size is not None else len(data) // self.state.arch.byte_width
+        if size > len(data) // self.state.arch.byte_width:
+            raise SimMemoryError("Not enough data for requested storage size (size: {}, data: {})".format(size, data))
+        if size < len(data) // self.state.arch.byte_width:
+            data = data[len(data)-1:len(data)-size*self.state.arch.byte_width]
+
+        le = req.endness == "Iend_LE" or (req.endness is None and self.endness == "Iend_LE")
+        if req.condition is not None and not self.state.solver.is_true(req.condition):
+            original = self._read(offset, size)
+            data = self.state.solver.If(req.condition, data, original.reversed if le else original)
+        if data.symbolic and o.SIMPLIFY_REGISTER_WRITES in self.state.options:
+            data = self.state.solver.simplify(data)
+        if le:
+            data = data.reversed
+
+        self._write(offset, data)
+
+        req.completed = True
+        req.actual_addresses = [ offset ]
+        req.stored_values = [ data ]
+        return req
+
+    def _load(self, addr, size, condition=None, fallback=None, inspect=True, events=True, ret_on_segv=False):
+        offset = self._translate_offset(addr)
+        size = self.state.solver.eval(size) if type(size) is not int else size
+
+        value = self._read(offset, size, inspect=inspect, events=events)
+        if condition is not None and fallback is not None:
+            value = self.state.solver.If(condition, value, fallback)
+        return [ offset ], value, [ ]
+
+    def _find(self, start, what, max_search=None, max_symbolic_bytes=None, default=None, step=1,
+              disable_actions=False, inspect=True, chunk_size=None): # pylint: disable=unused-argument
+        raise SimMemoryError("find is not supported on registers")
+
+    def _copy_contents(self, dst, src, size, condition=None, src_memory=None, dst_memory=None, inspect=True,
+                       disable_actions=False): # pylint: disable=unused-argument
+        raise SimMemoryError("copy_contents is not supported on registers")
+
+    #
+    # Direct access
+    #
+
+    @property
+    def direct_access(self):
+        """
+        Whether get() and put() can be used in place of load() and store() without changing the outcome, which is the
+        case as long as nothing observes individual register accesses.
+        """
+        options = self.state.options
+        if o.AUTO_REFS in options or o.AST_DEPS in options or o.UNINITIALIZED_ACCESS_AWARENESS in options:
+            return False
+        return not self.state.has_plugin('inspect') or not self.state.inspect.has_breakpoints('reg_read', 'reg_write')
+
+    def get(self, offset, size):
+        """
+        Get the value of a register without triggering breakpoints or creating actions.
+
+        :param int offset:  The offset of the register.
+        :param int size:    The size of the register in bytes.
+        :return:            The value, in register endness.
+        """
+        self._check_range(offset, size)
+        end = offset + size
+        if self._kinds.count(_CONCRETE, offset, end) == size:
+            byteorder = 'little' if self.endness == 'Iend_LE' else 'big'
+            return claripy.BVV(int.from_bytes(self._concrete[offset:end], byteorder), size * self.state.arch.byte_width)
+
+        value = self._read(offset, size)
+        if o.SIMPLIFY_REGISTER_READS in self.state.options:
+            value = self.state.solver.simplify(value)
+        return value.reversed if self.endness == 'Iend_LE' else value
+
+    def put(self, offset, value):
+        """
+        Set the value of a register without triggering breakpoints or creating actions.
+
+        :param int offset:  The offset of the register.
+        :param value:       The value, in register endness.
+        """
+        value = value.raw_to_bv()
+        if value.symbolic and o.SIMPLIFY_REGISTER_WRITES in self.state.options:
+            value = self.state.solver.simplify(value)
+        self._write(offset, value.reversed if self.endness == 'Iend_LE' else value)
+
+    def get_concrete(self, offset, size):
+        """
+        Get the value of a register as an integer, if it is concrete.
+
+        :param int offset:  The offset of the register.
+        :param int size:    The size of the register in bytes.
+        :return:            The value, or None if any byte of the register is symbolic or uninitialized.
+        :rtype:             int or None
+        """
+        self._check_range(offset, size)
+        end = offset + size
+        if self._kinds.count(_CONCRETE, offset, end) != size:
+            return None
+        return int.from_bytes(self._concrete[offset:end], 'little' if self.endness == 'Iend_LE' else 'big')
+
+    def put_concrete(self, offset, size, value):
+        """
+        Set a register to an integer.
+
+        :param int offset:  The offset of the register.
+        :param int size:    The size of the register in bytes.
+        :param int value:   The value.
+        """
+        self._check_range(offset, size)
+
+        if self._shared:
+            self._unshare()
+
+        end = offset + size
+        if self._kinds.count(_SYMBOLIC, offset, end):
+            for i in range(offset, end):
+                self._objects.pop(i, None)
+        self._concrete[offset:end] = (value & ((1 << (size * self.state.arch.byte_width)) - 1)).to_bytes(
+            size, 'little' if self.endness == 'Iend_LE' else 'big')
+        self._kinds[offset:end] = bytes((_CONCRETE,)) * size
+
+        if self._stored_ranges is not None and self._stored_ranges.get(offset, offset) < end:
+            self._stored_ranges[offset] = end
+
+    #
+    # Memory objects and store tracking, as in SimPagedMemory
+    #
+
+    def load_objects(self, addr, num_bytes, ret_on_segv=False): # pylint: disable=unused-argument
+        """
+        Get the memory objects in a range of the register file. Concrete bytes are returned as memory objects holding
+        BVVs, and uninitialized bytes are left out.
+
+        :return: list of tuples of (addr, memory_object)
+        """
+        result = [ ]
+        end = min(addr + num_bytes, self._size)
+        i = addr
+        while i < end:
+            kind = self._kinds[i]
+            if kind == _CONCRETE:
+                j = i + 1
+                while j < end and self._kinds[j] == _CONCRETE:
+                    j += 1
+                value = claripy.BVV(int.from_bytes(self._concrete[i:j], 'big'), (j - i) * self.state.arch.byte_width)
+                result.append((i, SimMemoryObject(value, i, byte_width=self.state.arch.byte_width)))
+            elif kind == _SYMBOLIC:
+                mo = self._objects[i]
+                j = self._object_end(i, end, mo)
+                result.append((i, mo))
+            else:
+                j = i + 1
+            i = j
+        return result
+
+    def track_stores(self):
+        """
+        Start recording which ranges of the register file are stored to, see SimPagedMemory.track_stores().
+        """
+        self._stored_ranges = { }
+
+    def pop_stored_ranges(self):
+        """
+        Get the ranges that have been stored to since the last call, and start over.
+
+        :return:    A sorted list of non-overlapping (start, end) tuples, or None if stores are not being tracked.
+        :rtype:     list
+        """
+        if self._stored_ranges is None:
+            return None
+        ranges = coalesce_ranges(self._stored_ranges.items())
+        self._stored_ranges = { }
+        return ranges
+
+    #
+    # Comparing and merging
+    #
+
+    def changed_ranges(self, other):
+        """
+        Get the ranges of bytes that differ between this register file and another one.
+
+        :param SimRegisterArray other:  The other register file.
+        :return:                        A sorted list of (start, end) tuples.
+        """
+        if self._concrete is other._concrete and self._kinds is other._kinds and self._objects is other._objects:
+            return [ ]
+
+        ranges = [ ]
+        ours, theirs = self._kinds, other._kinds
+        start = None
+        for i in range(self._size):
+            kind = ours[i]
+            if kind != theirs[i]:
+                differs = True
+            elif kind == _CONCRETE:
+                differs = self._concrete[i] != other._concrete[i]
+            elif kind == _SYMBOLIC:
+                our_mo, their_mo = self._objects[i], other._objects[i]
+                differs = our_mo is not their_mo and (our_mo.object is not their_mo.object or
+                                                      our_mo.base != their_mo.base)
+            else:
+                differs = False
+
+            if differs and start is None:
+                start = i
+            elif not differs and start is not None:
+                ranges.append((start, i))
+                start = None
+        if start is not None:
+            ranges.append((start, self._size))
+        return ranges
+
+    def changed_bytes(self, other):
+        """
+        Gets the set of changed bytes between self and other.
+        """
+        changes = set()
+        for start, end in self.changed_ranges(other):
+            changes.update(range(start, end))
+        return changes
+
+    def merge(self, others, merge_conditions, common_ancestor=None): # pylint: disable=unused-argument
+        changed_ranges = coalesce_ranges(r for other in others for r in self.changed_ranges(other))
+        l.info("Merging %d register bytes", sum(end - start for start, end in changed_ranges))
+
+        for start, end in changed_ranges:
+            if o.ABSTRACT_MEMORY in self.state.options:
+                merged_val = self._merge_abstract(others, start, end - start, False)
+            else:
+                merged_val = self.state.solver.BVV(0, (end - start) * self.state.arch.byte_width)
+                for m, fv in zip([ self ] + others, merge_conditions):
+                    merged_val = self.state.solver.If(fv, m._read(start, end - start), merged_val)
+            self._write(start, merged_val)
+
+        return len(changed_ranges) > 0
+
+    def widen(self, others):
+        changed_ranges = coalesce_ranges(r for other in others for r in self.changed_ranges(other))
+        l.info("Widening register ranges %s", changed_ranges)
+
+        for start, end in changed_ranges:
+            self._write(start, self._merge_abstract(others, start, end - start, True))
+
+        return len(changed_ranges) > 0
+
+    def _merge_abstract(self, others, offset, size, is_widening):
+        """
+        Merge or widen the values of a range of registers in abstract mode, as in SimSymbolicMemory._merge_values().
+        Register files that have never written to the range do not contribute to the result.
+        """
+        should_reverse = self.state.arch.register_endness == 'Iend_LE'
+
+        merged_val = self._read(offset, size)
+        if should_reverse:
+            merged_val = merged_val.reversed
+        for other in others:
+            if not other._kinds.count(_UNINITIALIZED, offset, offset + size) < size:
+                continue
+            val = other._read(offset, size)
+            if should_reverse:
+                val = val.reversed
+            merged_val = merged_val.widen(val) if is_widening else merged_val.union(val)
+
+        return merged_val.reversed if should_reverse else merged_val
+
+    def unconstrain_differences(self, other):
+        changed_ranges = self.changed_ranges(other)
+        l.debug("Will unconstrain %d %s bytes", sum(end - start for start, end in changed_ranges), self.id)
+        for start, end in changed_ranges:
+            unconstrained_bytes = self.state.solver.Unconstrained("%s_unconstrain_%#x" % (self.id, start),
+                                                                  (end - start) * self.state.arch.byte_width,
+                                                                  key=('manual_unconstrain', start))
+            self.store(start, unconstrained_bytes)
+
+    def replace_all(self, old, new):
+        """
+        Replaces all instances of expression `old` with expression `new` in symbolic registers.
+        """
+        if self._shared:
+            self._unshare()
+
+        replaced = { }
+        for i, mo in list(self._objects.items()):
+            if id(mo) not in replaced:
+                new_object = mo.object.replace(old, new)
+                replaced[id(mo)] = mo if new_object is mo.object else \
+                    SimMemoryObject(new_object, mo.base, length=mo.length, byte_width=self.state.arch.byte_width)
+            self._objects[i] = replaced[id(mo)]
+
+
+from angr.sim_state import SimState
+SimState.register_default('register_array', SimRegisterArray)
+
+from .. import sim_options as o
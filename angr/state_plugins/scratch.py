@@ -40,6 +40,9 @@ class SimStateScratch(SimStatePlugin):
         self.dirty_addrs = set()
         self.num_insns = 0
 
+        # results of address concretization queries in the current block, see SimConcretizationStrategy._solve
+        self.concretization_cache = { }
+
         if scratch is not None:
             self.temps.update(scratch.temps)
             self.tyenv = scratch.tyenv
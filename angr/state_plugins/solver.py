@@ -3,8 +3,11 @@ import functools
 import time
 import logging
 
+from cachetools import LRUCache
+
 from .plugin import SimStatePlugin
 from .sim_action_object import ast_stripping_decorator, SimActionObject
+from ..misc import profiling
 
 l = logging.getLogger(name=__name__)
 
@@ -53,7 +56,22 @@ def timed_function(f):
 
         return timing_guy
     else:
-        return f
+        @functools.wraps(f)
+        def profiled(*args, **kwargs):
+            if not profiling.enabled or profiling.in_solver:
+                return f(*args, **kwargs)
+
+            # only the outermost query is counted, since queries call each other
+            profiling.in_solver = True
+            start = time.time()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                profiling.solver_time += time.time() - start
+                profiling.solver_queries += 1
+                profiling.in_solver = False
+
+        return profiled
 
 #pylint:disable=global-variable-undefined
 def enable_timing():
@@ -165,10 +183,199 @@ def concrete_path_list(f):
     return concrete_shortcut_list
 
 #
-# The main event
+# Incremental solving
 #
 
 import claripy
+
+class IncrementalSolverContext(object):
+    """
+    A z3 solver that is shared by a state and all of its successors. Each constraint lives in its own z3 frame, and
+    before a query the frames are popped back to the longest common prefix between what is asserted and the
+    constraints of the querying state. Walking down a path (or checking the guards of sibling successors) therefore
+    only asserts the constraints that were added since the previous query.
+
+    :ivar int queries:  The number of satisfiability checks done in this context.
+    :ivar int reused:   The total number of constraints that were already asserted when a query came in.
+    """
+
+    def __init__(self):
+        self._z3_solver = None
+        self._asserted = [ ]
+
+        self.queries = 0
+        self.reused = 0
+
+    def __getstate__(self):
+        return { 'queries': self.queries, 'reused': self.reused }
+
+    def __setstate__(self, s):
+        self.__init__()
+        self.__dict__.update(s)
+
+    def reset(self):
+        """
+        Drop the z3 solver and everything asserted in it.
+        """
+        self._z3_solver = None
+        self._asserted = [ ]
+
+    def satisfiable(self, constraints, extra_constraints=()):
+        """
+        Check whether `constraints`, together with `extra_constraints`, are satisfiable. The extra constraints are only
+        asserted for the duration of this query.
+
+        :param list constraints:        The constraints of the querying state, in the order they were added.
+        :param extra_constraints:       Constraints to only consider for this query.
+        :return:                        True if sat, False otherwise.
+        """
+        backend = claripy.backends.z3
+
+        try:
+            if self._z3_solver is None:
+                self._z3_solver = backend.solver()
+            z3_solver = self._z3_solver
+
+            common = 0
+            for old, new in zip(self._asserted, constraints):
+                if old is not new:
+                    break
+                common += 1
+
+            if common < len(self._asserted):
+                z3_solver.pop(len(self._asserted) - common)
+                del self._asserted[common:]
+
+            for c in constraints[common:]:
+                z3_solver.push()
+                self._asserted.append(c)
+                backend.add(z3_solver, [ c ])
+
+            self.queries += 1
+            self.reused += common
+
+            if not extra_constraints:
+                return backend.satisfiable(solver=z3_solver)
+
+            z3_solver.push()
+            try:
+                backend.add(z3_solver, list(extra_constraints))
+                return backend.satisfiable(solver=z3_solver)
+            finally:
+                z3_solver.pop()
+
+        except Exception:
+            # we do not know which frames made it into z3. start from scratch next time
+            self.reset()
+            raise
+
+#
+# Independence slicing
+#
+
+class ConstraintIndependenceIndex(object):
+    """
+    A union-find index over the variables of a list of constraints. Constraints that (transitively) share variables end
+    up in the same group, which makes it cheap to find the slice of constraints that are relevant to an expression.
+
+    The index follows a constraint list that only grows at its end; if the list is rewritten, the index is rebuilt.
+    Copies share their tables until one of them is modified.
+    """
+
+    def __init__(self):
+        self._parent = { }      # variable name -> parent variable name
+        self._groups = { }      # root variable name -> tuple of constraints
+        self._constant = ()     # constraints without any variables
+        self._count = 0         # number of constraints of the followed list that are indexed
+        self._last = None       # the last indexed constraint
+        self._shared = False
+
+    def copy(self):
+        c = ConstraintIndependenceIndex()
+        c._parent = self._parent
+        c._groups = self._groups
+        c._constant = self._constant
+        c._count = self._count
+        c._last = self._last
+        c._shared = self._shared = True
+        return c
+
+    def _find(self, v):
+        parent = self._parent
+        while True:
+            p = parent.get(v, v)
+            if p == v:
+                return v
+            v = p
+
+    def _add(self, constraint):
+        variables = constraint.variables
+        if not variables:
+            self._constant += (constraint, )
+            return
+
+        if self._shared:
+            self._parent = dict(self._parent)
+            self._groups = dict(self._groups)
+            self._shared = False
+
+        roots = { self._find(v) for v in variables if v in self._parent }
+        if roots:
+            # attach the smaller groups to the largest one, to keep the trees shallow
+            main = max(roots, key=lambda r: len(self._groups[r]))
+            group = self._groups[main]
+            for r in roots:
+                if r != main:
+                    group += self._groups.pop(r)
+                    self._parent[r] = main
+        else:
+            main = next(iter(variables))
+            group = ()
+
+        for v in variables:
+            if v not in self._parent:
+                self._parent[v] = main
+        self._parent[main] = main
+        self._groups[main] = group + (constraint, )
+
+    def sync(self, constraints):
+        """
+        Index the constraints of `constraints` that were appended since the last call.
+
+        :param list constraints:    The full list of constraints to follow.
+        """
+        count = self._count
+        if len(constraints) < count or (count and constraints[count - 1] is not self._last):
+            self.__init__()
+            count = 0
+
+        for c in constraints[count:]:
+            self._add(c)
+
+        self._count = len(constraints)
+        self._last = constraints[-1] if constraints else None
+
+    def constraints_for(self, variables):
+        """
+        Get the constraints that are relevant to a set of variables.
+
+        :param variables:   Names of variables.
+        :return:            A tuple of constraints.
+        """
+        roots = { self._find(v) for v in variables if v in self._parent }
+        sliced = self._constant
+        for r in roots:
+            sliced += self._groups[r]
+        return sliced
+
+
+# results of sliced queries, shared by all states
+_sliced_query_cache = LRUCache(maxsize=8192)
+
+#
+# The main event
+#
+
 class SimSolver(SimStatePlugin):
     """
     This is the plugin you'll use to interact with symbolic variables, creating them and evaluating them.
@@ -176,13 +383,21 @@ class SimSolver(SimStatePlugin):
 
     Any top-level variable of the claripy module can be accessed as a property of this object.
     """
-    def __init__(self, solver=None, all_variables=None, temporal_tracked_variables=None, eternal_tracked_variables=None): #pylint:disable=redefined-outer-name
+    def __init__(self, solver=None, all_variables=None, temporal_tracked_variables=None, eternal_tracked_variables=None,
+                 incremental_context=None, independence_index=None): #pylint:disable=redefined-outer-name
         l.debug("Creating SimSolverClaripy.")
         SimStatePlugin.__init__(self)
         self._stored_solver = solver
         self.all_variables = [] if all_variables is None else all_variables
         self.temporal_tracked_variables = {} if temporal_tracked_variables is None else temporal_tracked_variables
         self.eternal_tracked_variables = {} if eternal_tracked_variables is None else eternal_tracked_variables
+        self._incremental_context = incremental_context
+        self._independence_index = independence_index
+
+    def __getstate__(self):
+        d = super(SimSolver, self).__getstate__()
+        d['_incremental_context'] = None
+        return d
 
     def reload_solver(self, constraints=None):
         """
@@ -395,7 +610,8 @@ class SimSolver(SimStatePlugin):
 
     @SimStatePlugin.memo
     def copy(self, memo): # pylint: disable=unused-argument
-        return SimSolver(solver=self._solver.branch(), all_variables=self.all_variables, temporal_tracked_variables=self.temporal_tracked_variables, eternal_tracked_variables=self.eternal_tracked_variables)
+        return SimSolver(solver=self._solver.branch(), all_variables=self.all_variables, temporal_tracked_variables=self.temporal_tracked_variables, eternal_tracked_variables=self.eternal_tracked_variables, incremental_context=self._incremental_context,
+                         independence_index=self._independence_index.copy() if self._independence_index is not None else None)
 
     @error_converter
     def merge(self, others, merge_conditions, common_ancestor=None): # pylint: disable=W0613
@@ -478,6 +694,8 @@ class SimSolver(SimStatePlugin):
         :return: a tuple of the solutions, in the form of Python primitives
         :rtype: tuple
         """
+        if o.CONSTRAINT_INDEPENDENCE_SLICING in self.state.options and self._can_slice(exact):
+            return self._sliced_query('eval', e, self._adjust_constraint_list(extra_constraints), n)
         return self._solver.eval(e, n, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=exact)
 
     @concrete_path_scalar
@@ -498,6 +716,8 @@ class SimSolver(SimStatePlugin):
             er = self._solver.max(e, extra_constraints=self._adjust_constraint_list(extra_constraints))
             assert er <= ar
             return ar
+        if o.CONSTRAINT_INDEPENDENCE_SLICING in self.state.options and self._can_slice(exact):
+            return self._sliced_query('max', e, self._adjust_constraint_list(extra_constraints))
         return self._solver.max(e, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=exact)
 
     @concrete_path_scalar
@@ -518,6 +738,8 @@ class SimSolver(SimStatePlugin):
             er = self._solver.min(e, extra_constraints=self._adjust_constraint_list(extra_constraints))
             assert ar <= er
             return ar
+        if o.CONSTRAINT_INDEPENDENCE_SLICING in self.state.options and self._can_slice(exact):
+            return self._sliced_query('min', e, self._adjust_constraint_list(extra_constraints))
         return self._solver.min(e, extra_constraints=self._adjust_constraint_list(extra_constraints), exact=exact)
 
     @timed_function
@@ -619,8 +841,35 @@ class SimSolver(SimStatePlugin):
             if er is True:
                 assert ar is True
             return ar
+        if o.INCREMENTAL_SOLVER in self.state.options and exact is not False:
+            r = self._incremental_satisfiable(self._adjust_constraint_list(extra_constraints))
+            if r is not None:
+                return r
         return self._solver.satisfiable(extra_constraints=self._adjust_constraint_list(extra_constraints), exact=exact)
 
+    @property
+    def incremental_context(self):
+        """
+        The IncrementalSolverContext shared with the ancestors and successors of this state, created on first use.
+        """
+        if self._incremental_context is None:
+            self._incremental_context = IncrementalSolverContext()
+        return self._incremental_context
+
+    def _incremental_satisfiable(self, extra_constraints):
+        """
+        Check satisfiability in the shared incremental context. Returns None if that is not possible for this state, in
+        which case the regular solver should be used.
+        """
+        if o.SYMBOLIC not in self.state.options or o.ABSTRACT_SOLVER in self.state.options:
+            return None
+
+        try:
+            return self.incremental_context.satisfiable(self._solver.constraints, extra_constraints=extra_constraints)
+        except claripy.ClaripyError:
+            l.debug("Incremental satisfiability check failed. Falling back to the regular solver.", exc_info=True)
+            return None
+
     @timed_function
     @ast_stripping_decorator
     @error_converter
@@ -631,7 +880,60 @@ class SimSolver(SimStatePlugin):
         :param constraints:     Pass any constraints that you want to add (ASTs) as varargs.
         """
         cc = self._adjust_constraint_list(constraints)
-        return self._solver.add(cc)
+        r = self._solver.add(cc)
+        if self._independence_index is not None:
+            self._independence_index.sync(self._solver.constraints)
+        return r
+
+    #
+    # Independence slicing
+    #
+
+    @property
+    def independence_index(self):
+        """
+        The ConstraintIndependenceIndex over the constraints of this state, created on first use.
+        """
+        if self._independence_index is None:
+            self._independence_index = ConstraintIndependenceIndex()
+        self._independence_index.sync(self._solver.constraints)
+        return self._independence_index
+
+    def _can_slice(self, exact):
+        options = self.state.options
+        return exact is not False and \
+               o.SYMBOLIC in options and \
+               o.ABSTRACT_SOLVER not in options and \
+               o.REPLACEMENT_SOLVER not in options and \
+               not any(opt in options for opt in o.approximation)
+
+    def _sliced_query(self, query, e, extra_constraints, n=None):
+        """
+        Run `query` (one of 'eval', 'min' and 'max') on `e` against the constraints that share variables with `e` and
+        `extra_constraints` only. Results are cached across states by the hashes of the expression and of the slice.
+        """
+        variables = set(e.variables)
+        for c in extra_constraints:
+            variables |= c.variables
+        sliced = self.independence_index.constraints_for(variables)
+
+        key = (query, hash(e), n, frozenset(hash(c) for c in sliced), tuple(hash(c) for c in extra_constraints))
+        try:
+            return _sliced_query_cache[key]
+        except KeyError:
+            pass
+
+        solver = claripy.Solver()
+        solver.add(sliced)
+        if query == 'eval':
+            r = solver.eval(e, n, extra_constraints=extra_constraints)
+        elif query == 'min':
+            r = solver.min(e, extra_constraints=extra_constraints)
+        else:
+            r = solver.max(e, extra_constraints=extra_constraints)
+
+        _sliced_query_cache[key] = r
+        return r
 
     #
     # And some convenience stuff
@@ -8,7 +8,7 @@ l = logging.getLogger(name=__name__)
 import claripy
 
 from ..storage.memory import SimMemory, DUMMY_SYMBOLIC_READ_VALUE
-from ..storage.paged_memory import SimPagedMemory
+from ..storage.paged_memory import SimPagedMemory, coalesce_ranges
 from ..storage.memory_object import SimMemoryObject
 from ..sim_state_options import SimStateOptions
 
@@ -85,22 +85,22 @@ class SimSymbolicMemory(SimMemory): #pylint:disable=abstract-method
     #
 
     def _changes_to_merge(self, others):
-        changed_bytes = set()
+        changed_ranges = [ ]
 
         for o in others:  # pylint:disable=redefined-outer-name
-            changed_bytes |= self.changed_bytes(o)
+            changed_ranges.extend(self.changed_ranges(o))
 
-        return changed_bytes
+        return coalesce_ranges(changed_ranges)
 
     def merge(self, others, merge_conditions, common_ancestor=None): # pylint: disable=unused-argument
         """
         Merge this SimMemory with the other SimMemory
         """
 
-        changed_bytes = self._changes_to_merge(others)
+        changed_ranges = self._changes_to_merge(others)
 
-        l.info("Merging %d bytes", len(changed_bytes))
-        l.info("... %s has changed bytes %s", self.id, changed_bytes)
+        l.info("Merging %d bytes", sum(end - start for start, end in changed_ranges))
+        l.info("... %s has changed ranges %s", self.id, changed_ranges)
 
         self.read_strategies = self._merge_strategies(self.read_strategies, *[
             o.read_strategies for o in others
@@ -108,7 +108,7 @@ class SimSymbolicMemory(SimMemory): #pylint:disable=abstract-method
         self.write_strategies = self._merge_strategies(self.write_strategies, *[
             o.write_strategies for o in others
         ])
-        merged_bytes = self._merge(others, changed_bytes, merge_conditions=merge_conditions)
+        merged_bytes = self._merge(others, changed_ranges, merge_conditions=merge_conditions)
 
         return len(merged_bytes) > 0
 
@@ -129,102 +129,102 @@ class SimSymbolicMemory(SimMemory): #pylint:disable=abstract-method
         return merged_strategies
 
     def widen(self, others):
-        changed_bytes = self._changes_to_merge(others)
-        l.info("Memory %s widening bytes %s", self.id, changed_bytes)
-        self._merge(others, changed_bytes, is_widening=True)
-        return len(changed_bytes) > 0
+        changed_ranges = self._changes_to_merge(others)
+        l.info("Memory %s widening ranges %s", self.id, changed_ranges)
+        self._merge(others, changed_ranges, is_widening=True)
+        return len(changed_ranges) > 0
 
-    def _merge(self, others, changed_bytes, merge_conditions=None, is_widening=False):
+    def _merge(self, others, changed_ranges, merge_conditions=None, is_widening=False):
         all_memories = [self] + others
         if merge_conditions is None:
             merge_conditions = [ None ] * len(all_memories)
 
-        merged_to = None
         merged_objects = set()
         merged_bytes = set()
-        for b in sorted(changed_bytes):
-            if merged_to is not None and not b >= merged_to:
-                l.info("merged_to = %d ... already merged byte 0x%x", merged_to, b)
-                continue
-            l.debug("... on byte 0x%x", b)
-
-            memory_objects = []
-            unconstrained_in = []
-
-            # first get a list of all memory objects at that location, and
-            # all memories that don't have those bytes
-            for sm, fv in zip(all_memories, merge_conditions):
-                if b in sm.mem:
-                    l.info("... present in %s", fv)
-                    memory_objects.append((sm.mem[b], fv))
-                else:
-                    l.info("... not present in %s", fv)
-                    unconstrained_in.append((sm, fv))
-
-            mos = set(mo for mo,_ in memory_objects)
-            mo_bases = set(mo.base for mo, _ in memory_objects)
-            mo_lengths = set(mo.length for mo, _ in memory_objects)
-
-            if not unconstrained_in and not (mos - merged_objects):
-                continue
+        for start, end in changed_ranges:
+            merged_to = start
+            while merged_to < end:
+                b = merged_to
+                l.debug("... on byte 0x%x", b)
+
+                memory_objects = []
+                unconstrained_in = []
+
+                # first get a list of all memory objects at that location, and
+                # all memories that don't have those bytes
+                for sm, fv in zip(all_memories, merge_conditions):
+                    if b in sm.mem:
+                        l.info("... present in %s", fv)
+                        memory_objects.append((sm.mem[b], fv))
+                    else:
+                        l.info("... not present in %s", fv)
+                        unconstrained_in.append((sm, fv))
+
+                mos = set(mo for mo,_ in memory_objects)
+                mo_bases = set(mo.base for mo, _ in memory_objects)
+                mo_lengths = set(mo.length for mo, _ in memory_objects)
+
+                if not unconstrained_in and not (mos - merged_objects):
+                    # everything here has been merged already
+                    merged_to = max(b + 1, min(mo.base + mo.length for mo in mos))
+                    continue
 
-            # first, optimize the case where we are dealing with the same-sized memory objects
-            if len(mo_bases) == 1 and len(mo_lengths) == 1 and not unconstrained_in:
-                our_mo = self.mem[b]
-                to_merge = [(mo.object, fv) for mo, fv in memory_objects]
+                # first, optimize the case where we are dealing with the same-sized memory objects
+                if len(mo_bases) == 1 and len(mo_lengths) == 1 and not unconstrained_in:
+                    our_mo = self.mem[b]
+                    to_merge = [(mo.object, fv) for mo, fv in memory_objects]
 
-                # Update `merged_to`
-                mo_base = list(mo_bases)[0]
-                merged_to = mo_base + list(mo_lengths)[0]
+                    # Update `merged_to`
+                    mo_base = list(mo_bases)[0]
+                    merged_to = mo_base + list(mo_lengths)[0]
 
-                merged_val = self._merge_values(
-                    to_merge, memory_objects[0][0].length, is_widening=is_widening
-                )
+                    merged_val = self._merge_values(
+                        to_merge, memory_objects[0][0].length, is_widening=is_widening
+                    )
 
-                if options.ABSTRACT_MEMORY in self.state.options:
-                    # merge check for abstract memory
-                    if not to_merge[0][0].uninitialized and self.state.solver.backends.vsa.identical(merged_val, to_merge[0][0]):
-                        continue
+                    if options.ABSTRACT_MEMORY in self.state.options:
+                        # merge check for abstract memory
+                        if not to_merge[0][0].uninitialized and self.state.solver.backends.vsa.identical(merged_val, to_merge[0][0]):
+                            continue
 
-                # do the replacement
-                new_object = self.mem.replace_memory_object(our_mo, merged_val)
-                merged_objects.add(new_object)
-                merged_objects.update(mos)
+                    # do the replacement
+                    new_object = self.mem.replace_memory_object(our_mo, merged_val)
+                    merged_objects.add(new_object)
+                    merged_objects.update(mos)
 
-                merged_bytes.add(b)
+                    merged_bytes.add(b)
 
-            else:
-                # get the size that we can merge easily. This is the minimum of
-                # the size of all memory objects and unallocated spaces.
-                min_size = min([mo.length - (b - mo.base) for mo, _ in memory_objects])
-                for um, _ in unconstrained_in:
-                    for i in range(0, min_size):
-                        if b + i in um:
-                            min_size = i
-                            break
-                merged_to = b + min_size
-                l.info("... determined minimum size of %d", min_size)
-
-                # Now, we have the minimum size. We'll extract/create expressions of that
-                # size and merge them
-                extracted = [(mo.bytes_at(b, min_size), fv) for mo, fv in memory_objects] if min_size != 0 else []
-                created = [
-                    (self.get_unconstrained_bytes("merge_uc_%s_%x" % (uc.id, b), min_size * self.state.arch.byte_width), fv) for
-                    uc, fv in unconstrained_in
-                ]
-                to_merge = extracted + created
-
-                merged_val = self._merge_values(to_merge, min_size, is_widening=is_widening)
-
-                if options.ABSTRACT_MEMORY in self.state.options:
-                    # merge check for abstract memory
-                    if (not unconstrained_in or not unconstrained_in[0][0] is self) \
-                            and self.state.solver.backends.vsa.identical(merged_val, to_merge[0][0]):
-                        continue
-
-                self.store(b, merged_val, endness='Iend_BE', inspect=False)  # do not convert endianness again
-
-                merged_bytes.add(b)
+                else:
+                    # get the size that we can merge easily. This is the minimum of
+                    # the size of all memory objects and unallocated spaces.
+                    min_size = min([mo.length - (b - mo.base) for mo, _ in memory_objects] + [end - b])
+                    for um, _ in unconstrained_in:
+                        objects = um.mem.load_objects(b, min_size, ret_on_segv=True)
+                        if objects:
+                            min_size = min(min_size, objects[0][0] - b)
+                    merged_to = b + min_size
+                    l.info("... determined minimum size of %d", min_size)
+
+                    # Now, we have the minimum size. We'll extract/create expressions of that
+                    # size and merge them
+                    extracted = [(mo.bytes_at(b, min_size), fv) for mo, fv in memory_objects] if min_size != 0 else []
+                    created = [
+                        (self.get_unconstrained_bytes("merge_uc_%s_%x" % (uc.id, b), min_size * self.state.arch.byte_width), fv) for
+                        uc, fv in unconstrained_in
+                    ]
+                    to_merge = extracted + created
+
+                    merged_val = self._merge_values(to_merge, min_size, is_widening=is_widening)
+
+                    if options.ABSTRACT_MEMORY in self.state.options:
+                        # merge check for abstract memory
+                        if (not unconstrained_in or not unconstrained_in[0][0] is self) \
+                                and self.state.solver.backends.vsa.identical(merged_val, to_merge[0][0]):
+                            continue
+
+                    self.store(b, merged_val, endness='Iend_BE', inspect=False)  # do not convert endianness again
+
+                    merged_bytes.add(b)
 
         return merged_bytes
 
@@ -1043,10 +1043,13 @@ class SimSymbolicMemory(SimMemory): #pylint:disable=abstract-method
 
     # Replaces the differences between self and other with unconstrained bytes.
     def unconstrain_differences(self, other):
-        changed_bytes = self.changed_bytes(other)
-        l.debug("Will unconstrain %d %s bytes", len(changed_bytes), self.id)
-        for b in changed_bytes:
-            self.unconstrain_byte(b)
+        changed_ranges = self.changed_ranges(other)
+        l.debug("Will unconstrain %d %s bytes", sum(end - start for start, end in changed_ranges), self.id)
+        for start, end in changed_ranges:
+            unconstrained_bytes = self.get_unconstrained_bytes("%s_unconstrain_%#x" % (self.id, start),
+                                                               (end - start) * self.state.arch.byte_width,
+                                                               key=('manual_unconstrain', start))
+            self.store(start, unconstrained_bytes)
 
     @staticmethod
     def _is_uninitialized(a):
@@ -1135,6 +1138,15 @@ class SimSymbolicMemory(SimMemory): #pylint:disable=abstract-method
         """
         return self.mem.changed_bytes(other.mem)
 
+    def changed_ranges(self, other):
+        """
+        Gets the ranges of changed bytes between self and `other`.
+
+        :param other:   The other :class:`SimSymbolicMemory`.
+        :returns:       A sorted list of tuples of (start, end) of differing bytes, with the end address not inclusive.
+        """
+        return self.mem.changed_ranges(other.mem)
+
     def replace_all(self, old, new):
         """
         Replaces all instances of expression old with expression new.
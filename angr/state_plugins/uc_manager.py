@@ -6,6 +6,9 @@ from .plugin import SimStatePlugin
 from ..errors import SimUCManagerAllocationError
 
 class SimUCManager(SimStatePlugin):
+
+    COPY_ON_WRITE = True
+
     def __init__(self, man=None):
 
         SimStatePlugin.__init__(self)
@@ -1,6 +1,7 @@
 import os
 import sys
 import copy
+import re
 import struct
 import ctypes
 import threading
@@ -11,6 +12,8 @@ import pyvex
 import claripy
 import time
 import binascii
+import hashlib
+import weakref
 
 from ..sim_options import UNICORN_HANDLE_TRANSMIT_SYSCALL
 from ..errors import SimValueError, SimUnicornUnsupport, SimSegfaultError, SimMemoryError, SimMemoryMissingError, SimUnicornError
@@ -154,6 +157,113 @@ class Uniwrapper(unicorn.Uc if unicorn is not None else object):
 _unicorn_tls = threading.local()
 _unicorn_tls.uc = None
 
+
+class UnicornEntryStats(object):
+    """
+    What handing off execution to unicorn at one address has cost and gained so far.
+    """
+
+    __slots__ = ('entries', 'blocks', 'overhead', 'run_time', 'refused', 'gain', '_skip', '_backoff')
+
+    def __init__(self):
+        self.entries = 0        # number of handoffs
+        self.blocks = 0         # number of blocks executed in unicorn
+        self.overhead = 0.      # time spent setting up unicorn and synchronizing the state, in seconds
+        self.run_time = 0.      # time spent executing in unicorn, in seconds
+        self.refused = 0        # number of handoffs that were refused because they were not profitable
+        self.gain = None        # moving average of the time saved by each handoff, in seconds
+        self._skip = 0          # number of handoffs to refuse before retrying
+        self._backoff = 1
+
+    def __repr__(self):
+        return "<UnicornEntryStats: %d entries, %d blocks, %.3fs overhead, %.3fs running, %d refused>" % (
+            self.entries, self.blocks, self.overhead, self.run_time, self.refused)
+
+
+class UnicornHandoffPolicy(object):
+    """
+    Decides for each address at which execution could be handed off to unicorn whether that is worth it, based on the
+    handoffs at the same address so far.
+
+    Entering unicorn has a fixed cost (setting up the engine, copying the registers in and out, synchronizing memory)
+    that only pays off if enough blocks are executed before unicorn stops again. For each entry address, the time
+    spent on a handoff is compared to the estimated time it would have taken to execute the same number of blocks
+    without unicorn. Once an address has turned out to be unprofitable, handoffs there are refused, but retried after
+    exponentially growing intervals in case the program behaves differently there later.
+
+    The policy is shared by a state and all states copied from it. Statistics are always kept, while decisions are
+    only made with the UNICORN_ADAPTIVE_HANDOFF state option.
+    """
+
+    def __init__(self, block_cost=0.0005, min_samples=2, max_backoff=64, smoothing=0.25):
+        """
+        :param float block_cost:    The estimated time it takes to execute a block without unicorn, in seconds.
+        :param int min_samples:     The number of handoffs at an address before deciding on it.
+        :param int max_backoff:     The maximum number of refused handoffs at an address before retrying it.
+        :param float smoothing:     The weight of the latest handoff in the moving average of the time saved.
+        """
+        self.block_cost = block_cost
+        self.min_samples = min_samples
+        self.max_backoff = max_backoff
+        self.smoothing = smoothing
+        self.entries = { }
+
+    def should_enter(self, addr):
+        """
+        Decide whether to hand off execution to unicorn at an address.
+
+        :param int addr:    The address.
+        :return:            True if unicorn should be entered.
+        :rtype:             bool
+        """
+        stats = self.entries.get(addr, None)
+        if stats is None or stats.entries < self.min_samples or stats.gain > 0:
+            return True
+
+        if stats._skip > 0:
+            stats._skip -= 1
+            stats.refused += 1
+            return False
+
+        # retry it, and back off further if it is still not profitable
+        stats._skip = stats._backoff
+        stats._backoff = min(stats._backoff * 2, self.max_backoff)
+        return True
+
+    def record(self, addr, blocks, overhead, run_time):
+        """
+        Record a handoff to unicorn.
+
+        :param int addr:        The address at which unicorn was entered.
+        :param int blocks:      The number of blocks that were executed in unicorn.
+        :param float overhead:  The time spent setting up unicorn and synchronizing the state, in seconds.
+        :param float run_time:  The time spent executing in unicorn, in seconds.
+        """
+        stats = self.entries.get(addr, None)
+        if stats is None:
+            stats = self.entries[addr] = UnicornEntryStats()
+
+        stats.entries += 1
+        stats.blocks += blocks
+        stats.overhead += overhead
+        stats.run_time += run_time
+
+        gain = blocks * self.block_cost - overhead - run_time
+        stats.gain = gain if stats.gain is None else stats.gain + self.smoothing * (gain - stats.gain)
+        if stats.gain > 0:
+            stats._skip = 0
+            stats._backoff = 1
+
+    def unprofitable(self):
+        """
+        Get the entry addresses at which handoffs have not paid off, along with their statistics.
+
+        :return:    A list of tuples of (address, UnicornEntryStats), the most costly first.
+        :rtype:     list
+        """
+        entries = [ (addr, stats) for addr, stats in self.entries.items() if stats.gain is not None and stats.gain <= 0 ]
+        return sorted(entries, key=lambda item: item[1].gain * item[1].entries)
+
 class _VexCacheInfo(ctypes.Structure):
     _fields_ = [
         ("num_levels", ctypes.c_uint),
@@ -175,6 +285,33 @@ class _VexArchInfo(ctypes.Structure):
         ("x86_cr0", ctypes.c_uint),
     ]
 
+# the VEX guest and arch info of each architecture, as passed to native code
+_vex_arch_infos = { }
+
+def _vex_arch_info(arch):
+    key = (arch.name, arch.memory_endness, arch.bits)
+    try:
+        return _vex_arch_infos[key]
+    except KeyError:
+        pass
+
+    archinfo = copy.deepcopy(arch.vex_archinfo)
+    archinfo['hwcache_info']['caches'] = 0
+    archinfo['hwcache_info'] = _VexCacheInfo(**archinfo['hwcache_info'])
+    info = _vex_arch_infos[key] = (getattr(pyvex.pvc, arch.vex_arch), _VexArchInfo(**archinfo))
+    return info
+
+# the condition code registers of register flagged systems, which are all saved off together if any of them is symbolic
+_cc_reg_ranges = {
+    'X86': (40, 56),
+    'AMD64': (144, 176),
+}
+
+_nonzero_bytes = re.compile(b'[^\x00]+')
+
+# the VEX registers that the flags are computed from
+_cc_reg_names = ('cc_op', 'cc_dep1', 'cc_dep2', 'cc_ndep')
+
 def _load_native():
     if sys.platform == 'darwin':
         libfile = 'angr_native.dylib'
@@ -221,6 +358,7 @@ def _load_native():
         _setup_prototype(h, 'set_stops', None, state_t, ctypes.c_uint64, ctypes.POINTER(ctypes.c_uint64))
         _setup_prototype(h, 'cache_page', ctypes.c_bool, state_t, ctypes.c_uint64, ctypes.c_uint64, ctypes.c_char_p, ctypes.c_uint64)
         _setup_prototype(h, 'uncache_page', None, state_t, ctypes.c_uint64)
+        _setup_prototype(h, 'set_shared_page_dir', None, ctypes.c_char_p)
         _setup_prototype(h, 'enable_symbolic_reg_tracking', None, state_t, VexArch, _VexArchInfo)
         _setup_prototype(h, 'disable_symbolic_reg_tracking', None, state_t)
         _setup_prototype(h, 'symbolic_register_data', None, state_t, ctypes.c_uint64, ctypes.POINTER(ctypes.c_uint64))
@@ -247,6 +385,27 @@ except ImportError:
     _UC_NATIVE = None
 
 
+def share_page_cache(path):
+    """
+    Keep the read-only pages that unicorn caches in native code in a page store that is shared by all processes using
+    the same directory, e.g. a directory in /dev/shm for all workers of a fleet. Pages are stored by the hash of their
+    content and mapped copy-on-write, so every worker maps the same physical memory for the pages of the binary.
+
+    Together with the UNICORN_SHARED_CACHE state option, this saves each worker from mapping the pages of the binary
+    again.
+
+    :param str path:    The directory of the page store, or None to keep cached pages private to this process.
+    """
+    if _UC_NATIVE is None:
+        raise SimUnicornUnsupport("Unicorn support is not available")
+    if path is not None and not os.path.isdir(path):
+        os.makedirs(path)
+    _UC_NATIVE.set_shared_page_dir(b'' if path is None else os.path.abspath(path).encode())
+
+# cache keys for the loaded binaries, see Unicorn._shared_cache_key()
+_shared_cache_keys = weakref.WeakKeyDictionary()
+
+
 class Unicorn(SimStatePlugin):
     '''
     setup the unicorn engine for a state
@@ -273,10 +432,13 @@ class Unicorn(SimStatePlugin):
         cooldown_nonunicorn_blocks=100,
         cooldown_stop_point=1,
         max_steps=1000000,
+        handoff=None,
     ):
         """
         Initializes the Unicorn plugin for angr. This plugin handles communication with
         UnicornEngine.
+
+        :param UnicornHandoffPolicy handoff: The policy that decides where to hand off execution to unicorn.
         """
 
         SimStatePlugin.__init__(self)
@@ -306,6 +468,9 @@ class Unicorn(SimStatePlugin):
         # the default step limit
         self.max_steps = max_steps
 
+        # shared with all copies, so that what is learned about handoffs in one state benefits all of them
+        self.handoff = UnicornHandoffPolicy() if handoff is None else handoff
+
         self.steps = 0
         self._mapped = 0
         self._uncache_pages = []
@@ -351,6 +516,11 @@ class Unicorn(SimStatePlugin):
 
         self.time = None
 
+        # the symbolic bytes of the register file as of the last handoff, see _symbolic_register_array()
+        self._symbolic_regs = None
+        self._symbolic_regs_key = None
+        self._symbolic_regs_array = None
+
     @SimStatePlugin.memo
     def copy(self, _memo):
         u = Unicorn(
@@ -370,6 +540,7 @@ class Unicorn(SimStatePlugin):
             cooldown_symbolic_registers=self.cooldown_symbolic_registers,
             cooldown_symbolic_memory=self.cooldown_symbolic_memory,
             max_steps=self.max_steps,
+            handoff=self.handoff,
         )
         u.countdown_nonunicorn_blocks = self.countdown_nonunicorn_blocks
         u.countdown_symbolic_registers = self.countdown_symbolic_registers
@@ -377,6 +548,9 @@ class Unicorn(SimStatePlugin):
         u.countdown_stop_point = self.countdown_stop_point
         u.transmit_addr = self.transmit_addr
         u._uncache_pages = list(self._uncache_pages)
+        u._symbolic_regs = self._symbolic_regs
+        u._symbolic_regs_key = self._symbolic_regs_key
+        u._symbolic_regs_array = self._symbolic_regs_array
         return u
 
     def merge(self, others, merge_conditions, common_ancestor=None): # pylint: disable=unused-argument
@@ -868,7 +1042,27 @@ class Unicorn(SimStatePlugin):
     def uncache_page(self, addr):
         self._uncache_pages.append(addr & ~0xfff)
 
+    def _shared_cache_key(self):
+        """
+        Get a cache key for all states of the loaded binary, derived from the content of its memory. This is the same
+        in every process that loads the same binary at the same addresses.
+        """
+        loader = self.state.project.loader
+        key = _shared_cache_keys.get(loader, None)
+        if key is None:
+            h = hashlib.sha1(self.state.arch.name.encode())
+            for start, backer in loader.memory.backers():
+                h.update(struct.pack('<Q', start))
+                h.update(bytes(backer))
+            key = struct.unpack('<Q', h.digest()[:8])[0]
+            _shared_cache_keys[loader] = key
+        return key
+
     def setup(self):
+        if options.UNICORN_SHARED_CACHE in self.state.options and self.state.project is not None:
+            # the unicorn engine is kept as long as the cache key stays the same, so this also keeps the code that it
+            # has translated
+            self.cache_key = self._shared_cache_key()
         self._setup_unicorn()
         self.set_regs()
         # tricky: using unicorn handle form unicorn.Uc object
@@ -894,41 +1088,16 @@ class Unicorn(SimStatePlugin):
         # should this be in setup?
         if options.UNICORN_SYM_REGS_SUPPORT in self.state.options and \
            options.UNICORN_AGGRESSIVE_CONCRETIZATION not in self.state.options:
-            archinfo = copy.deepcopy(self.state.arch.vex_archinfo)
-            archinfo['hwcache_info']['caches'] = 0
-            archinfo['hwcache_info'] = _VexCacheInfo(**archinfo['hwcache_info'])
-            _UC_NATIVE.enable_symbolic_reg_tracking(
-                self._uc_state,
-                getattr(pyvex.pvc, self.state.arch.vex_arch),
-                _VexArchInfo(**archinfo),
-            )
+            vex_arch, vex_archinfo = _vex_arch_info(self.state.arch)
+            _UC_NATIVE.enable_symbolic_reg_tracking(self._uc_state, vex_arch, vex_archinfo)
 
-            # TODO: refactor
             # first, check to see if *any* registers are symbolic, so that we
             # can optimize the case where there aren't any. (N.B.: "optimize"
             # does not refer to constructing the set of symbolic register
             # offsets, but rather to not having to lift each block etc.)
-            if not self._check_registers(report=False):
-                highest_reg_offset, reg_size = max(self.state.arch.registers.values())
-                symbolic_offsets = set(range(0, highest_reg_offset+reg_size))
-                items = self.state.registers.mem.load_objects(0, highest_reg_offset+reg_size)
-                for start,v in items:
-                    end = v.last_addr + 1
-                    vv = self._symbolic_passthrough(v.object)
-
-                    if not vv.symbolic:
-                        symbolic_offsets.difference_update(range(start, end))
-                    else:
-                        symbolic_offsets.difference_update(b for b,vb in enumerate(vv.chop(8), start) if not vb.symbolic)
-
-                # for register flagged systems, we should save off all CC regs together
-                if self.state.arch.name == 'X86' and symbolic_offsets & set(range(40, 56)):
-                    symbolic_offsets.update(range(40, 56))
-                elif self.state.arch.name == 'AMD64' and symbolic_offsets & set(range(144, 176)):
-                    symbolic_offsets.update(range(144, 176))
-
-                sym_regs_array = (ctypes.c_uint64 * len(symbolic_offsets))(*map(ctypes.c_uint64, symbolic_offsets))
-                _UC_NATIVE.symbolic_register_data(self._uc_state, len(symbolic_offsets), sym_regs_array)
+            sym_regs_array = self._symbolic_register_array()
+            if self._has_symbolic_uc_registers():
+                _UC_NATIVE.symbolic_register_data(self._uc_state, len(sym_regs_array), sym_regs_array)
             else:
                 _UC_NATIVE.symbolic_register_data(self._uc_state, 0, None)
 
@@ -938,6 +1107,109 @@ class Unicorn(SimStatePlugin):
         self.errno = _UC_NATIVE.start(self._uc_state, addr, self.max_steps if step is None else step)
         self.time = time.time() - self.time
 
+    def _symbolic_register_array(self):
+        """
+        Get the offsets of all symbolic bytes in the register file, as an array to pass to native code.
+
+        The symbolic bytes are kept in a bitmap from one handoff to the next, and only the registers that have been
+        stored to in the meantime are looked at again. The whole register file is only scanned on the first handoff,
+        or if the concretization settings have changed. The registers that get_regs() syncs out of unicorn are
+        accounted for there.
+        """
+        regs = self.state.registers
+        if not isinstance(regs, SimRegisterArray):
+            regs = regs.mem
+        ip = self.state.solver.eval(self.state.ip)
+        key = (frozenset(self.always_concretize), frozenset(self.never_concretize),
+               ip if ip in self.concretize_at else None)
+
+        stored = regs.pop_stored_ranges()
+        if stored is None or self._symbolic_regs is None or key != self._symbolic_regs_key:
+            highest_reg_offset, reg_size = max(self.state.arch.registers.values())
+            regs.track_stores()
+            bitmap = bytearray(b'\x01') * (highest_reg_offset + reg_size)
+            stored = [ (0, len(bitmap)) ]
+        else:
+            bitmap = bytearray(self._symbolic_regs)
+
+        for start, end in stored:
+            end = min(end, len(bitmap))
+            if start >= end:
+                continue
+
+            # bytes that have never been stored to are symbolic
+            bitmap[start:end] = b'\x01' * (end - start)
+            for _, mo in regs.load_objects(start, end - start):
+                lo, hi = max(mo.base, start), min(mo.last_addr + 1, end)
+                v = self._symbolic_passthrough(mo.object)
+                if not v.symbolic:
+                    bitmap[lo:hi] = bytes(hi - lo)
+                else:
+                    for b, vb in enumerate(v.chop(8), mo.base):
+                        if lo <= b < hi and not vb.symbolic:
+                            bitmap[b] = 0
+
+        self._symbolic_regs_key = key
+        if bitmap == self._symbolic_regs and self._symbolic_regs_array is not None:
+            return self._symbolic_regs_array
+        self._symbolic_regs = bytes(bitmap)
+
+        # for register flagged systems, we should save off all CC regs together
+        cc_regs = _cc_reg_ranges.get(self.state.arch.name, None)
+        if cc_regs is not None and any(bitmap[cc_regs[0]:cc_regs[1]]):
+            bitmap[cc_regs[0]:cc_regs[1]] = b'\x01' * (cc_regs[1] - cc_regs[0])
+
+        symbolic_offsets = [ ]
+        for m in _nonzero_bytes.finditer(bitmap):
+            symbolic_offsets.extend(range(m.start(), m.end()))
+        self._symbolic_regs_array = (ctypes.c_uint64 * len(symbolic_offsets))(*symbolic_offsets)
+        return self._symbolic_regs_array
+
+    def _has_symbolic_uc_registers(self):
+        """
+        Check if any of the registers that are synced with unicorn, or any of the condition code registers that the
+        flags are computed from, is symbolic. This is what _check_registers() finds out, but it is answered from the
+        bitmap of _symbolic_register_array() instead of loading every register.
+        """
+        bitmap = self._symbolic_regs
+        names = list(self.state.arch.uc_regs)
+        if self.state.arch.vex_conditional_helpers:
+            names.extend(_cc_reg_names)
+        for r in names:
+            if r not in self.state.arch.registers:
+                continue
+            offset, size = self.state.arch.registers[r]
+            if any(bitmap[offset:offset + size]):
+                return True
+        return False
+
+    def _update_symbolic_register_bitmap(self, saved_registers):
+        """
+        Account for the registers that get_regs() has just synced out of unicorn in the bitmap of symbolic register
+        bytes, so that they are not looked at again on the next handoff. All of them are concrete, except for the
+        symbolic ones that have been restored.
+        """
+        regs = self.state.registers
+        if not isinstance(regs, SimRegisterArray):
+            regs = regs.mem
+        stored = regs.pop_stored_ranges()
+        if stored is None or self._symbolic_regs is None:
+            return
+
+        bitmap = bytearray(self._symbolic_regs)
+        for start, end in stored:
+            end = min(end, len(bitmap))
+            if start < end:
+                bitmap[start:end] = bytes(end - start)
+        for offset, v in saved_registers:
+            end = min(offset + len(v) // self.state.arch.byte_width, len(bitmap))
+            if offset < end:
+                bitmap[offset:end] = b'\x01' * (end - offset)
+
+        if bitmap != self._symbolic_regs:
+            self._symbolic_regs = bytes(bitmap)
+            self._symbolic_regs_array = None
+
     def finish(self):
         # do the superficial synchronization
         self.get_regs()
@@ -978,11 +1250,6 @@ class Unicorn(SimStatePlugin):
 
         _UC_NATIVE.destroy(head)    # free the linked list
 
-        # adjust the countdowns
-        #if self.steps >= 128:
-        #   self.cooldown_symbolic_registers = 16
-        #   self.cooldown_symbolic_memory = 16
-
         # process the concrete transmits
         i = 0
         stdout = self.state.posix.get_fd(1)
@@ -1002,17 +1269,15 @@ class Unicorn(SimStatePlugin):
             self.countdown_nonunicorn_blocks = 0
             self.countdown_stop_point = self.cooldown_stop_point
         elif self.stop_reason == STOP.STOP_SYMBOLIC_REG:
-            #if self.steps < 128:
-            #   self.cooldown_symbolic_registers = min(self.cooldown_symbolic_registers * 2, 256)
             self.countdown_symbolic_registers = self.cooldown_symbolic_registers
         elif self.stop_reason == STOP.STOP_SYMBOLIC_MEM:
-            #if self.steps < 128:
-            #   self.cooldown_symbolic_memory = min(self.cooldown_symbolic_memory * 2, 256)
             self.countdown_symbolic_memory = self.cooldown_symbolic_memory
         else:
             self.countdown_nonunicorn_blocks = self.cooldown_nonunicorn_blocks
 
-        if not is_testing and self.time != 0 and self.steps / self.time < 10: # TODO: make this tunable
+        # with UNICORN_ADAPTIVE_HANDOFF, the handoff policy takes care of slow runs of unicorn
+        if not is_testing and options.UNICORN_ADAPTIVE_HANDOFF not in self.state.options and \
+                self.time != 0 and self.steps / self.time < 10:
             l.info(
                 "Unicorn stepped %d block%s in %fsec (%f blocks/sec), enabling cooldown",
                 self.steps,
@@ -1089,9 +1354,19 @@ class Unicorn(SimStatePlugin):
             gs = self.state.solver.eval(self.state.regs.gs) << 16
             self.setup_gdt(fs, gs)
 
+        # concrete registers can be read directly from a register array, unless register reads are observed
+        registers = self.state.registers
+        if not isinstance(registers, SimRegisterArray) or not registers.direct_access:
+            registers = None
+
         for r, c in self._uc_regs.items():
             if r in self.reg_blacklist:
                 continue
+            if registers is not None and r not in _special_reg_names:
+                v = registers.get_concrete(*self.state.arch.registers[r])
+                if v is not None:
+                    uc.reg_write(c, v)
+                    continue
             v = self._process_value(getattr(self.state.regs, r), 'reg')
             if v is None:
                     raise SimValueError('setting a symbolic register')
@@ -1263,13 +1538,20 @@ class Unicorn(SimStatePlugin):
                     cur_group, self.state.registers.load(cur_group, last-cur_group+1)
                 ))
 
-        # now we sync registers out of unicorn
+        # now we sync registers out of unicorn, directly into a register array unless register writes are observed
+        registers = self.state.registers
+        if not isinstance(registers, SimRegisterArray) or not registers.direct_access:
+            registers = None
         for r, c in self._uc_regs.items():
             if r in self.reg_blacklist:
                 continue
             v = self.uc.reg_read(c)
             # l.debug('getting $%s = %#x', r, v)
-            setattr(self.state.regs, r, v)
+            if registers is not None and r not in _special_reg_names:
+                offset, size = self.state.arch.registers[r]
+                registers.put_concrete(offset, size, v)
+            else:
+                setattr(self.state.regs, r, v)
 
         # some architecture-specific register fixups
         if self.state.arch.name in ('X86', 'AMD64'):
@@ -1338,6 +1620,7 @@ class Unicorn(SimStatePlugin):
         if options.UNICORN_SYM_REGS_SUPPORT in self.state.options:
             for o,r in saved_registers:
                 self.state.registers.store(o, r)
+            self._update_symbolic_register_bitmap(saved_registers)
 
     def _check_registers(self, report=True):
         ''' check if this state might be used in unicorn (has no concrete register)'''
@@ -1366,6 +1649,11 @@ class Unicorn(SimStatePlugin):
 
 from ..engines.vex import ccall
 from .. import sim_options as options
+from ..storage.memory import stn_map, tag_map
+from .register_array import SimRegisterArray
+
+# register names that SimMemory translates to something else, see SimMemory._resolve_location_name()
+_special_reg_names = { 'flags', 'eflags', 'rflags' } | set(stn_map) | set(tag_map)
 
 from angr.sim_state import SimState
 SimState.register_default('unicorn', Unicorn)
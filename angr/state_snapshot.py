@@ -0,0 +1,74 @@
+import logging
+
+l = logging.getLogger(name=__name__)
+
+
+class StateSnapshot(object):
+    """
+    A state frozen at a checkpoint, from which many states can be forked cheaply.
+
+    This is meant for workloads that execute a long concrete prefix, e.g. parsing a fixed header or initializing libc,
+    before the interesting part of the execution. The prefix is executed once, and every fork starts from the
+    checkpoint with its own symbolic inputs.
+
+    The frozen state is never executed, so its memory pages and copy-on-write plugins are shared by all forks, and each
+    fork only copies the pages it writes to. Forks also keep the cache key of the Unicorn plugin of the frozen state,
+    so they share its page cache in native code, and the read-only pages that were cached while executing the prefix
+    are not mapped again for each fork.
+    """
+
+    def __init__(self, state):
+        """
+        :param SimState state:  The state to freeze. It is copied, so it can still be used afterwards.
+        """
+
+        self.state = state.copy()
+
+    @property
+    def addr(self):
+        return self.state.addr
+
+    def fork(self, memory=None, registers=None, stdin=None):
+        """
+        Fork a new state from the snapshot.
+
+        :param dict memory:     A dict mapping addresses to the values to store at them in the new state, e.g. symbolic
+                                inputs. Values may be bitvectors, ints or bytes.
+        :param dict registers:  A dict mapping register names to the values to store in them in the new state.
+        :param stdin:           A new stdin for the state, accepting the same values as the stdin parameter of
+                                :meth:`SimOS.state_blank()`.
+        :return:                The new state.
+        :rtype:                 SimState
+        """
+
+        state = self.state.copy()
+
+        if memory:
+            for addr, value in memory.items():
+                state.memory.store(addr, value)
+        if registers:
+            for name, value in registers.items():
+                state.registers.store(name, value)
+        if stdin is not None:
+            AngrObjectFactory._install_stdin(state, stdin)
+
+        return state
+
+    def simulation_manager(self, inputs, **kwargs):
+        """
+        Fork a state for each set of inputs, and put them all into a new simulation manager.
+
+        :param inputs:  A list of dicts, each one with the keyword arguments to :meth:`fork()` for one state.
+        :param kwargs:  Any additional keyword arguments will be passed to the SimulationManager constructor.
+        :returns:       The new SimulationManager
+        :rtype:         SimulationManager
+        """
+
+        states = [ self.fork(**i) for i in inputs ]
+        return SimulationManager(self.state.project, active_states=states, **kwargs)
+
+    simgr = simulation_manager
+
+
+from .factory import AngrObjectFactory
+from .sim_manager import SimulationManager
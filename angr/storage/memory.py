@@ -551,6 +551,9 @@ class SimMemory(SimStatePlugin):
         ):
             self._constrain_underconstrained_index(addr_e)
 
+        if profiling.enabled and self.category == 'mem':
+            profiling.memory_stores += 1
+
         request = MemoryStoreRequest(addr_e, data=data_e, size=size_e, condition=condition_e, endness=endness)
         try:
             self._store(request)
@@ -759,6 +762,9 @@ class SimMemory(SimStatePlugin):
         ):
             self._constrain_underconstrained_index(addr_e)
 
+        if profiling.enabled and self.category == 'mem':
+            profiling.memory_loads += 1
+
         try:
             a,r,c = self._load(addr_e, size_e, condition=condition_e, fallback=fallback_e, inspect=inspect,
                                events=not disable_actions, ret_on_segv=ret_on_segv)
@@ -909,3 +915,4 @@ from ..state_plugins.sim_action import SimActionData
 from ..state_plugins.sim_action_object import SimActionObject, _raw_ast
 from ..errors import SimMemoryError, SimRegionMapError, SimSegfaultError
 from ..state_plugins.inspect import BP_BEFORE, BP_AFTER
+from ..misc import profiling
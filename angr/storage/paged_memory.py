@@ -1,3 +1,5 @@
+import re
+import itertools
 import cooldict
 import claripy
 import cle
@@ -10,6 +12,8 @@ from .memory_object import SimMemoryObject
 
 l = logging.getLogger(name=__name__)
 
+_NONZERO_BYTES = re.compile(b'[^\x00]+')
+
 
 class BasePage:
     """
@@ -119,6 +123,14 @@ class BasePage:
         """
         raise NotImplementedError()
 
+    def object_runs(self):
+        """
+        Return the runs of bytes in the page that are backed by the same memory object.
+
+        :returns: a sorted list of tuples of (start, end, memory_object), with the end address not inclusive
+        """
+        raise NotImplementedError()
+
     def _copy_args(self):
         raise NotImplementedError()
 
@@ -236,6 +248,19 @@ class TreePage(BasePage):
                     keys.insert(0, key)
         return [(max(start, key), self._storage[key]) for key in keys]
 
+    def object_runs(self):
+        runs = [ ]
+        page_end = self._page_addr + self._page_size
+        keys = list(self._storage.keys())
+        for i, key in enumerate(keys):
+            mo = self._storage[key]
+            end = min(mo.last_addr + 1, page_end)
+            if i + 1 < len(keys):
+                end = min(end, keys[i + 1])
+            if key < end:
+                runs.append((key, end, mo))
+        return runs
+
     def _copy_args(self):
         return { 'storage': self._storage.copy() }
 
@@ -314,18 +339,82 @@ class ListPage(BasePage):
                 items.append((addr, mo))
         return items
 
+    def object_runs(self):
+        page_end = self._page_addr + self._page_size
+        if self._storage.count(None) == self._page_size:
+            return [ ] if self._sinkhole is None else [ (self._page_addr, page_end, self._sinkhole) ]
+
+        runs = [ ]
+        cur_mo, cur_start = None, None
+        for i, mo in enumerate(self._storage):
+            if mo is None:
+                mo = self._sinkhole
+            if mo is not cur_mo:
+                if cur_mo is not None:
+                    runs.append((cur_start, self._page_addr + i, cur_mo))
+                cur_mo, cur_start = mo, self._page_addr + i
+        if cur_mo is not None:
+            runs.append((cur_start, page_end, cur_mo))
+        return runs
+
     def _copy_args(self):
         return { 'storage': list(self._storage), 'sinkhole': self._sinkhole }
 
 Page = ListPage
 
+
+def coalesce_ranges(ranges):
+    """
+    Sort address ranges and merge the ones that overlap or are adjacent.
+
+    :param ranges:  an iterable of tuples of (start, end), with the end address not inclusive
+    :returns:       a sorted list of tuples of (start, end)
+    """
+
+    coalesced = [ ]
+    for start, end in sorted(ranges):
+        if coalesced and start <= coalesced[-1][1]:
+            if end > coalesced[-1][1]:
+                coalesced[-1] = (coalesced[-1][0], end)
+        else:
+            coalesced.append((start, end))
+    return coalesced
+
+
+def _diff_runs(ours, theirs):
+    """
+    Compare two lists of object runs, as returned by BasePage.object_runs(), by object identity.
+
+    :returns: a list of tuples of (start, end, our memory object, their memory object) for all ranges where the
+              objects differ. A memory object is None where the range is not backed in that page.
+    """
+
+    bounds = sorted(set(itertools.chain.from_iterable((start, end) for start, end, _ in itertools.chain(ours, theirs))))
+
+    diffs = [ ]
+    i, j = 0, 0
+    for start, end in zip(bounds, bounds[1:]):
+        while i < len(ours) and ours[i][1] <= start:
+            i += 1
+        while j < len(theirs) and theirs[j][1] <= start:
+            j += 1
+        our_mo = ours[i][2] if i < len(ours) and ours[i][0] <= start else None
+        their_mo = theirs[j][2] if j < len(theirs) and theirs[j][0] <= start else None
+        if our_mo is their_mo:
+            continue
+        if diffs and diffs[-1][1] == start and diffs[-1][2] is our_mo and diffs[-1][3] is their_mo:
+            diffs[-1] = (diffs[-1][0], end, our_mo, their_mo)
+        else:
+            diffs.append((start, end, our_mo, their_mo))
+    return diffs
+
 #pylint:disable=unidiomatic-typecheck
 
 class SimPagedMemory:
     """
     Represents paged memory.
     """
-    def __init__(self, memory_backer=None, permissions_backer=None, pages=None, initialized=None, name_mapping=None, hash_mapping=None, page_size=None, symbolic_addrs=None, check_permissions=False):
+    def __init__(self, memory_backer=None, permissions_backer=None, pages=None, initialized=None, name_mapping=None, hash_mapping=None, page_size=None, symbolic_addrs=None, check_permissions=False, stored_ranges=None):
         self._cowed = set()
         self._memory_backer = { } if memory_backer is None else memory_backer
         self._permissions_backer = permissions_backer # saved for copying
@@ -344,6 +433,9 @@ class SimPagedMemory:
         self._hash_mapping = cooldict.BranchingDict() if hash_mapping is None else hash_mapping
         self._updated_mappings = set()
 
+        # maps the start of each range that has been stored to since track_stores() to its end
+        self._stored_ranges = stored_ranges
+
     def __getstate__(self):
         return {
             '_memory_backer': self._memory_backer,
@@ -358,11 +450,13 @@ class SimPagedMemory:
             '_hash_mapping': self._hash_mapping,
             '_symbolic_addrs': self._symbolic_addrs,
             '_preapproved_stack': self._preapproved_stack,
-            '_check_perms': self._check_perms
+            '_check_perms': self._check_perms,
+            '_stored_ranges': self._stored_ranges,
         }
 
     def __setstate__(self, s):
         self._cowed = set()
+        self._stored_ranges = None
         self.__dict__.update(s)
 
     def branch(self):
@@ -379,7 +473,8 @@ class SimPagedMemory:
                            name_mapping=new_name_mapping,
                            hash_mapping=new_hash_mapping,
                            symbolic_addrs=dict(self._symbolic_addrs),
-                           check_permissions=self._check_perms)
+                           check_permissions=self._check_perms,
+                           stored_ranges=None if self._stored_ranges is None else dict(self._stored_ranges))
         m._preapproved_stack = self._preapproved_stack
         return m
 
@@ -401,6 +496,7 @@ class SimPagedMemory:
 
         self._get_page(page_num, write=True, create=True)[page_idx] = v
         self._update_mappings(addr, v.object)
+        self._mark_stored(addr, addr + 1)
         #print "...",id(self._pages[page_num])
 
     def __delitem__(self, addr):
@@ -607,76 +703,63 @@ class SimPagedMemory:
         return len(self.keys())
 
     def changed_bytes(self, other):
-        return self.__changed_bytes(other)
-
-    def __changed_bytes(self, other):
         """
         Gets the set of changed bytes between `self` and `other`.
 
         :type other:    SimPagedMemory
         :returns:       A set of differing bytes.
         """
-        if self._page_size != other._page_size:
-            raise SimMemoryError("SimPagedMemory page sizes differ. This is asking for disaster.")
+        return set(itertools.chain.from_iterable(range(start, end) for start, end in self.changed_ranges(other)))
 
-        our_pages = set(self._pages.keys())
-        their_pages = set(other._pages.keys())
-        their_additions = their_pages - our_pages
-        our_additions = our_pages - their_pages
-        common_pages = our_pages & their_pages
-
-        candidates = set()
-        for p in their_additions:
-            candidates.update(other._pages[p].keys())
-        for p in our_additions:
-            candidates.update(self._pages[p].keys())
+    def changed_ranges(self, other):
+        """
+        Gets the address ranges that differ between `self` and `other`. Pages are compared memory object by memory
+        object, so the cost depends on the number of memory objects rather than on the number of bytes.
 
-        for p in common_pages:
-            our_page = self._pages[p]
-            their_page = other._pages[p]
+        :type other:    SimPagedMemory
+        :returns:       A sorted list of tuples of (start, end) of differing bytes, with the end address not inclusive.
+        """
+        if self._page_size != other._page_size:
+            raise SimMemoryError("SimPagedMemory page sizes differ. This is asking for disaster.")
 
+        changes = [ ]
+        for n in sorted(set(self._pages) | set(other._pages)):
+            our_page = self._page_or_none(n)
+            their_page = other._page_or_none(n)
             if our_page is their_page:
                 continue
 
-            our_keys = set(our_page.keys())
-            their_keys = set(their_page.keys())
-            changes = (our_keys - their_keys) | (their_keys - our_keys) | {
-                i for i in (our_keys & their_keys) if our_page.load_mo(self.state, i) is not their_page.load_mo(self.state, i)
-            }
-            candidates.update(changes)
-
-        #both_changed = our_changes & their_changes
-        #ours_changed_only = our_changes - both_changed
-        #theirs_changed_only = their_changes - both_changed
-        #both_deleted = their_deletions & our_deletions
-        #ours_deleted_only = our_deletions - both_deleted
-        #theirs_deleted_only = their_deletions - both_deleted
-
-        differences = set()
-        for c in candidates:
-            if c not in self and c in other:
-                differences.add(c)
-            elif c in self and c not in other:
-                differences.add(c)
-            else:
-                if type(self[c]) is not SimMemoryObject:
-                    self[c] = SimMemoryObject(self.state.solver.BVV(ord(self[c]), self.byte_width), c, byte_width=self.byte_width)
-                if type(other[c]) is not SimMemoryObject:
-                    other[c] = SimMemoryObject(self.state.solver.BVV(ord(other[c]), self.byte_width), c, byte_width=self.byte_width)
-                if c in self and self[c] != other[c]:
-                    # Try to see if the bytes are equal
-                    self_byte = self[c].bytes_at(c, 1)
-                    other_byte = other[c].bytes_at(c, 1)
-                    if self_byte is not other_byte:
-                        #l.debug("%s: offset %x, two different bytes %s %s from %s %s", self.id, c,
-                        #        self_byte, other_byte,
-                        #        self[c].object.model, other[c].object.model)
-                        differences.add(c)
+            our_runs = our_page.object_runs() if our_page is not None else [ ]
+            their_runs = their_page.object_runs() if their_page is not None else [ ]
+            for start, end, our_mo, their_mo in _diff_runs(our_runs, their_runs):
+                if our_mo is None or their_mo is None:
+                    changes.append((start, end))
                 else:
-                    # this means the byte is in neither memory
-                    pass
+                    changes.extend(self._changed_in_objects(start, end, our_mo, their_mo))
 
-        return differences
+        return coalesce_ranges(changes)
+
+    def _page_or_none(self, page_num):
+        try:
+            return self._get_page(page_num)
+        except KeyError:
+            return None
+
+    def _changed_in_objects(self, start, end, our_mo, their_mo):
+        """
+        Find the bytes that differ in a range that is backed by different memory objects in two memories.
+        """
+        ours = our_mo.bytes_at(start, end - start)
+        theirs = their_mo.bytes_at(start, end - start)
+        if ours is theirs:
+            return [ ]
+
+        if self.byte_width == 8 and ours.op == 'BVV' and theirs.op == 'BVV':
+            # only the bytes that actually differ
+            diff = (ours.args[0] ^ theirs.args[0]).to_bytes(end - start, 'big')
+            return [ (start + m.start(), start + m.end()) for m in _NONZERO_BYTES.finditer(diff) ]
+
+        return [ (start, end) ]
 
     #
     # Memory object management
@@ -729,6 +812,7 @@ class SimPagedMemory:
             self._apply_object_to_page(p, mo, overwrite=overwrite)
 
         self._update_range_mappings(mo.base, mo.object, mo.length)
+        self._mark_stored(mo.base, mo.base + mo.length)
 
     def replace_memory_object(self, old, new_content):
         """
@@ -750,6 +834,7 @@ class SimPagedMemory:
         if isinstance(new.object, claripy.ast.BV):
             for b in range(old.base, old.base+old.length):
                 self._update_mappings(b, new.object)
+        self._mark_stored(old.base, old.base + old.length)
         return new
 
     def replace_all(self, old, new):
@@ -802,6 +887,34 @@ class SimPagedMemory:
             if replaced_object is not None:
                 self.replace_memory_object(mo, replaced_object)
 
+    #
+    # Store tracking
+    #
+
+    def track_stores(self):
+        """
+        Start recording which ranges of memory are stored to, so that whoever keeps information derived from the
+        contents of this memory can update only what has changed. The record is kept across branches.
+        """
+        self._stored_ranges = { }
+
+    def pop_stored_ranges(self):
+        """
+        Get the ranges that have been stored to since the last call (or since track_stores()), and start over.
+
+        :return:    A sorted list of non-overlapping (start, end) tuples, or None if stores are not being tracked.
+        :rtype:     list
+        """
+        if self._stored_ranges is None:
+            return None
+        ranges = coalesce_ranges(self._stored_ranges.items())
+        self._stored_ranges = { }
+        return ranges
+
+    def _mark_stored(self, start, end):
+        if self._stored_ranges is not None and self._stored_ranges.get(start, start) < end:
+            self._stored_ranges[start] = end
+
     #
     # Mapping bullshit
     #
@@ -1,6 +1,5 @@
 
 from collections import defaultdict
-import logging
 
 import networkx
 
@@ -29,31 +28,33 @@ def dfs_back_edges(graph, start_node):
     """
     Do a DFS traversal of the graph, and return with the back edges.
 
-    Note: This is just a naive recursive implementation, feel free to replace it.
-    I couldn't find anything in networkx to do this functionality. Although the
-    name suggest it, but `dfs_labeled_edges` is doing something different.
+    I couldn't find anything in networkx to do this functionality. Although the name suggest it, but
+    `dfs_labeled_edges` is doing something different.
 
     :param graph:       The graph to traverse.
     :param node:        The node where to start the traversal
     :returns:           An iterator of 'backward' edges
     """
 
-    visited = set()
+    visited = { start_node }
     finished = set()
 
-    def _dfs_back_edges_core(node):
-        visited.add(node)
-        for child in iter(graph[node]):
-            if child not in finished:
-                if child in  visited:
-                    yield node, child
-                else:
-                    for s,t in _dfs_back_edges_core(child):
-                        yield s,t
-        finished.add(node)
-
-    for s,t in _dfs_back_edges_core(start_node):
-        yield s,t
+    # the traversal is iterative, so that it works on graphs that are deeper than the recursion limit
+    stack = [ (start_node, iter(graph[start_node])) ]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if child in finished:
+                continue
+            if child in visited:
+                yield node, child
+            else:
+                visited.add(child)
+                stack.append((child, iter(graph[child])))
+                break
+        else:
+            stack.pop()
+            finished.add(node)
 
 
 #
@@ -128,241 +129,326 @@ class TemporaryNode(object):
         return hash('%s' % self._label)
 
 
-class ContainerNode(object):
+#
+# Dominators
+#
+
+
+class Dominators(object):
     """
-    A container node.
+    Dominator tree of a graph.
+
+    Immediate dominators are computed with the iterative algorithm from A Simple, Fast Dominance Algorithm by Keith D.
+    Cooper, Timothy J. Harvey, and Ken Kennedy. The dominator tree is then numbered with a DFS so that dominance
+    queries take constant time. Nodes that are not reachable from the entry node do not show up in any result.
 
-    Only used in post-dominator tree generation. We did this so we can set the index property without modifying the
-    original object.
+    Pass reverse=True and an exit node as the entry node to get post-dominators instead.
     """
 
-    __slots__ = ['_obj', 'index']
+    def __init__(self, graph, entry_node, reverse=False):
 
-    def __init__(self, obj):
-        self._obj = obj
-        self.index = None
+        self.entry_node = entry_node
+        self.reverse = reverse
 
-    @property
-    def obj(self):
-        return self._obj
+        # Output
+        self.idom = { }  # maps each node to its immediate dominator, the entry node is mapped to itself
+        self.dom_tree = networkx.DiGraph()
 
-    def __eq__(self, other):
-        if isinstance(other, ContainerNode):
-            return self._obj == other._obj and self.index == other.index
-        return False
+        # DFS numbering of the dominator tree
+        self._intervals = { }
 
-    def __hash__(self):
-        return 1  # I have genuinely no idea why defining a normal hash function makes everything break but it does
+        if entry_node in graph:
+            self._construct(graph, entry_node)
+
+    def __contains__(self, node):
+        return node in self._intervals
 
+    def _successors(self, graph, node):
+        return graph.predecessors(node) if self.reverse else graph.successors(node)
 
-class PostDominators(object):
+    def _predecessors(self, graph, node):
+        return graph.successors(node) if self.reverse else graph.predecessors(node)
 
-    def __init__(self, graph, entry_node, successors_func=None):
+    def _postorder(self, graph, entry_node):
+        """
+        Sort all nodes that are reachable from the entry node in DFS post-order.
 
-        self._l = logging.getLogger("utils.graph.post_dominators")
-        self._graph_successors_func = successors_func
+        :return: A list of nodes.
+        """
 
-        # Temporary variables
-        self._ancestor = None
-        self._semi = None
-        self._label = None
+        order = [ ]
+        visited = { entry_node }
+        stack = [ (entry_node, iter(self._successors(graph, entry_node))) ]
+        while stack:
+            node, successors = stack[-1]
+            for succ in successors:
+                if succ not in visited:
+                    visited.add(succ)
+                    stack.append((succ, iter(self._successors(graph, succ))))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
 
-        # Output
-        self.post_dom = None
-        self.prepared_graph = None
+        return order
 
-        self._construct(graph, entry_node)
+    def _construct(self, graph, entry_node):
 
-    def _graph_successors(self, graph, node):
+        nodes = self._postorder(graph, entry_node)
+        indices = { n: i for i, n in enumerate(nodes) }
+        entry = len(nodes) - 1
+
+        predecessors = [ [ indices[p] for p in self._predecessors(graph, n) if p in indices ] for n in nodes ]
+
+        idom = [ None ] * len(nodes)
+        idom[entry] = entry
+
+        changed = True
+        while changed:
+            changed = False
+            # walk in reverse post-order, skipping the entry node
+            for i in range(entry - 1, -1, -1):
+                new_idom = None
+                for p in predecessors[i]:
+                    if idom[p] is None:
+                        continue
+                    if new_idom is None:
+                        new_idom = p
+                        continue
+                    # intersect
+                    a, b = p, new_idom
+                    while a != b:
+                        while a < b:
+                            a = idom[a]
+                        while b < a:
+                            b = idom[b]
+                    new_idom = a
+                if idom[i] != new_idom:
+                    idom[i] = new_idom
+                    changed = True
+
+        children = [ [ ] for _ in nodes ]
+        for i, d in enumerate(idom):
+            self.idom[nodes[i]] = nodes[d]
+            self.dom_tree.add_node(nodes[i])
+            if i != entry:
+                children[d].append(i)
+                self.dom_tree.add_edge(nodes[d], nodes[i])
+
+        # number the dominator tree, so that a dominates b if and only if the interval of a encloses the interval of b
+        counter = 0
+        pre = { }
+        stack = [ (entry, False) ]
+        while stack:
+            i, finished = stack.pop()
+            if finished:
+                self._intervals[nodes[i]] = (pre[i], counter)
+                counter += 1
+                continue
+            pre[i] = counter
+            counter += 1
+            stack.append((i, True))
+            for c in children[i]:
+                stack.append((c, False))
+
+    def dominance_frontiers(self, graph):
         """
-        Return the successors of a node in the graph.
-        This method can be overriden in case there are special requirements with the graph and the successors. For
-        example, when we are dealing with a control flow graph, we may not want to get the FakeRet successors.
-
-        :param graph: The graph.
-        :param node:  The node of which we want to get the successors.
-        :return:      An iterator of successors.
-        :rtype:       iter
+        Compute the dominance frontier of each node.
+
+        :param graph:   The graph that the dominators were computed on.
+        :return:        A dict mapping each node to a set of nodes in its dominance frontier.
+        :rtype:         dict
         """
 
-        if self._graph_successors_func is not None:
-            return self._graph_successors_func(graph, node)
+        df = { n: set() for n in self.idom }
 
-        return graph.successors(node)
+        for node in self.idom:
+            preds = list(self._predecessors(graph, node))
+            if len(preds) < 2:
+                continue
+            for runner in preds:
+                if runner not in self.idom:
+                    continue
+                while runner != self.idom[node]:
+                    df[runner].add(node)
+                    runner = self.idom[runner]
 
-    def _construct(self, graph, entry_node):
+        return df
+
+    def contract(self, nodes, head, new_node):
+        """
+        Update the dominator tree after a set of nodes are replaced with a single new node in the graph. This only works
+        if all nodes are dominated by head, and all edges from other nodes into the set go to head, which is what
+        collapsing a single-entry region does. Dominance queries stay correct and constant-time afterwards.
+
+        :param set nodes:   The nodes that are replaced, including head.
+        :param head:        The only entry of the nodes.
+        :param new_node:    The node that replaces them.
+        :return:            None
         """
-        Find post-dominators for each node in the graph.
 
-        This implementation is based on paper A Fast Algorithm for Finding Dominators in a Flow Graph by Thomas
-        Lengauer and Robert E. Tarjan from Stanford University, ACM Transactions on Programming Languages and Systems,
-        Vol. 1, No. 1, July 1979
+        if head == self.entry_node:
+            self.entry_node = new_node
+            self.idom[new_node] = new_node
+            self.dom_tree.add_node(new_node)
+        else:
+            self.idom[new_node] = self.idom[head]
+            self.dom_tree.add_edge(self.idom[head], new_node)
+
+        for node in nodes:
+            if node not in self.dom_tree:
+                continue
+            for child in list(self.dom_tree.successors(node)):
+                if child not in nodes:
+                    self.idom[child] = new_node
+                    self.dom_tree.add_edge(new_node, child)
+
+        # the interval of head encloses the intervals of all nodes that it dominates, so everything that used to be
+        # dominated by any of the nodes is dominated by the new node without renumbering
+        self._intervals[new_node] = self._intervals[head]
+
+        for node in nodes:
+            self.idom.pop(node, None)
+            self._intervals.pop(node, None)
+            if node in self.dom_tree:
+                self.dom_tree.remove_node(node)
+
+    def immediate_dominator(self, node):
         """
+        Get the immediate dominator of a node.
 
-        # Step 1
+        :param node:    The node.
+        :return:        The immediate dominator, or None if the node is the entry node or is unreachable.
+        """
 
-        _prepared_graph, vertices, parent = self._prepare_graph(graph, entry_node)
-        # vertices is a list of ContainerNode instances
-        # parent is a dict storing the mapping from ContainerNode to ContainerNode
-        # Each node in prepared_graph is a ContainerNode instance
+        if node == self.entry_node:
+            return None
+        return self.idom.get(node, None)
 
-        bucket = defaultdict(set)
-        dom = [None] * (len(vertices))
-        self._ancestor = [None] * (len(vertices) + 1)
+    def dominates(self, dominator_node, node):
+        """
+        Check if a node dominates another node. Each node dominates itself.
 
-        for i in range(len(vertices) - 1, 0, -1):
-            w = vertices[i]
+        :param dominator_node:  The node that may dominate.
+        :param node:            The node that may be dominated.
+        :return:                True if dominator_node dominates node, False otherwise.
+        :rtype:                 bool
+        """
 
-            # Step 2
-            if w not in parent:
-                # It's one of the start nodes
-                continue
+        try:
+            a_pre, a_post = self._intervals[dominator_node]
+            b_pre, b_post = self._intervals[node]
+        except KeyError:
+            return False
+        return a_pre <= b_pre and b_post <= a_post
 
-            predecessors = _prepared_graph.predecessors(w)
-            for v in predecessors:
-                u = self._pd_eval(v)
-                if self._semi[u.index].index < self._semi[w.index].index:
-                    self._semi[w.index] = self._semi[u.index]
+    def strictly_dominates(self, dominator_node, node):
+        """
+        Check if a node dominates another node, and the two nodes are not the same.
 
-            bucket[vertices[self._semi[w.index].index].index].add(w)
+        :return:                True if dominator_node strictly dominates node, False otherwise.
+        :rtype:                 bool
+        """
 
-            self._pd_link(parent[w], w)
+        return dominator_node != node and self.dominates(dominator_node, node)
 
-            # Step 3
-            for v in bucket[parent[w].index]:
-                u = self._pd_eval(v)
-                if self._semi[u.index].index < self._semi[v.index].index:
-                    dom[v.index] = u
-                else:
-                    dom[v.index] = parent[w]
 
-            bucket[parent[w].index].clear()
+#
+# Loop nesting
+#
 
-        for i in range(1, len(vertices)):
-            w = vertices[i]
-            if w not in parent:
-                continue
-            if dom[w.index].index != vertices[self._semi[w.index].index].index:
-                dom[w.index] = dom[dom[w.index].index]
 
-        self.post_dom = networkx.DiGraph()  # The post-dom tree described in a directional graph
-        for i in range(1, len(vertices)):
-            if dom[i] is not None and vertices[i] is not None:
-                self.post_dom.add_edge(dom[i].obj, vertices[i].obj)
+class NaturalLoop(object):
+    """
+    A natural loop, which consists of a header, all latching nodes that jump back to the header, and all nodes that can
+    reach a latching node without going through the header.
+    """
 
-        # Output
-        self.prepared_graph = _prepared_graph
+    __slots__ = ['header', 'latching_nodes', 'body', 'parent', 'children', 'depth']
 
-    def _prepare_graph(self, graph, entry):
+    def __init__(self, header, latching_nodes, body):
+        self.header = header
+        self.latching_nodes = latching_nodes
+        self.body = body
+        self.parent = None
+        self.children = [ ]
+        self.depth = 1
 
-        # We want to reverse the graph, and label each node according to its order in a DFS
-        new_graph = networkx.DiGraph()
+    def __repr__(self):
+        return '<NaturalLoop at %r with %d nodes, depth %d>' % (self.header, len(self.body), self.depth)
 
-        n = entry
+    def __contains__(self, node):
+        return node in self.body
 
-        queue = [n]
-        start_node = TemporaryNode("start_node")
-        # Put the start_node into a Container as well
-        start_node = ContainerNode(start_node)
 
-        container_nodes = {}
+class LoopNesting(object):
+    """
+    The loop nesting forest of a graph, built from all natural loops in the graph.
 
-        traversed_nodes = set()
-        while queue:
-            node = queue.pop()
+    Back edges are edges whose destination dominates their source. Loops sharing the same header are merged into one.
+    Retreating edges in irreducible regions do not form natural loops, so those regions are not reported.
+    """
 
-            successors = list(self._graph_successors(graph, node))
+    def __init__(self, graph, dominators):
 
-            # Put it into a container
-            if node in container_nodes:
-                container_node = container_nodes[node]
-            else:
-                container_node = ContainerNode(node)
-                container_nodes[node] = container_node
-
-            traversed_nodes.add(container_node)
-
-            if len(successors) == 0:
-                # Add an edge between this node and our start node
-                new_graph.add_edge(start_node, container_node)
-
-            for s in successors:
-                if s in container_nodes:
-                    container_s = container_nodes[s]
-                else:
-                    container_s = ContainerNode(s)
-                    container_nodes[s] = container_s
-                new_graph.add_edge(container_s, container_node)  # Reversed
-                if container_s not in traversed_nodes:
-                    queue.append(s)
-
-        # Add a start node and an end node
-        new_graph.add_edge(container_nodes[n], ContainerNode(TemporaryNode("end_node")))
-
-        all_nodes_count = len(traversed_nodes) + 2  # A start node and an end node
-        self._l.debug("There should be %d nodes in all", all_nodes_count)
-        counter = 0
-        vertices = [ContainerNode("placeholder")]
-        scanned_nodes = set()
-        parent = {}
-        while True:
-            # DFS from the current start node
-            stack = [start_node]
-            while len(stack) > 0:
-                node = stack.pop()
-                counter += 1
+        self.loops = [ ]
+        self.toplevel_loops = [ ]
 
-                # Mark it as scanned
-                scanned_nodes.add(node)
+        self._innermost = { }
 
-                # Put the container node into vertices list
-                vertices.append(node)
+        self._construct(graph, dominators)
 
-                # Put each successors into the stack
-                successors = new_graph.successors(node)
+    def _construct(self, graph, dominators):
 
-                # Set the index property of it
-                node.index = counter
+        latching_nodes = defaultdict(set)
+        for src, dst in graph.edges():
+            if dominators.dominates(dst, src):
+                latching_nodes[dst].add(src)
 
-                for s in successors:
-                    if s not in scanned_nodes:
-                        stack.append(s)
-                        parent[s] = node
-                        scanned_nodes.add(s)
+        for header, latches in latching_nodes.items():
+            body = { header }
+            stack = [ n for n in latches if n not in body ]
+            body.update(stack)
+            while stack:
+                node = stack.pop()
+                for pred in graph.predecessors(node):
+                    if pred not in body and pred in dominators:
+                        body.add(pred)
+                        stack.append(pred)
+            self.loops.append(NaturalLoop(header, frozenset(latches), frozenset(body)))
+
+        # natural loops are either disjoint or nested, so walking from the largest loop to the smallest one always sees
+        # the tightest enclosing loop of a header last
+        self.loops.sort(key=lambda l: len(l.body), reverse=True)
+        for loop in self.loops:
+            parent = self._innermost.get(loop.header, None)
+            if parent is None:
+                self.toplevel_loops.append(loop)
+            else:
+                loop.parent = parent
+                loop.depth = parent.depth + 1
+                parent.children.append(loop)
+            for node in loop.body:
+                self._innermost[node] = loop
 
-            if counter >= all_nodes_count:
-                break
+    def innermost_loop(self, node):
+        """
+        Get the innermost loop that contains a node.
 
-            self._l.debug("%d nodes are left out during the DFS. They must formed a cycle themselves.",
-                          all_nodes_count - counter)
-            # Find those nodes
-            leftovers = [s for s in traversed_nodes if s not in scanned_nodes]
-            new_graph.add_edge(start_node, leftovers[0])
-            # We have to start over...
-            counter = 0
-            parent = {}
-            scanned_nodes = set()
-            vertices = [ContainerNode("placeholder")]
+        :param node:    The node.
+        :return:        A NaturalLoop instance, or None if the node is not inside any loop.
+        """
 
-        self._semi = vertices[::]
-        self._label = vertices[::]
+        return self._innermost.get(node, None)
 
-        return new_graph, vertices, parent
+    def loop_depth(self, node):
+        """
+        Get the number of loops that contain a node.
 
-    def _pd_link(self, v, w):
-        self._ancestor[w.index] = v
+        :param node:    The node.
+        :return:        The loop depth of the node. 0 if the node is not inside any loop.
+        :rtype:         int
+        """
 
-    def _pd_eval(self, v):
-        if self._ancestor[v.index] is None:
-            return v
-        else:
-            self._pd_compress(v)
-            return self._label[v.index]
-
-    def _pd_compress(self, v):
-        if self._ancestor[self._ancestor[v.index].index] is not None:
-            self._pd_compress(self._ancestor[v.index])
-            if self._semi[self._label[self._ancestor[v.index].index].index].index < \
-                    self._semi[self._label[v.index].index].index:
-                self._label[v.index] = self._label[self._ancestor[v.index].index]
-            self._ancestor[v.index] = self._ancestor[self._ancestor[v.index].index]
+        loop = self._innermost.get(node, None)
+        return loop.depth if loop is not None else 0
@@ -0,0 +1,73 @@
+import queue
+import multiprocessing
+
+import networkx
+
+
+# the context of the running run_condensed_in_pool() call, inherited by its forked worker processes
+_worker_context = None
+
+
+def run_condensed_in_pool(graph, processes, worker, make_job, on_result, context=None):
+    """
+    Run one job per strongly connected component of a dependency graph in a pool of forked worker processes. A
+    component is submitted as soon as all components it has edges to are done, e.g. callers after their callees.
+
+    :param networkx.DiGraph graph:  The dependency graph, with edges from each node to the nodes it depends on.
+    :param int processes:           Number of worker processes. Requires the fork start method.
+    :param worker:                  A module-level function that runs a job in a worker process. It is called with the
+                                    context and the job, and its return value is passed to `on_result`.
+    :param make_job:                A callable that takes the set of nodes of a component and returns the job for it.
+                                    It is called in the main process, after all components it depends on are done.
+    :param on_result:               A callable that takes the set of nodes of a component and the result of its job. It
+                                    is called in the main process.
+    :param context:                 Anything else the workers need. It is inherited by the forked workers instead of
+                                    being pickled with every job.
+    """
+
+    global _worker_context  # pylint:disable=global-statement
+
+    components = networkx.condensation(graph)
+    members = networkx.get_node_attributes(components, 'members')
+
+    # number of components each component depends on that are not done yet
+    pending = { c: components.out_degree(c) for c in components.nodes() }
+
+    _worker_context = context
+    try:
+        pool = multiprocessing.get_context('fork').Pool(processes)
+        results = queue.Queue()
+
+        def _submit(c):
+            pool.apply_async(_run_job, (worker, c, make_job(members[c])),
+                             callback=results.put, error_callback=results.put)
+
+        try:
+            in_flight = 0
+            for c, n in pending.items():
+                if n == 0:
+                    _submit(c)
+                    in_flight += 1
+
+            while in_flight:
+                r = results.get()
+                in_flight -= 1
+                if isinstance(r, BaseException):
+                    raise r
+
+                c, result = r
+                on_result(members[c], result)
+
+                for dependent in components.predecessors(c):
+                    pending[dependent] -= 1
+                    if pending[dependent] == 0:
+                        _submit(dependent)
+                        in_flight += 1
+        finally:
+            pool.terminate()
+    finally:
+        _worker_context = None
+
+
+def _run_job(worker, c, job):
+    return c, worker(_worker_context, job)
@@ -1,5 +1,6 @@
 #include <unicorn/unicorn.h>
 
+#include <cstdio>
 #include <cstring>
 #include <cstdint>
 #include <cinttypes>
@@ -10,6 +11,13 @@
 #include <unordered_set>
 #include <unordered_map>
 #include <set>
+#include <string>
+
+#ifndef _WIN32
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#endif
 
 extern "C" {
 #include <libvex.h>
@@ -70,6 +78,78 @@ typedef struct caches {
 } caches_t;
 std::map<uint64_t, caches_t> global_cache;
 
+// Directory of the page store shared between processes, or empty if cached pages are private to this process
+std::string shared_page_dir;
+
+static uint64_t page_hash(const uint8_t *bytes, size_t size) {
+	// FNV-1a
+	uint64_t hash = 0xcbf29ce484222325ULL;
+	for (size_t i = 0; i < size; i++) {
+		hash ^= bytes[i];
+		hash *= 0x100000001b3ULL;
+	}
+	return hash;
+}
+
+#ifndef _WIN32
+/*
+ * Map a page from the shared page store, adding it to the store first if no other process has done so yet. Pages are
+ * files named after the hash of their content, and are mapped copy-on-write, so all processes share the same physical
+ * memory for them until one of them writes to its copy.
+ */
+static uint8_t *map_shared_page(const uint8_t *bytes) {
+	char name[32];
+	snprintf(name, sizeof(name), "/%016" PRIx64, page_hash(bytes, PAGE_SIZE));
+	std::string path = shared_page_dir + name;
+
+	int fd = open(path.c_str(), O_RDONLY);
+	if (fd < 0) {
+		// write the page to a temporary file and move it into place, so no process ever maps a partial page
+		std::string tmp_path = path + "." + std::to_string(getpid());
+		int tmp_fd = open(tmp_path.c_str(), O_WRONLY | O_CREAT | O_TRUNC, 0644);
+		if (tmp_fd < 0) {
+			return NULL;
+		}
+		bool written = write(tmp_fd, bytes, PAGE_SIZE) == PAGE_SIZE;
+		close(tmp_fd);
+		if (!written || rename(tmp_path.c_str(), path.c_str()) != 0) {
+			unlink(tmp_path.c_str());
+			return NULL;
+		}
+		fd = open(path.c_str(), O_RDONLY);
+		if (fd < 0) {
+			return NULL;
+		}
+	}
+
+	void *page = mmap(NULL, PAGE_SIZE, PROT_READ | PROT_WRITE, MAP_PRIVATE, fd, 0);
+	close(fd);
+	if (page == MAP_FAILED) {
+		return NULL;
+	}
+	if (memcmp(page, bytes, PAGE_SIZE) != 0) {
+		// hash collision, or a truncated file
+		munmap(page, PAGE_SIZE);
+		return NULL;
+	}
+	return (uint8_t *)page;
+}
+#endif
+
+static uint8_t *alloc_cached_page(const uint8_t *bytes) {
+#ifndef _WIN32
+	if (!shared_page_dir.empty()) {
+		uint8_t *page = map_shared_page(bytes);
+		if (page != NULL) {
+			return page;
+		}
+	}
+#endif
+	uint8_t *copy = (uint8_t *)malloc(PAGE_SIZE);
+	memcpy(copy, bytes, PAGE_SIZE);
+	return copy;
+}
+
 typedef std::unordered_set<uint64_t> RegisterSet;
 
 typedef struct mem_access {
@@ -556,14 +636,12 @@ public:
 		}
 
 		for (uint64_t offset = 0; offset < size; offset += 0x1000) {
-			uint8_t *copy = (uint8_t *)malloc(0x1000);
 			CachedPage cached_page = {
 				0x1000,
-				copy,
+				// address should be aligned to 0x1000
+				alloc_cached_page((uint8_t *)&bytes[offset]),
 				permissions
 			};
-			// address should be aligned to 0x1000
-			memcpy(copy, &bytes[offset], 0x1000);
 			page_cache->insert(std::pair<uint64_t, CachedPage>(address+offset, cached_page));
 		}
 		return std::make_pair(address, size);
@@ -1414,6 +1492,15 @@ void simunicorn_uncache_page(State *state, uint64_t address) {
 	state->uncache_page(address);
 }
 
+/*
+ * Keep the cached pages of all processes that use the same directory in a shared page store. Pass an empty path to keep
+ * cached pages private to this process.
+ */
+extern "C"
+void simunicorn_set_shared_page_dir(const char *path) {
+	shared_page_dir = path;
+}
+
 // Tracking settings
 extern "C"
 void simunicorn_set_tracking(State *state, bool track_bbls, bool track_stack) {
@@ -0,0 +1,470 @@
+#!/usr/bin/env python
+"""
+Performance regression suite for the symbolic execution core.
+
+Each benchmark runs a fixed workload in a fresh process, a number of times, and reports timings for each phase of the
+workload, its throughput, and the peak RSS of the process. Results are written as JSON. A previous result file can be
+given as a baseline, in which case the suite reports every benchmark that got slower or bigger than the baseline by more
+than a threshold, and exits with a non-zero status.
+
+    # run everything and store a baseline
+    python perf_suite.py -n 5 -o baseline.json
+    # run again after an upgrade, and compare
+    python perf_suite.py -n 5 -o current.json --baseline baseline.json
+    # run only some benchmarks
+    python perf_suite.py cfgfast state_copy
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import platform
+import argparse
+import resource
+import traceback
+import multiprocessing
+from queue import Empty
+from collections import OrderedDict
+
+import angr
+
+test_location = str(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'binaries', 'tests'))
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name, unit):
+    """
+    Register a benchmark. The decorated function takes a Phases instance, runs its workload, and returns the number of
+    units of work that it has done in the phases marked as measured.
+    """
+
+    def decorator(f):
+        BENCHMARKS[name] = (f, unit)
+        return f
+    return decorator
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+class Phases(object):
+    """
+    Record how long each phase of a benchmark takes.
+    """
+
+    def __init__(self):
+        self.timings = OrderedDict()
+        self.measured = 0.0
+
+    def __call__(self, name, measured=True):
+        return _Phase(self, name, measured)
+
+
+class _Phase(object):
+
+    def __init__(self, phases, name, measured):
+        self._phases = phases
+        self._name = name
+        self._measured = measured
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        elapsed = time.time() - self._start
+        self._phases.timings[self._name] = self._phases.timings.get(self._name, 0.0) + elapsed
+        if self._measured:
+            self._phases.measured += elapsed
+
+
+#
+# Workloads
+#
+
+@benchmark('vex_stepping', 'blocks')
+def bench_vex_stepping(phases):
+    with phases('load', measured=False):
+        p = angr.Project(os.path.join(test_location, 'x86_64', 'fauxware'), auto_load_libs=False)
+        state = p.factory.entry_state()
+        simgr = p.factory.simulation_manager(state)
+
+    blocks = 0
+    with phases('step'):
+        while simgr.active and blocks < 5000:
+            blocks += len(simgr.active)
+            simgr.step()
+            # keep the workload bounded and deterministic
+            simgr.drop(stash='deadended')
+            if len(simgr.active) > 16:
+                simgr.split(limit=16, to_stash='pruned')
+                simgr.drop(stash='pruned')
+    return blocks
+
+
+@benchmark('paged_memory', 'ops')
+def bench_paged_memory(phases):
+    state = angr.SimState(arch='AMD64', mode='symbolic')
+    base = 0x100000
+    count = 4096
+
+    with phases('store_concrete'):
+        for i in range(count):
+            state.memory.store(base + i * 8, state.solver.BVV(i, 64))
+    with phases('load_concrete'):
+        for i in range(count):
+            state.memory.load(base + i * 8, 8)
+    with phases('store_symbolic'):
+        for i in range(count):
+            state.memory.store(base + i * 8, state.solver.BVS('v%d' % i, 64))
+    with phases('load_symbolic'):
+        for i in range(count):
+            state.memory.load(base + i * 8, 8)
+    with phases('branch'):
+        # copy-on-write: each branch only touches a few pages
+        s = state
+        for i in range(count // 8):
+            s = s.copy()
+            s.memory.store(base + (i * 64) % (count * 8), state.solver.BVV(i, 64))
+    return count * 4 + count // 8
+
+
+@benchmark('state_copy', 'states')
+def bench_state_copy(phases):
+    with phases('load', measured=False):
+        p = angr.Project(os.path.join(test_location, 'x86_64', 'fauxware'), auto_load_libs=False)
+        state = p.factory.full_init_state()
+
+    count = 2000
+    with phases('copy'):
+        for _ in range(count):
+            state.copy()
+    return count
+
+
+@benchmark('cfgfast', 'blocks')
+def bench_cfgfast(phases):
+    blocks = 0
+    for arch, binary in [ ('x86_64', 'fauxware'), ('i386', 'fauxware'), ('armel', 'fauxware'), ('mips', 'fauxware'),
+                          ('x86_64', 'cfg_switches') ]:
+        with phases('load_%s_%s' % (arch, binary), measured=False):
+            p = angr.Project(os.path.join(test_location, arch, binary), auto_load_libs=False)
+        with phases('cfg_%s_%s' % (arch, binary)):
+            cfg = p.analyses.CFGFast()
+        blocks += len(cfg.graph)
+    return blocks
+
+
+@benchmark('jumptable_resolver', 'jumps')
+def bench_jumptable_resolver(phases):
+    with phases('load', measured=False):
+        p = angr.Project(os.path.join(test_location, 'x86_64', 'cfg_switches'), auto_load_libs=False)
+    with phases('cfg', measured=False):
+        cfg = p.analyses.CFGFast(resolve_indirect_jumps=False)
+
+    resolver = angr.analyses.cfg.indirect_jump_resolvers.JumpTableResolver(p)
+    jumps = 0
+    with phases('resolve'):
+        for addr, ij in cfg.indirect_jumps.items():
+            block = p.factory.block(addr).vex
+            if resolver.filter(cfg, addr, ij.func_addr, block, ij.jumpkind):
+                resolver.resolve(cfg, addr, ij.func_addr, block, ij.jumpkind)
+                jumps += 1
+    return jumps
+
+
+@benchmark('string_procedures', 'calls')
+def bench_string_procedures(phases):
+    libc = angr.SIM_LIBRARIES['libc.so.6']
+
+    def call(name, state, *args):
+        return libc.get(name, 'AMD64').execute(state, arguments=args).ret_expr
+
+    calls = 0
+    for i in range(10):
+        state = angr.SimState(arch='AMD64', mode='symbolic')
+        a_addr = state.solver.BVV(0x10, 64)
+        b_addr = state.solver.BVV(0xb0, 64)
+        state.memory.store(a_addr, state.solver.BVV(0x41414100, 32), endness='Iend_BE')
+        state.memory.store(b_addr, state.solver.BVS('b_%d' % i, 8 * 16), endness='Iend_BE')
+
+        with phases('strlen'):
+            ret = call('strlen', state, b_addr)
+            state.solver.eval_upto(ret, 20)
+        with phases('strcmp'):
+            s = state.copy()
+            ret = call('strcmp', s, a_addr, b_addr)
+            s.solver.eval_upto(ret, 4)
+        with phases('strstr'):
+            s = state.copy()
+            ret = call('strstr', s, b_addr, a_addr)
+            s.solver.eval_upto(ret, 4)
+        calls += 3
+    return calls
+
+
+@benchmark('tracer_replay', 'blocks')
+def bench_tracer_replay(phases):
+    try:
+        from common import do_trace  # pylint:disable=import-error
+    except Exception as ex:  # pylint:disable=broad-except
+        raise SkipBenchmark(str(ex))
+
+    with phases('load', measured=False):
+        p = angr.Project(os.path.join(test_location, 'x86_64', 'fauxware'))
+        stdin = b'A' * 18
+        try:
+            trace, _, crash_mode, crash_addr = do_trace(p, 'tracer_fauxware', stdin,
+                                                       ld_linux=p.loader.linux_loader_object.binary,
+                                                       library_path=set(os.path.dirname(obj.binary)
+                                                                        for obj in p.loader.all_elf_objects),
+                                                       record_stdout=True)
+        except Exception as ex:  # pylint:disable=broad-except
+            raise SkipBenchmark("No trace is available: %s" % ex)
+        s = p.factory.full_init_state(mode='tracing', stdin=angr.SimFileStream)
+        s.preconstrainer.preconstrain_file(stdin, s.posix.stdin, True)
+        simgr = p.factory.simulation_manager(s, hierarchy=False, save_unconstrained=crash_mode)
+        simgr.use_technique(angr.exploration_techniques.Tracer(trace, crash_addr=crash_addr))
+
+    blocks = 0
+    with phases('replay'):
+        while simgr.active:
+            blocks += len(simgr.active)
+            simgr.step()
+    return blocks
+
+
+@benchmark('bindiff', 'functions')
+def bench_bindiff(phases):
+    with phases('load', measured=False):
+        p_a = angr.Project(os.path.join(test_location, 'x86_64', 'bindiff_a'), auto_load_libs=False)
+        p_b = angr.Project(os.path.join(test_location, 'x86_64', 'bindiff_b'), auto_load_libs=False)
+    with phases('diff'):
+        bindiff = p_a.analyses.BinDiff(p_b)
+    return len(bindiff.identical_functions) + len(bindiff.differing_functions)
+
+
+#
+# Runner
+#
+
+def run_once(name, seed, queue):
+    func, _ = BENCHMARKS[name]
+
+    random.seed(seed)
+    phases = Phases()
+    start = time.time()
+    try:
+        work = func(phases)
+    except SkipBenchmark as ex:
+        queue.put({'skipped': str(ex)})
+        return
+    except Exception:  # pylint:disable=broad-except
+        queue.put({'error': traceback.format_exc()})
+        return
+    elapsed = time.time() - start
+
+    queue.put({
+        'time': elapsed,
+        'measured_time': phases.measured,
+        'work': work,
+        'phases': phases.timings,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+    })
+
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def wait_for_run(proc, result_queue, timeout):
+    """
+    Wait for the result of a run, and for the process that performs it to exit.
+
+    :return: The result, or an error if the process died without reporting one or took longer than `timeout` seconds.
+    """
+
+    deadline = time.time() + timeout
+    while True:
+        try:
+            r = result_queue.get(timeout=1)
+            break
+        except Empty:
+            if not proc.is_alive():
+                # the process may have put its result just before exiting
+                try:
+                    r = result_queue.get(timeout=1)
+                    break
+                except Empty:
+                    proc.join()
+                    return {'error': 'The benchmark process died with exit code %s.\n' % proc.exitcode}
+            if time.time() > deadline:
+                proc.terminate()
+                proc.join()
+                return {'error': 'The benchmark did not finish within %d seconds.\n' % timeout}
+
+    proc.join(timeout=60)
+    if proc.is_alive():
+        proc.terminate()
+        proc.join()
+    elif proc.exitcode != 0 and 'error' not in r:
+        return {'error': 'The benchmark process exited with exit code %s.\n' % proc.exitcode}
+    return r
+
+
+def run_benchmark(name, n_runs, seed, timeout):
+    _, unit = BENCHMARKS[name]
+
+    runs = [ ]
+    result_queue = multiprocessing.Queue()
+    for _ in range(n_runs):
+        # each run gets a fresh process, so that caches and the peak RSS of one run do not leak into the next one
+        proc = multiprocessing.Process(target=run_once, args=(name, seed, result_queue))
+        proc.start()
+        r = wait_for_run(proc, result_queue, timeout)
+        if 'skipped' in r or 'error' in r:
+            return r
+        runs.append(r)
+
+    throughputs = [ r['work'] / r['measured_time'] if r['measured_time'] > 0 else 0.0 for r in runs ]
+    phase_names = list(runs[0]['phases'])
+
+    return {
+        'runs': n_runs,
+        'unit': unit,
+        'work': runs[0]['work'],
+        'time': {
+            'min': min(r['time'] for r in runs),
+            'median': median([ r['time'] for r in runs ]),
+            'max': max(r['time'] for r in runs),
+        },
+        'throughput': {
+            'unit': '%s/sec' % unit,
+            'min': min(throughputs),
+            'median': median(throughputs),
+            'max': max(throughputs),
+        },
+        'phases': OrderedDict((p, median([ r['phases'].get(p, 0.0) for r in runs ])) for p in phase_names),
+        'peak_rss_mb': max(r['peak_rss_mb'] for r in runs),
+    }
+
+
+def compare(results, baseline, threshold, rss_threshold):
+    """
+    Compare results against a baseline.
+
+    :return: A list of (benchmark, metric, baseline value, current value) tuples, one for each regression.
+    """
+
+    regressions = [ ]
+
+    for name, r in results['benchmarks'].items():
+        b = baseline['benchmarks'].get(name, None)
+        if b is None or 'throughput' not in r or 'throughput' not in b:
+            continue
+
+        if r['throughput']['median'] < b['throughput']['median'] * (1 - threshold):
+            regressions.append((name, r['throughput']['unit'], b['throughput']['median'], r['throughput']['median']))
+        if r['peak_rss_mb'] > b['peak_rss_mb'] * (1 + rss_threshold):
+            regressions.append((name, 'peak_rss_mb', b['peak_rss_mb'], r['peak_rss_mb']))
+        for phase, t in r['phases'].items():
+            base_t = b['phases'].get(phase, None)
+            # ignore phases too short to be measured reliably
+            if base_t is not None and base_t > 0.05 and t > base_t * (1 + threshold):
+                regressions.append((name, 'phase %s (sec)' % phase, base_t, t))
+
+    return regressions
+
+
+def print_results(results):
+    print("%-20s %12s %18s %12s" % ('benchmark', 'median (s)', 'throughput', 'peak RSS'))
+    for name, r in results['benchmarks'].items():
+        if 'throughput' not in r:
+            print("%-20s %s" % (name, 'skipped: %s' % r['skipped'] if 'skipped' in r else 'error'))
+            continue
+        print("%-20s %12.3f %18s %9.1f MB" % (name, r['time']['median'],
+                                             '%.1f %s' % (r['throughput']['median'], r['throughput']['unit']),
+                                             r['peak_rss_mb']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='angr performance regression suite')
+    parser.add_argument('benchmarks', nargs='*', help='Benchmarks to run (default: all of %s)' % ", ".join(BENCHMARKS))
+    parser.add_argument('-n', '--n-runs', default=3, type=int, help='How many runs to perform for each benchmark')
+    parser.add_argument('-s', '--seed', default=1234, type=int, help='Seed for random')
+    parser.add_argument('-o', '--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare the results against a JSON file written by a previous run')
+    parser.add_argument('--threshold', default=0.1, type=float,
+                        help='Relative slowdown that counts as a regression (default: 0.1)')
+    parser.add_argument('--rss-threshold', default=0.2, type=float,
+                        help='Relative growth of the peak RSS that counts as a regression (default: 0.2)')
+    parser.add_argument('--timeout', default=3600, type=int,
+                        help='Seconds after which a run is stopped and counted as an error (default: 3600)')
+    args = parser.parse_args()
+
+    logging.getLogger('angr').setLevel(logging.ERROR)
+
+    names = args.benchmarks or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("Unknown benchmark %s" % name)
+
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'n_runs': args.n_runs,
+            'timestamp': time.time(),
+        },
+        'benchmarks': OrderedDict(),
+    }
+
+    for name in names:
+        sys.stderr.write("Running %s...\n" % name)
+        results['benchmarks'][name] = run_benchmark(name, args.n_runs, args.seed, args.timeout)
+        if 'error' in results['benchmarks'][name]:
+            sys.stderr.write(results['benchmarks'][name]['error'])
+
+    print_results(results)
+
+    regressions = [ ]
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.rss_threshold)
+        results['baseline'] = args.baseline
+        results['regressions'] = regressions
+        if regressions:
+            print("\nRegressions against %s:" % args.baseline)
+            for name, metric, before, after in regressions:
+                print("%-20s %-30s %12.3f -> %12.3f" % (name, metric, before, after))
+        else:
+            print("\nNo regressions against %s." % args.baseline)
+
+    # a benchmark that crashes or hangs fails the suite, whether there is a baseline or not
+    errors = [ name for name, r in results['benchmarks'].items() if 'error' in r ]
+    if errors:
+        results['errors'] = errors
+        print("\nBenchmarks with errors: %s" % ", ".join(errors))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if regressions or errors:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -74,6 +74,25 @@ def run_callable_c_manysum(arch):
     nose.tools.assert_false(result.symbolic)
     nose.tools.assert_equal(result._model_concrete.value, sum(range(12)))
 
+def run_call_many_manysum(arch):
+    addr = addresses_manysum[arch]
+    p = angr.Project(os.path.join(location, arch, 'manysum'))
+    cc = p.factory.cc(func_ty="int f(int, int, int, int, int, int, int, int, int, int, int)")
+    sumlots = p.factory.callable(addr, cc=cc)
+    vectors = [ list(range(i, i + 11)) for i in range(4) ]
+    results = list(sumlots.call_many(vectors))
+    nose.tools.assert_equal(len(results), len(vectors))
+    for args, result in zip(vectors, results):
+        nose.tools.assert_false(result.symbolic)
+        nose.tools.assert_equal(result._model_concrete.value, sum(args))
+
+    # a symbolic vector must not disturb the concrete ones around it
+    x = claripy.BVS('x', 32)
+    results = list(sumlots.call_many([ [1]*11, [x] + [0]*10, [2]*11 ]))
+    nose.tools.assert_equal(results[0]._model_concrete.value, 11)
+    nose.tools.assert_true(results[1].symbolic)
+    nose.tools.assert_equal(results[2]._model_concrete.value, 22)
+
 type_cache = None
 
 def run_manyfloatsum(arch):
@@ -137,6 +156,11 @@ def test_manyfloatsum_symbolic():
         yield run_manyfloatsum_symbolic, arch
 
 
+def test_call_many():
+    for arch in ('i386', 'x86_64', 'armel'):
+        yield run_call_many_manysum, arch
+
+
 def test_callable_c_fauxware():
     for arch in addresses_fauxware:
         yield run_callable_c_fauxware, arch
@@ -167,6 +191,10 @@ if __name__ == "__main__":
     for func, march in test_manysum():
         print('* testing ' + march)
         func(march)
+    print('testing call_many')
+    for func, march in test_call_many():
+        print('* testing ' + march)
+        func(march)
     print('testing manyfloatsum with c_style strings')
     for func, march in test_callable_c_manyfloatsum():
         print('* testing ' + march)
@@ -66,6 +66,21 @@ def test_fauxware():
         yield run_fauxware, arch, lst
 
 
+def test_recover_calling_conventions():
+    binary_path = os.path.join(test_location, 'tests', 'x86_64', 'fauxware')
+
+    ccs = [ ]
+    for processes in (None, 2):
+        fauxware = angr.Project(binary_path, auto_load_libs=False)
+        fauxware.analyses.CFG()
+        angr.analyses.CallingConventionAnalysis.recover_calling_conventions(fauxware, processes=processes)
+        ccs.append({ f.addr: f.calling_convention for f in fauxware.kb.functions.values() })
+
+    # the parallel driver recovers the same calling conventions as the worklist
+    nose.tools.assert_equal(ccs[0], ccs[1])
+    nose.tools.assert_true(any(cc is not None for cc in ccs[0].values()))
+
+
 # def test_cgc():
 def disabled_cgc():
     # Skip this test since we do not have the binaries-private repo cloned on Travis CI.
@@ -85,6 +100,7 @@ def run_all():
     for args in test_fauxware():
         func, args = args[0], args[1:]
         func(*args)
+    test_recover_calling_conventions()
 
     #for args in test_cgc():
     #    func, args = args[0], args[1:]
@@ -6,7 +6,8 @@ import nose.tools
 
 import angr
 
-from angr.analyses.cfg.cfg_fast import SegmentList
+from angr.analyses.cfg.cfg_fast import SegmentList, CFGFast
+from angr.analyses.cfg.memory_scanner import MemoryScanner
 
 l = logging.getLogger("angr.tests.test_cfgfast")
 
@@ -417,6 +418,58 @@ def test_segment_list_6():
     nose.tools.assert_equal(seg_list._list[1].end, 30)
     nose.tools.assert_equal(seg_list._list[1].sort, 'code')
 
+def test_segment_list_7():
+    seg_list = SegmentList()
+
+    seg_list.occupy(0, 4, "code")
+    seg_list.occupy(6, 2, "string")
+    seg_list.occupy(10, 4, "code")
+    seg_list.occupy(14, 2, "alignment")
+
+    nose.tools.assert_equal(seg_list.next_free_pos(2), 4)
+    nose.tools.assert_equal(seg_list.next_free_pos(10), 16)
+    nose.tools.assert_equal(seg_list.next_pos_with_sort_not_in(0, { "code" }), 6)
+    nose.tools.assert_equal(seg_list.next_pos_with_sort_not_in(11, { "code" }), 14)
+    nose.tools.assert_is_none(seg_list.next_pos_with_sort_not_in(0, { "code" }, max_distance=4))
+    nose.tools.assert_is_none(seg_list.next_pos_with_sort_not_in(15, { "alignment" }))
+
+    copy = seg_list.copy()
+
+    # the new block takes over the first block of another sort that it overlaps with, and leaves the others alone
+    seg_list.occupy(2, 10, "data")
+
+    nose.tools.assert_equal(len(seg_list), 6)
+    nose.tools.assert_equal([ (s.start, s.end, s.sort) for s in seg_list._list ],
+                            [ (0, 2, "code"), (2, 6, "data"), (6, 8, "string"), (8, 10, "data"), (10, 14, "code"),
+                              (14, 16, "alignment") ])
+    nose.tools.assert_equal(seg_list.occupied_size, 16)
+    nose.tools.assert_equal(seg_list.occupied_by_sort(7), "string")
+    nose.tools.assert_equal(seg_list.next_pos_with_sort_not_in(2, { "data" }), 6)
+
+    # the copy is not affected
+    nose.tools.assert_equal(len(copy), 4)
+    nose.tools.assert_equal(copy.occupied_by_sort(7), "string")
+    nose.tools.assert_equal(copy.occupied_size, 12)
+
+def test_segment_list_8():
+    seg_list = SegmentList()
+
+    seg_list.occupy(20, 7, "code")
+    seg_list.occupy(27, 7, "string")
+    # the data block starts inside the code block, so the string after it is kept
+    seg_list.occupy(24, 10, "data")
+
+    nose.tools.assert_equal([ (s.start, s.end, s.sort) for s in seg_list._list ],
+                            [ (20, 24, "code"), (24, 27, "data"), (27, 34, "string") ])
+    nose.tools.assert_equal(seg_list.occupied_size, 14)
+
+    # blocks of the same sort are merged across the gaps they fill
+    seg_list.occupy(34, 2, "data")
+    seg_list.occupy(18, 20, "data")
+    nose.tools.assert_equal([ (s.start, s.end, s.sort) for s in seg_list._list ],
+                            [ (18, 27, "data"), (27, 34, "string"), (34, 38, "data") ])
+    nose.tools.assert_equal(seg_list.occupied_size, 20)
+
 #
 # Indirect jump resolvers
 #
@@ -534,6 +587,46 @@ def test_collect_data_references():
     nose.tools.assert_equal(sneaky_str.content, b"SOSNEAKY")
 
 
+def test_memory_scanner():
+
+    path = os.path.join(test_location, 'x86_64', 'fauxware')
+    proj = angr.Project(path, auto_load_libs=False)
+
+    try:
+        scanner = MemoryScanner(proj.loader.memory, CFGFast.PRINTABLES)
+    except ImportError:
+        raise nose.SkipTest()
+
+    # compare against loading one byte at a time
+    limit = proj.loader.main_object.max_addr + 1
+    for addr in range(0x4008c0, 0x400900):
+        for kind in (MemoryScanner.PRINTABLE, 0x00, 0xcc):
+            end = addr
+            while end < limit:
+                try:
+                    b = proj.loader.memory[end]
+                except KeyError:
+                    break
+                if (b not in CFGFast.PRINTABLES) if kind == MemoryScanner.PRINTABLE else (b != kind):
+                    break
+                end += 1
+            nose.tools.assert_equal(scanner.run_end(addr, kind, limit)[0], end)
+
+    # the string at 0x4008d0
+    nose.tools.assert_equal(scanner.run_end(0x4008d0, MemoryScanner.PRINTABLE, limit), (0x4008d8, True))
+    nose.tools.assert_equal(scanner.byte(0x4008d8), 0)
+
+    # backers may be any object that supports the buffer protocol
+    class _Memory(object):
+        def backers(self):
+            yield 0x1000, b'abc\x00'
+            yield 0x2000, bytearray(b'\xcc\xcc')
+
+    scanner = MemoryScanner(_Memory(), CFGFast.PRINTABLES)
+    nose.tools.assert_equal(scanner.run_end(0x1000, MemoryScanner.PRINTABLE, 0x3000), (0x1003, True))
+    nose.tools.assert_equal(scanner.run_end(0x2000, 0xcc, 0x3000), (0x2002, False))
+
+
 def run_all():
 
     g = globals()
@@ -567,6 +660,7 @@ def run_all():
     test_block_instruction_addresses_armhf()
     test_blanket_fauxware()
     test_collect_data_references()
+    test_memory_scanner()
 
 
 def main():
@@ -22,5 +22,26 @@ def test_hasxor():
     nose.tools.assert_in(CodeTags.HAS_BITSHIFTS, ct_elfhash.tags)
 
 
+def test_run_on_functions():
+    p = angr.Project(os.path.join(tests_base, 'x86_64', 'HashTest'), auto_load_libs=False)
+    cfg = p.analyses.CFG()
+    funcs = [ cfg.kb.functions[name] for name in ('RSHash', 'JSHash', 'ELFHash') ]
+
+    serial = p.analyses.run_on_functions('CodeTagging', functions=funcs, collect=lambda ct: ct.tags)
+    parallel = p.analyses.run_on_functions('CodeTagging', functions=funcs, processes=2, collect=lambda ct: ct.tags)
+    nose.tools.assert_equal(serial.results, parallel.results)
+    nose.tools.assert_in(CodeTags.HAS_XOR, parallel.results[cfg.kb.functions['JSHash'].addr])
+    nose.tools.assert_equal(set(parallel.timings), set(f.addr for f in funcs))
+    nose.tools.assert_equal(parallel.failed, [ ])
+
+    # variables recovered in worker processes end up in the knowledge base of the main process
+    r = p.analyses.run_on_functions('VariableRecoveryFast', functions=funcs, processes=2, callgraph_order=True)
+    nose.tools.assert_equal(r.failed, [ ])
+    for f in funcs:
+        nose.tools.assert_in(f.addr, p.kb.variables.function_managers)
+        nose.tools.assert_true(p.kb.variables[f.addr].get_variables())
+
+
 if __name__ == "__main__":
     test_hasxor()
+    test_run_on_functions()
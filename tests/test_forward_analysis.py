@@ -0,0 +1,87 @@
+import collections
+
+import networkx
+import nose
+
+from angr.codenode import BlockNode
+from angr.analyses.forward_analysis import ForwardAnalysis, FunctionGraphVisitor
+
+
+class _FakeFunction(object):
+    def __init__(self, graph, startpoint):
+        self.graph = graph
+        self.startpoint = startpoint
+
+
+class _ReachedBlocks(ForwardAnalysis):
+    """
+    For each node, collect the addresses of all nodes on any path leading to it. The analysis always reports a change,
+    so it only terminates if successors are not revisited when their input state stays the same.
+    """
+    def __init__(self, func):
+        super(_ReachedBlocks, self).__init__(graph_visitor=FunctionGraphVisitor(func))
+        self.runs = collections.Counter()
+        self.inputs = { }
+
+    def _pre_analysis(self):
+        pass
+
+    def _intra_analysis(self):
+        pass
+
+    def _post_analysis(self):
+        pass
+
+    def _initial_abstract_state(self, node):
+        return frozenset()
+
+    def _merge_states(self, node, *states):
+        return frozenset().union(*states)
+
+    def _run_on_node(self, node, state):
+        self.runs[node.addr] += 1
+        self.inputs[node.addr] = state
+        return True, state | { node.addr }
+
+
+def test_graph_worklist_fixedpoint():
+    nodes = { addr: BlockNode(addr, 4) for addr in (0x10, 0x20, 0x30, 0x40, 0x50) }
+    graph = networkx.DiGraph()
+    graph.add_edge(nodes[0x10], nodes[0x20])
+    graph.add_edge(nodes[0x20], nodes[0x30])
+    graph.add_edge(nodes[0x30], nodes[0x20])
+    graph.add_edge(nodes[0x30], nodes[0x40])
+    graph.add_edge(nodes[0x20], nodes[0x50])
+
+    analysis = _ReachedBlocks(_FakeFunction(graph, nodes[0x10]))
+    analysis._analyze()
+
+    nose.tools.assert_equal(analysis.inputs[0x20], frozenset([0x10, 0x20, 0x30]))
+    nose.tools.assert_equal(analysis.inputs[0x40], frozenset([0x10, 0x20, 0x30]))
+    nose.tools.assert_equal(analysis.inputs[0x50], frozenset([0x10, 0x20, 0x30]))
+    # nodes outside of the loop are visited at most once more after their predecessors have changed
+    nose.tools.assert_equal(analysis.runs[0x10], 1)
+    nose.tools.assert_true(all(n <= 3 for n in analysis.runs.values()))
+
+
+def test_graph_visitor_order():
+    nodes = { addr: BlockNode(addr, 4) for addr in (0x10, 0x20, 0x30) }
+    graph = networkx.DiGraph()
+    graph.add_edge(nodes[0x10], nodes[0x20])
+    graph.add_edge(nodes[0x20], nodes[0x30])
+
+    visitor = FunctionGraphVisitor(_FakeFunction(graph, nodes[0x10]))
+    nose.tools.assert_equal([ visitor.next_node() for _ in range(3) ], [ nodes[0x10], nodes[0x20], nodes[0x30] ])
+    nose.tools.assert_is_none(visitor.next_node())
+
+    # pending nodes are always handed out in traversal order
+    visitor.revisit_node(nodes[0x30])
+    visitor.revisit(nodes[0x10], include_self=False)
+    nose.tools.assert_equal(visitor.next_node(), nodes[0x20])
+    nose.tools.assert_equal(visitor.next_node(), nodes[0x30])
+    nose.tools.assert_is_none(visitor.next_node())
+
+
+if __name__ == "__main__":
+    test_graph_worklist_fixedpoint()
+    test_graph_visitor_order()
@@ -77,8 +77,40 @@ def test_call_to():
     nose.tools.assert_in(0x400000, project.kb.functions.keys())
     nose.tools.assert_in(0x400420, project.kb.functions.keys())
 
+def test_graph_cache():
+    project = angr.Project(test_location + "/x86_64/fauxware", auto_load_libs=False)
+    project.analyses.CFGFast(normalize=True)
+    main = project.kb.functions['main']
+
+    # the graph and derived data are only built once per version of the function
+    nose.tools.assert_true(main.normalized)
+    nose.tools.assert_is(main.graph, main.graph)
+    builds = [ ]
+    def _count_nodes(f):
+        builds.append(f.graph_version)
+        return len(f.graph)
+    nose.tools.assert_equal(main.get_derived('n', _count_nodes), len(main.graph))
+    nose.tools.assert_equal(main.get_derived('n', _count_nodes), len(main.graph))
+    nose.tools.assert_equal(len(builds), 1)
+
+    # normalizing a normalized function does not touch it
+    version = main.graph_version
+    main.normalize()
+    nose.tools.assert_equal(main.graph_version, version)
+
+    # any change to the transition graph invalidates everything
+    graph = main.graph
+    src, dst = next(iter(graph.edges()))
+    main._transit_to(src, dst)
+    nose.tools.assert_not_equal(main.graph_version, version)
+    nose.tools.assert_false(main.normalized)
+    nose.tools.assert_is_not(main.graph, graph)
+    main.get_derived('n', _count_nodes)
+    nose.tools.assert_equal(len(builds), 2)
+
 if __name__ == "__main__":
     logging.getLogger('angr.analyses.cfg').setLevel(logging.DEBUG)
 
     test_call_to()
     test_amd64()
+    test_graph_cache()
@@ -19,6 +19,25 @@ def test_comparison_identification():
     for addr, symbol in true_symbols.items():
         nose.tools.assert_equal(true_symbols[addr], seen[addr])
 
+def test_parallel_identification():
+    true_symbols = {0x804a3d0: 'strncmp', 0x804a0f0: 'strcmp', 0x8048e60: 'memcmp', 0x8049f40: 'strcasecmp'}
+
+    p = angr.Project(os.path.join(bin_location, "tests", "i386", "identifiable"))
+    idfer = p.analyses.Identifier(require_predecessors=False)
+
+    # every function with a loop that touches memory keeps its candidates
+    for addr in true_symbols:
+        features = idfer.get_func_features(addr)
+        nose.tools.assert_true(features.has_loop)
+        nose.tools.assert_true(features.loop_ops['Iex_Load'] > 0)
+
+    seen = dict()
+    for addr, symbol in idfer.run(processes=2):
+        seen[addr] = symbol
+
+    for addr, symbol in true_symbols.items():
+        nose.tools.assert_equal(true_symbols[addr], seen[addr])
+
 def run_all():
     functions = globals()
     all_functions = dict(filter((lambda kv: kv[0].startswith('test_')), functions.items()))
@@ -14,11 +14,43 @@ def test_kb_plugins():
     nose.tools.assert_is_instance(p.kb.variables, angr.knowledge_plugins.VariableManager)
     nose.tools.assert_is_instance(p.kb.labels, angr.knowledge_plugins.Labels)
     nose.tools.assert_is_instance(p.kb.comments, angr.knowledge_plugins.Comments)
+    nose.tools.assert_is_instance(p.kb.dominators, angr.knowledge_plugins.DominatorIndex)
 
     nose.tools.assert_is_instance(p.kb.callgraph, networkx.Graph)
     nose.tools.assert_is_instance(p.kb.resolved_indirect_jumps, set)
     nose.tools.assert_is_instance(p.kb.unresolved_indirect_jumps, set)
 
 
+def test_dominators():
+    p = angr.Project(location + "/x86_64/fauxware", auto_load_libs=False)
+    p.analyses.CFGFast(normalize=True)
+    func = p.kb.functions['main']
+
+    doms = p.kb.dominators.dominators(func)
+    # cached until the graph of the function changes
+    nose.tools.assert_is(p.kb.dominators.dominators(func.addr), doms)
+
+    for node in func.graph.nodes():
+        nose.tools.assert_true(doms.dominates(func.startpoint, node))
+        idom = doms.immediate_dominator(node)
+        if idom is not None:
+            nose.tools.assert_true(doms.strictly_dominates(idom, node))
+            nose.tools.assert_false(doms.dominates(node, idom))
+
+    post_doms = p.kb.dominators.post_dominators(func)
+    for node in func.graph.nodes():
+        nose.tools.assert_true(post_doms.dominates(node, node))
+
+    loops = p.kb.dominators.loops(func)
+    for loop in loops.loops:
+        nose.tools.assert_true(all(doms.dominates(loop.header, n) for n in loop.body))
+
+    # LoopFinder reports the same loops
+    loop_finder = p.analyses.LoopFinder(functions=[ func ])
+    nose.tools.assert_equal(sorted(loop.entry.addr for loop in loop_finder.loops),
+                            sorted(loop.header.addr for loop in loops.loops))
+
+
 if __name__ == '__main__':
     test_kb_plugins()
+    test_dominators()
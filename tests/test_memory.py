@@ -6,8 +6,9 @@ import nose
 
 from angr.storage.paged_memory import SimPagedMemory
 from angr import SimState, SIM_PROCEDURES
+from angr.errors import SimMemoryError
 from angr import options as o
-from angr.state_plugins import SimSystemPosix
+from angr.state_plugins import SimSystemPosix, SimRegisterArray
 from angr.storage.file import SimFile
 
 
@@ -490,6 +491,45 @@ def test_registers():
     nose.tools.assert_false(s.solver.symbolic(expr))
     nose.tools.assert_equal(s.solver.eval(expr), 0x00000031)
 
+def test_register_array():
+    s = SimState(arch='AMD64', add_options={ o.ARRAY_REGISTERS })
+    nose.tools.assert_is_instance(s.registers, SimRegisterArray)
+    nose.tools.assert_true(s.solver.symbolic(s.registers.load('rax')))
+
+    s.regs.rax = 0x4142434445464748
+    nose.tools.assert_equal(s.solver.eval(s.regs.eax), 0x45464748)
+    nose.tools.assert_equal(s.solver.eval(s.regs.ah), 0x47)
+    nose.tools.assert_equal(s.registers.get_concrete(*s.arch.registers['rax']), 0x4142434445464748)
+
+    # only the overwritten byte becomes symbolic
+    s.regs.al = s.solver.BVS('x', 8)
+    nose.tools.assert_true(s.solver.symbolic(s.regs.rax))
+    nose.tools.assert_equal(s.solver.eval(s.regs.rax & 0xffffffffffffff00), 0x4142434445464700)
+    nose.tools.assert_is_none(s.registers.get_concrete(*s.arch.registers['rax']))
+
+    # copies do not see each other's stores
+    s.registers.put_concrete(s.arch.registers['rbx'][0], 8, 5)
+    s2 = s.copy()
+    s2.regs.rbx = 6
+    nose.tools.assert_equal(s.solver.eval(s.regs.rbx), 5)
+    nose.tools.assert_equal(s.registers.changed_ranges(s2.registers), [ (s.arch.registers['rbx'][0],
+                                                                           s.arch.registers['rbx'][0] + 1) ])
+
+    merged, _, _ = s.merge(s2)
+    nose.tools.assert_equal(sorted(merged.solver.eval_upto(merged.regs.rbx, 3)), [ 5, 6 ])
+    nose.tools.assert_equal(merged.solver.eval(merged.regs.rax & 0xffffffffffffff00), 0x4142434445464700)
+
+    # stores may not run past the end of the register file
+    end = s.registers._size
+    nose.tools.assert_raises(SimMemoryError, s.registers.store, end - 4, s.solver.BVV(0, 64))
+    nose.tools.assert_raises(SimMemoryError, s.registers.put_concrete, end - 4, 8, 0)
+    nose.tools.assert_equal(s.registers._size, len(s.registers._concrete))
+
+    s3 = s.copy()
+    s3.registers.unconstrain_differences(s2.registers)
+    nose.tools.assert_true(s3.solver.symbolic(s3.regs.rbx))
+    nose.tools.assert_equal(s3.solver.eval(s3.regs.rax & 0xffffffffffffff00), 0x4142434445464700)
+
 def test_fullpage_write():
     if os.environ.get("APPVEYOR", "false").lower() == "true":
         # Skip as AppVeyor boxes do not have enough memory to run this test
@@ -646,7 +686,49 @@ def test_crosspage_read():
     assert bytes.fromhex("77665544") in state.solver.eval(r, cast_to=bytes)
     #assert s.solver.eval(r, 2) == ( 0xffeeddccbbaa998877665544, )
 
+def test_changed_ranges():
+    s = SimState(arch='AMD64')
+    s.memory.store(0x1000, s.solver.BVV(b'A' * 0x3000))
+    s.memory.store(0x5000, s.solver.BVS('x', 64))
+    s2 = s.copy()
+
+    # only the bytes that actually differ are reported
+    s2.memory.store(0x1000, s.solver.BVV(b'A' * 0x10 + b'BB' + b'A' * 0x2fee))
+    s2.memory.store(0x2ffe, s.solver.BVV(b'CCCC'))
+    s2.memory.store(0x5004, s.solver.BVS('y', 32))
+    s2.memory.store(0x6000, s.solver.BVV(b'D'))
+
+    nose.tools.assert_equal(s.memory.changed_ranges(s2.memory),
+                            [ (0x1010, 0x1012), (0x2ffe, 0x3002), (0x5004, 0x5008), (0x6000, 0x6001) ])
+    nose.tools.assert_equal(len(s.memory.changed_bytes(s2.memory)), 0xb)
+    nose.tools.assert_equal(s.memory.changed_ranges(s.copy().memory), [ ])
+
+    s.memory.unconstrain_differences(s2.memory)
+    nose.tools.assert_true(s.memory.load(0x1010, 2).symbolic)
+    nose.tools.assert_false(s.memory.load(0x1000, 0x10).symbolic)
+    nose.tools.assert_false(s.memory.load(0x1012, 0x10).symbolic)
+
+def test_stored_ranges():
+    s = SimState(arch='AMD64')
+    nose.tools.assert_is_none(s.registers.mem.pop_stored_ranges())
+
+    s.registers.mem.track_stores()
+    s.regs.rax = 0x41
+    s.regs.rbx = s.solver.BVS('x', 64)
+    s.registers.store('ah', 0x42)
+    s2 = s.copy()
+    s2.regs.rcx = 0x43
+
+    # stores are recorded in each branch separately
+    rax, rcx, rbx = (s.arch.registers[r][0] for r in ('rax', 'rcx', 'rbx'))
+    nose.tools.assert_equal(s.registers.mem.pop_stored_ranges(), [ (rax, rax + 8), (rbx, rbx + 8) ])
+    nose.tools.assert_equal(s.registers.mem.pop_stored_ranges(), [ ])
+    # rax and rcx are adjacent
+    nose.tools.assert_equal(s2.registers.mem.pop_stored_ranges(), [ (rax, rcx + 8), (rbx, rbx + 8) ])
+
 if __name__ == '__main__':
+    test_changed_ranges()
+    test_stored_ranges()
     test_crosspage_read()
     test_fast_memory()
     test_load_bytes()
@@ -659,5 +741,6 @@ if __name__ == '__main__':
     test_abstract_memory()
     test_abstract_memory_find()
     test_registers()
+    test_register_array()
     test_concrete_memset()
     test_paged_memory_membacker_equal_size()
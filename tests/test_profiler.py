@@ -0,0 +1,40 @@
+import os
+
+import nose
+
+import angr
+from angr.misc import profiling
+
+location = str(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../binaries/tests'))
+
+
+def test_profiler():
+    p = angr.Project(os.path.join(location, 'x86_64', 'fauxware'), auto_load_libs=False)
+    simgr = p.factory.simulation_manager()
+    profiler = angr.exploration_techniques.Profiler()
+    simgr.use_technique(profiler)
+    simgr.run()
+
+    nose.tools.assert_equal(len(simgr.deadended), 3)
+    nose.tools.assert_false(profiling.enabled)
+
+    hot = profiler.hot_blocks(n=5)
+    nose.tools.assert_true(0 < len(hot) <= 5)
+    nose.tools.assert_true(all(a.time >= b.time for a, b in zip(hot, hot[1:])))
+
+    # the branch on the password comparison forks
+    nose.tools.assert_true(any(prof.successors > 1 for prof in profiler.profiles.values()))
+    # the calls to libc are simprocedures
+    nose.tools.assert_true(any(prof.procedure == 'puts' for prof in profiler.profiles.values()))
+    nose.tools.assert_true(sum(prof.memory_stores for prof in profiler.profiles.values()) > 0)
+
+    report = profiler.report(n=5)
+    nose.tools.assert_equal(len(report.splitlines()), len(hot) + 1)
+
+    stacks = profiler.folded_stacks()
+    nose.tools.assert_true(stacks)
+    nose.tools.assert_true(any(';puts ' in line for line in stacks))
+
+
+if __name__ == '__main__':
+    test_profiler()
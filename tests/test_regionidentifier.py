@@ -1,8 +1,12 @@
 
 import os
 
+import nose
+import networkx
+
 import angr
 import angr.analyses.decompiler
+from angr.codenode import BlockNode
 
 test_location = str(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'binaries', 'tests'))
 
@@ -17,5 +21,30 @@ def test_smoketest():
     _ = p.analyses.RegionIdentifier(main_func)
 
 
+def test_large_graph():
+
+    p = angr.Project(os.path.join(test_location, 'x86_64', 'all'), auto_load_libs=False)
+    main_func = p.kb.functions.function(addr=p.entry, create=True)
+
+    # a long sequence of loops with if-else statements inside
+    graph = networkx.DiGraph()
+    nodes = [ BlockNode(0x400000 + i * 0x10, 0x10) for i in range(4002) ]
+    graph.add_edge(nodes[0], nodes[1], type='transition')
+    for i in range(1, 4001, 4):
+        head, left, right, tail = nodes[i:i + 4]
+        graph.add_edge(head, left, type='transition')
+        graph.add_edge(head, right, type='transition')
+        graph.add_edge(left, tail, type='transition')
+        graph.add_edge(right, tail, type='transition')
+        graph.add_edge(tail, head, type='transition')
+        graph.add_edge(tail, nodes[i + 4], type='transition')
+
+    ri = p.analyses.RegionIdentifier(main_func, graph=graph)
+
+    nose.tools.assert_is_instance(ri.region, angr.analyses.decompiler.region_identifier.GraphRegion)
+    nose.tools.assert_equal(ri.region.head.addr, nodes[0].addr)
+
+
 if __name__ == "__main__":
     test_smoketest()
+    test_large_graph()
@@ -121,8 +121,40 @@ def test_explore_with_cfg():
     nose.tools.assert_equal(pg.found[1].addr, 0x4006ED)
     nose.tools.assert_equal(pg.avoid[0].addr, 0x4007C9)
 
+def test_merge_plan():
+    class _FakeState(object):
+        def __init__(self, history):
+            self.history = history
+
+    root = angr.state_plugins.SimStateHistory()
+    left, right = root.make_child(), root.make_child()
+    leaves = [ left.make_child(), left.make_child(), right.make_child(), right.make_child().make_child() ]
+
+    hierarchy = angr.StateHierarchy()
+    for h in [ root, left, right ] + leaves:
+        hierarchy.add_history(h)
+    hierarchy.add_history(leaves[3].parent)
+
+    states = [ _FakeState(h) for h in leaves ]
+    steps, leftovers = hierarchy.merge_plan(states)
+
+    # siblings are merged at their lowest common ancestors first, and the results are merged at the root
+    nose.tools.assert_equal(len(steps), 3)
+    plan = { h: sorted(slots) for h, slots in steps }
+    nose.tools.assert_equal(plan[left], [ 0, 1 ])
+    nose.tools.assert_equal(plan[right], [ 2, 3 ])
+    nose.tools.assert_equal(plan[root], [ 4, 5 ])
+    nose.tools.assert_equal(leftovers, [ 6 ])
+
+    # states without a common history are left alone
+    steps, leftovers = hierarchy.merge_plan([ states[0], _FakeState(angr.state_plugins.SimStateHistory()) ])
+    nose.tools.assert_equal(steps, [ ])
+    nose.tools.assert_equal(sorted(leftovers), [ 0, 1 ])
+
 if __name__ == "__main__":
     logging.getLogger('angr.sim_manager').setLevel('DEBUG')
+    print('merge_plan')
+    test_merge_plan()
     print('explore_with_cfg')
     test_explore_with_cfg()
     print('find_to_middle')
@@ -256,8 +256,93 @@ def test_global_condition():
         nose.tools.assert_equal(s.solver.eval_upto(s.regs.rbx, 10), [ 1 ])
         nose.tools.assert_sequence_equal(s.solver.eval_upto(s.regs.rax, 10), [ 25 ])
 
+def test_state_copy_on_write_plugins():
+    s = SimState(arch='AMD64')
+    s.globals['x'] = 1
+    nose.tools.assert_true(angr.state_plugins.SimStateGlobals.COPY_ON_WRITE)
+
+    before = dict(SimState.plugin_copy_stats['globals'])
+    c = s.copy()
+
+    # neither state owns the plugin right after the copy
+    nose.tools.assert_true(s.has_plugin('globals'))
+    nose.tools.assert_true(c.has_plugin('globals'))
+    nose.tools.assert_not_in('globals', s._active_plugins)
+    nose.tools.assert_not_in('globals', c._active_plugins)
+
+    # the first state touching it gets its own copy...
+    c.globals['x'] = 2
+    nose.tools.assert_equal(SimState.plugin_copy_stats['globals']['materialized'], before.get('materialized', 0) + 1)
+    # ...and the last one takes over the original
+    nose.tools.assert_equal(s.globals['x'], 1)
+    nose.tools.assert_equal(SimState.plugin_copy_stats['globals']['reclaimed'], before.get('reclaimed', 0) + 1)
+    nose.tools.assert_equal(c.globals['x'], 2)
+    nose.tools.assert_is_not(s.globals, c.globals)
+
+    # plugins that are not copy-on-write are still copied eagerly
+    c2 = c.copy()
+    nose.tools.assert_in('memory', c2._active_plugins)
+    nose.tools.assert_is_not(c2.memory, c.memory)
+
+
+def test_state_templates():
+    p = angr.Project(os.path.join(binaries_base, 'tests', 'x86_64', 'fauxware'), auto_load_libs=False)
+
+    s1 = p.factory.entry_state(args=['fauxware', 'a'], template=True)
+    nose.tools.assert_equal(p.factory.state_template_stats['cold'], 1)
+    s2 = p.factory.entry_state(args=['fauxware', 'a'], template=True, stdin=b'SOSNEAKY')
+    nose.tools.assert_equal(p.factory.state_template_stats['hit'], 1)
+    p.factory.entry_state(args=['fauxware', 'b'], template=True)
+    nose.tools.assert_equal(p.factory.state_template_stats['cold'], 2)
+
+    # copies of the same template start out identical, but do not affect each other
+    nose.tools.assert_true(s1.solver.is_true(s1.regs.sp == s2.regs.sp))
+    s1.memory.store(s1.regs.sp, s1.solver.BVV(0x41414141, 32))
+    nose.tools.assert_false(s2.solver.is_true(s2.memory.load(s2.regs.sp, 4) == 0x41414141))
+    s3 = p.factory.entry_state(args=['fauxware', 'a'], template=True)
+    nose.tools.assert_false(s3.solver.is_true(s3.memory.load(s3.regs.sp, 4) == 0x41414141))
+
+    # stdin is installed on the copy only
+    nose.tools.assert_equal(s2.posix.dumps(0), b'SOSNEAKY')
+    nose.tools.assert_is_not(s1.posix.stdin, s2.posix.stdin)
+
+    # call states set up their arguments on a copy of a blank state template
+    c1 = p.factory.call_state(0x400664, 1, 2, template=True)
+    c2 = p.factory.call_state(0x400664, 3, 4, template=True)
+    nose.tools.assert_equal(p.factory.state_template_stats['hit'], 2)
+    nose.tools.assert_equal(c1.solver.eval(c1.regs.rdi), 1)
+    nose.tools.assert_equal(c2.solver.eval(c2.regs.rdi), 3)
+
+    p.factory.clear_state_templates()
+    p.factory.entry_state(args=['fauxware', 'a'], template=True)
+    nose.tools.assert_equal(p.factory.state_template_stats['cold'], 4)
+
+def test_state_snapshot():
+    p = angr.Project(os.path.join(binaries_base, 'tests', 'x86_64', 'fauxware'), auto_load_libs=False)
+    main = p.loader.find_symbol('main').rebased_addr
+
+    snapshot = p.factory.snapshot(main)
+    nose.tools.assert_equal(snapshot.addr, main)
+
+    # forks start out at the checkpoint, and do not affect each other or the snapshot
+    s1 = snapshot.fork(registers={ 'rdi': 1 })
+    s2 = snapshot.fork(memory={ s1.regs.sp: s1.solver.BVV(0x41414141, 32) })
+    nose.tools.assert_equal(s1.addr, main)
+    nose.tools.assert_equal(s1.solver.eval(s1.regs.rdi), 1)
+    nose.tools.assert_false(s1.solver.is_true(s1.memory.load(s1.regs.sp, 4) == 0x41414141))
+    nose.tools.assert_true(s2.solver.is_true(s2.memory.load(s2.regs.sp, 4) == 0x41414141))
+    nose.tools.assert_false(snapshot.state.solver.is_true(snapshot.state.memory.load(s1.regs.sp, 4) == 0x41414141))
+
+    # each fork gets its own input
+    simgr = snapshot.simulation_manager([ { 'stdin': b'username\nSOSNEAKY\n' }, { 'stdin': b'username\npassword\n' } ])
+    simgr.run()
+    nose.tools.assert_equal(len(simgr.deadended), 2)
+    outputs = [ s.posix.dumps(1) for s in simgr.deadended ]
+    nose.tools.assert_equal(sorted(b'Welcome' in o for o in outputs), [ False, True ])
+
 
 if __name__ == '__main__':
+    test_state_snapshot()
     test_state()
     test_state_merge()
     test_state_merge_3way()
@@ -266,3 +351,5 @@ if __name__ == '__main__':
     test_state_merge_static()
     test_state_pickle()
     test_global_condition()
+    test_state_copy_on_write_plugins()
+    test_state_templates()
@@ -141,6 +141,86 @@ def test_unsat_core():
     nose.tools.assert_equal(len(unsat_core), 2)
 
 
+def test_concretization_cache():
+    s = angr.SimState(arch='AMD64')
+    x = s.solver.BVS('x', s.arch.bits)
+    s.add_constraints(x == 0x1000)
+
+    strategy = angr.concretization_strategies.SimConcretizationStrategyRange(128)
+    nose.tools.assert_equal(strategy.concretize(s.memory, x + 8), [ 0x1008 ])
+    nose.tools.assert_equal(
+        sorted(k[0] for k in s.scratch.concretization_cache if k != 'version'),
+        [ 'eval', 'max', 'min' ]
+    )
+    nose.tools.assert_equal(strategy.concretize(s.memory, x + 8), [ 0x1008 ])
+
+    # the range of an address whose solutions are all known is found without solving for its minimum and maximum
+    z = s.solver.BVS('z', s.arch.bits)
+    s.add_constraints(z >= 0x3000, z < 0x3002)
+    angr.concretization_strategies.SimConcretizationStrategySolutions(4).concretize(s.memory, z)
+    nose.tools.assert_equal(sorted(strategy.concretize(s.memory, z)), [ 0x3000, 0x3001 ])
+    nose.tools.assert_equal(sorted(k[0] for k in s.scratch.concretization_cache if k != 'version'), [ 'eval', 'eval' ])
+
+    # new constraints invalidate the cache
+    y = s.solver.BVS('y', s.arch.bits)
+    s.add_constraints(y >= 0x2000, y < 0x2004)
+    nose.tools.assert_equal(sorted(strategy.concretize(s.memory, y)), [ 0x2000, 0x2001, 0x2002, 0x2003 ])
+    nose.tools.assert_true(all(v[0] is y for k, v in s.scratch.concretization_cache.items() if k != 'version'))
+
+
+def test_incremental_solver():
+    s = angr.SimState(arch='AMD64', add_options={angr.options.INCREMENTAL_SOLVER})
+    x = s.solver.BVS('x', 32)
+    s.add_constraints(x > 10)
+    s.add_constraints(x < 20)
+    nose.tools.assert_true(s.satisfiable())
+
+    # siblings share the context of their parent
+    left, right = s.copy(), s.copy()
+    left.add_constraints(x == 15)
+    right.add_constraints(x == 25)
+    ctx = s.solver.incremental_context
+    nose.tools.assert_is(left.solver.incremental_context, ctx)
+    nose.tools.assert_is(right.solver.incremental_context, ctx)
+
+    nose.tools.assert_true(left.satisfiable())
+    nose.tools.assert_false(right.satisfiable())
+    nose.tools.assert_true(left.satisfiable(extra_constraints=(x != 16,)))
+    nose.tools.assert_false(left.satisfiable(extra_constraints=(x != 15,)))
+    nose.tools.assert_true(s.satisfiable())
+    # the parent constraints were not asserted again for each sibling
+    nose.tools.assert_greater(ctx.reused, 0)
+
+
+def test_constraint_independence_slicing():
+    s = angr.SimState(arch='AMD64', add_options={angr.options.CONSTRAINT_INDEPENDENCE_SLICING})
+    x = s.solver.BVS('x', 32)
+    y = s.solver.BVS('y', 32)
+    z = s.solver.BVS('z', 32)
+    s.add_constraints(x > 10, x < 20)
+    s.add_constraints(y == x + 1)
+    s.add_constraints(z > 100)
+
+    index = s.solver.independence_index
+    nose.tools.assert_equal(len(index.constraints_for(z.variables)), 1)
+    nose.tools.assert_equal(len(index.constraints_for(y.variables)), 3)
+
+    nose.tools.assert_equal(s.solver.min(y), 12)
+    nose.tools.assert_equal(s.solver.max(y), 20)
+    nose.tools.assert_equal(s.solver.min(z), 101)
+    nose.tools.assert_equal(sorted(s.solver.eval_upto(x, 20)), list(range(11, 20)))
+
+    # copies keep following their own constraints
+    c = s.copy()
+    c.add_constraints(z == x)
+    nose.tools.assert_equal(len(c.solver.independence_index.constraints_for(z.variables)), 5)
+    nose.tools.assert_equal(len(s.solver.independence_index.constraints_for(z.variables)), 1)
+    nose.tools.assert_false(c.solver.satisfiable())
+
+
 if __name__ == '__main__':
+    test_concretization_cache()
+    test_constraint_independence_slicing()
+    test_incremental_solver()
     test_unsat_core()
     test_concretization_strategies()
@@ -170,6 +170,66 @@ def test_fauxware():
     nose.tools.assert_true('traced' in simgr.stashes)
 
 
+def _compare_tracer(trace, slide=0, known=True):
+    p = angr.Project(os.path.join(bin_location, "tests/x86_64/fauxware"), auto_load_libs=False)
+    t = angr.exploration_techniques.Tracer(trace)
+    t.project = p
+    t._current_slide = slide
+    if known:
+        t._aslr_slides[p.loader.main_object] = slide
+    return p, t
+
+def _scalar_divergence(trace, state_addrs, slide=0, known=True):
+    _, t = _compare_tracer(trace, slide=slide, known=known)
+    for i, addr in enumerate(state_addrs):
+        if i >= len(trace) or not t._compare_addr(trace[i], addr):
+            return i
+    return None
+
+def run_compare_addr_run(use_numpy):
+    tracer_module = angr.exploration_techniques.tracer
+    numpy = tracer_module.numpy
+    if not use_numpy:
+        tracer_module.numpy = None
+
+    try:
+        p, _ = _compare_tracer([])
+        entry = p.loader.main_object.entry
+        extern = p.loader.extern_object.min_addr
+        blocks = [ entry, entry + 0x10, entry + 0x20, entry + 0x30 ]
+
+        def check(trace, state_addrs, expected, known=True):
+            p, t = _compare_tracer(trace, known=known)
+            nose.tools.assert_equal(t._compare_addr_run(0, state_addrs), expected)
+            nose.tools.assert_equal(_scalar_divergence(trace, state_addrs, known=known), expected)
+            return p, t
+
+        # entering a new object at the current slide
+        p, t = check(blocks, blocks, None, known=False)
+        nose.tools.assert_equal(t._aslr_slides[p.loader.main_object], 0)
+
+        # entering a new object at a new slide
+        p, t = check([ addr + 0x10000 for addr in blocks ], blocks, None, known=False)
+        nose.tools.assert_equal(t._aslr_slides[p.loader.main_object], 0x10000)
+
+        # a block that diverges
+        check(blocks[:2] + [ blocks[2] + 4 ] + blocks[3:], blocks, 2)
+
+        # extern blocks match at the current slide
+        run = blocks[:2] + [ extern ] + blocks[2:]
+        check(run, run, None)
+        check(run[:2] + [ extern + 8 ] + run[3:], run, 2)
+
+        # the trace ends before the run does
+        check(blocks[:3], blocks, 3)
+    finally:
+        tracer_module.numpy = numpy
+
+def test_compare_addr_run():
+    yield run_compare_addr_run, True
+    yield run_compare_addr_run, False
+
+
 def run_all():
     def print_test_name(name):
         print('#' * (len(name) + 8))
@@ -181,7 +241,10 @@ def run_all():
     for f in sorted(all_functions.keys()):
         if hasattr(all_functions[f], '__call__'):
             print_test_name(f)
-            all_functions[f]()
+            result = all_functions[f]()
+            if result is not None:
+                for test_func, arg in result:
+                    test_func(arg)
 
 
 if __name__ == "__main__":
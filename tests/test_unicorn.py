@@ -2,6 +2,8 @@ import nose
 import angr
 import pickle
 import re
+import shutil
+import tempfile
 from angr import options as so
 from nose.plugins.attrib import attr
 
@@ -114,6 +116,100 @@ def test_fauxware():
         b'Username: \nPassword: \nWelcome to the admin console, trusted user!\n'
     )))
 
+def test_shared_cache():
+    p = angr.Project(os.path.join(test_location, 'binaries/tests/i386/fauxware'))
+    page_dir = tempfile.mkdtemp()
+    angr.state_plugins.unicorn_engine.share_page_cache(page_dir)
+    try:
+        outputs = [ ]
+        cache_keys = set()
+        for _ in range(2):
+            s_unicorn = p.factory.entry_state(add_options=so.unicorn | { so.UNICORN_SHARED_CACHE })
+            pg = p.factory.simulation_manager(s_unicorn)
+            pg.explore()
+            outputs.append(sorted(pg.mp_deadended.posix.dumps(1).mp_items))
+            cache_keys.update(s.unicorn.cache_key for s in pg.deadended)
+    finally:
+        angr.state_plugins.unicorn_engine.share_page_cache(None)
+
+    # all states of the binary share the same caches, and the read-only pages ended up in the page store
+    nose.tools.assert_equal(outputs[0], outputs[1])
+    nose.tools.assert_equal(len(cache_keys), 1)
+    nose.tools.assert_not_equal(os.listdir(page_dir), [ ])
+    shutil.rmtree(page_dir)
+
+def test_adaptive_handoff():
+    p = angr.Project(os.path.join(test_location, 'binaries/tests/i386/fauxware'))
+    s_unicorn = p.factory.entry_state(add_options=so.unicorn | { so.UNICORN_ADAPTIVE_HANDOFF })
+    pg = p.factory.simulation_manager(s_unicorn)
+    pg.explore()
+
+    nose.tools.assert_equal(sorted(pg.mp_deadended.posix.dumps(1).mp_items), sorted((
+        b'Username: \nPassword: \nWelcome to the admin console, trusted user!\n',
+        b'Username: \nPassword: \nGo away!',
+        b'Username: \nPassword: \nWelcome to the admin console, trusted user!\n'
+    )))
+
+    # all states learned from the same handoffs
+    handoff = s_unicorn.unicorn.handoff
+    nose.tools.assert_true(all(s.unicorn.handoff is handoff for s in pg.deadended))
+    nose.tools.assert_not_equal(handoff.entries, { })
+    nose.tools.assert_true(all(stats.entries > 0 for stats in handoff.entries.values()))
+
+def test_handoff_policy():
+    policy = angr.state_plugins.unicorn_engine.UnicornHandoffPolicy(block_cost=0.001, min_samples=2, max_backoff=4)
+
+    # handoffs that run many blocks pay off
+    for _ in range(4):
+        nose.tools.assert_true(policy.should_enter(0x1000))
+        policy.record(0x1000, 100, 0.01, 0.001)
+
+    # handoffs that stop right away do not, and are only retried after longer and longer intervals
+    for _ in range(2):
+        nose.tools.assert_true(policy.should_enter(0x2000))
+        policy.record(0x2000, 1, 0.01, 0.)
+    decisions = [ ]
+    for _ in range(12):
+        enter = policy.should_enter(0x2000)
+        decisions.append(enter)
+        if enter:
+            policy.record(0x2000, 1, 0.01, 0.)
+    nose.tools.assert_equal(decisions, [ True, False, True, False, False, True, False, False, False, False, True,
+                                         False ])
+    nose.tools.assert_equal([ addr for addr, _ in policy.unprofitable() ], [ 0x2000 ])
+
+    # once it pays off again, the address is no longer refused
+    policy.record(0x2000, 1000, 0.01, 0.)
+    nose.tools.assert_true(all(policy.should_enter(0x2000) for _ in range(4)))
+
+def test_symbolic_register_rescan():
+    p = angr.Project(os.path.join(test_location, 'binaries/tests/i386/fauxware'))
+    s = p.factory.entry_state(add_options=so.unicorn)
+    succ = s.step()
+    nose.tools.assert_equal(succ.sort, 'Unicorn')
+    s2 = succ.successors[0]
+    nose.tools.assert_is_not_none(s2.unicorn._symbolic_regs)
+
+    # only the registers stored to after unicorn has synced its registers back are looked at on the next handoff
+    s2.regs.edi = s2.solver.BVS('x', 32)
+    edi, eip = (s2.arch.registers[r][0] for r in ('edi', 'eip'))
+    regs_class = type(s2.registers.mem)
+    load_objects = regs_class.load_objects
+    scanned = [ ]
+    def _load_objects(self, addr, num_bytes, **kwargs):
+        scanned.append((addr, addr + num_bytes))
+        return load_objects(self, addr, num_bytes, **kwargs)
+    regs_class.load_objects = _load_objects
+    try:
+        sym_regs = list(s2.unicorn._symbolic_register_array())
+    finally:
+        regs_class.load_objects = load_objects
+
+    nose.tools.assert_in((edi, edi + 4), scanned)
+    nose.tools.assert_true(all(r in ((edi, edi + 4), (eip, eip + 4)) for r in scanned))
+    nose.tools.assert_true(all(edi + i in sym_regs for i in range(4)))
+    nose.tools.assert_true(s2.unicorn._has_symbolic_uc_registers())
+
 def test_fauxware_aggressive():
     p = angr.Project(os.path.join(test_location, 'binaries/tests/i386/fauxware'))
     s_unicorn = p.factory.entry_state(
@@ -268,6 +364,21 @@ def test_inspect():
         pg_break_every.run()
     nose.tools.assert_equal(collect_trace(so.unicorn), collect_trace(set()))
 
+    # register breakpoints see the registers synced in and out of unicorn with either register plugin
+    def collect_reg_accesses(options):
+        s_break_reg = main_state(1, add_options=options)
+        accesses = { 'reg_read': 0, 'reg_write': 0 }
+        def create_reg_action(kind):
+            def action(_state):
+                accesses[kind] += 1
+            return action
+        for kind in accesses:
+            s_break_reg.inspect.b(kind, action=create_reg_action(kind))
+        succ = s_break_reg.step()
+        nose.tools.assert_equal(succ.sort, 'Unicorn')
+        return accesses
+    nose.tools.assert_equal(collect_reg_accesses(so.unicorn), collect_reg_accesses(so.unicorn | { so.ARRAY_REGISTERS }))
+
 def test_explore():
     p = angr.Project(os.path.join(test_location, 'binaries/tests/i386/uc_stop'))
 